@@ -0,0 +1,1004 @@
+#!/usr/bin/env python3
+"""
+Performance benchmarks for the budgeting app.
+
+Every benchmark runs against a throwaway in-memory SQLite database, so the
+real website/database.db is never touched.
+
+Usage:
+    python benchmark.py             # run every benchmark
+    python benchmark.py snapshot    # run only the named benchmark(s)
+"""
+
+import sys
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, insert
+
+from website import create_app, db
+from website.models import User, Plan, BudgetCategory, MonthlyBudget, Transaction, Payee
+from website.utils.counters import reconcile_spend
+from website.utils.ledger import recompute_rollovers_from, ledger_start
+from website.utils.rollups import rebuild_rollups
+
+
+def make_app():
+    return create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'TESTING': True})
+
+
+class QueryCounter:
+    """Count the SQL statements executed on the app's engine inside a with-block."""
+
+    def __enter__(self):
+        self.count = 0
+        self.writes = 0
+        event.listen(db.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, *args):
+        self.count += 1
+        if statement.lstrip().split(None, 1)[0].upper() in ('INSERT', 'UPDATE', 'DELETE'):
+            self.writes += 1
+
+
+def seed_plan(n_categories, tx_per_category=5):
+    """Create a user with one plan holding n_categories subcategories, each with some spending this month."""
+    main_categories = ['needs', 'wants', 'investments']
+    names = {'needs': [], 'wants': [], 'savings': []}
+    categories = []
+    for i in range(n_categories):
+        main_cat = main_categories[i % 3]
+        name = f"Category {i}"
+        names['savings' if main_cat == 'investments' else main_cat].append(name)
+        categories.append(BudgetCategory(name=name, main_category=main_cat))
+
+    user = User(email=f"bench{n_categories}@example.com", first_name='Bench', profile_complete=True,
+                date_created=datetime(2020, 1, 1))
+    plan = Plan(name='Benchmark', monthly_income=100000,
+                budget_pref={'ratios': {'needs': 50, 'wants': 30, 'savings': 20}, 'subcategories': names},
+                user=user)
+    db.session.add_all([user, plan])
+    db.session.flush()
+    user.active_plan_id = plan.id
+
+    now = datetime.now()
+    for category in categories:
+        category.plan_id = plan.id
+        db.session.add(category)
+    db.session.flush()
+    for category in categories:
+        for day in range(1, tx_per_category + 1):
+            db.session.add(Transaction(description='Bench', amount=-10.0, category_id=category.id,
+                                       plan_id=plan.id, transaction_date=datetime(now.year, now.month, day)))
+    db.session.flush()
+    reconcile_spend(plan_id=plan.id, repair=True)  # fill the spend counters for the seeded rows
+    rebuild_rollups(plan_id=plan.id)  # and the monthly rollups
+    recompute_rollovers_from(plan, *ledger_start(plan))
+    db.session.commit()
+    return user, plan
+
+
+def login(client, user):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+
+
+def bench_snapshot():
+    """Queries needed to load one month's figures, per-category loop vs. grouped snapshot."""
+    from website.utils.snapshot import load_month_snapshot
+
+    print(f"{'categories':>10} {'per-category':>13} {'snapshot':>9} {'GET /':>6} {'writes':>7}")
+    for n in (5, 20, 40, 80):
+        app = make_app()
+        with app.app_context():
+            user, plan = seed_plan(n)
+            now = datetime.now()
+            category_ids = [c.id for c in BudgetCategory.query.filter_by(plan_id=plan.id).all()]
+
+            # The per-category pattern home() used before the snapshot service
+            with QueryCounter() as per_category:
+                for category_id in category_ids:
+                    MonthlyBudget.query.filter_by(plan_id=plan.id, category_id=category_id,
+                                                  month=now.month, year=now.year).first()
+                    db.session.query(func.sum(Transaction.amount)).filter(
+                        Transaction.category_id == category_id,
+                        func.extract('month', Transaction.transaction_date) == now.month,
+                        func.extract('year', Transaction.transaction_date) == now.year
+                    ).scalar()
+
+            with QueryCounter() as snapshot:
+                load_month_snapshot(plan.id, now.year, now.month)
+
+            client = app.test_client()
+            login(client, user)
+            with QueryCounter() as page:
+                response = client.get('/')
+            assert response.status_code == 200, response.status_code
+
+        print(f"{n:>10} {per_category.count:>13} {snapshot.count:>9} {page.count:>6} {page.writes:>7}")
+
+
+def bench_budget_limit(n_transactions=100_000, repeats=50):
+    """validate_budget_limit() on one category with many transactions, func.extract vs. month window."""
+    from website.views import validate_budget_limit
+    from website.utils.query_plans import explain
+    from website.utils.dates import in_month
+
+    app = make_app()
+    with app.app_context():
+        user, plan = seed_plan(1, tx_per_category=0)
+        category = BudgetCategory.query.filter_by(plan_id=plan.id).first()
+
+        # Spread the rows over ~8 years so one month holds about 1% of them
+        first_day = datetime(2020, 1, 1)
+        rows = [{'description': 'Bench', 'amount': -1.0, 'category_id': category.id, 'plan_id': plan.id,
+                 'transaction_date': first_day + timedelta(hours=i * 0.7)}
+                for i in range(n_transactions)]
+        db.session.execute(insert(Transaction), rows)
+        db.session.commit()
+        when = rows[-1]['transaction_date']
+
+        # The predicate validate_budget_limit() used before the month-window helper
+        extract_query = db.session.query(func.sum(func.abs(Transaction.amount))).filter(
+            Transaction.category_id == category.id,
+            func.extract('month', Transaction.transaction_date) == when.month,
+            func.extract('year', Transaction.transaction_date) == when.year
+        )
+        window_query = db.session.query(func.sum(func.abs(Transaction.amount))).filter(
+            Transaction.category_id == category.id,
+            in_month(Transaction.transaction_date, when.year, when.month)
+        )
+
+        started = time.perf_counter()
+        for _ in range(repeats):
+            extract_spent = extract_query.scalar()
+        extract_ms = (time.perf_counter() - started) * 1000 / repeats
+
+        started = time.perf_counter()
+        for _ in range(repeats):
+            _, _, data = validate_budget_limit(category, 1.0, when)
+        window_ms = (time.perf_counter() - started) * 1000 / repeats
+        assert abs(data['current_spent'] - extract_spent) < 0.005, (data['current_spent'], extract_spent)
+
+        print(f"{n_transactions} transactions, {extract_spent:.0f} in {when:%Y-%m}, mean of {repeats} calls")
+        print(f"  func.extract   {extract_ms:8.2f} ms   {'; '.join(explain(extract_query))}")
+        print(f"  month window   {window_ms:8.2f} ms   {'; '.join(explain(window_query))}")
+
+
+def bench_request_cache(n_categories=40):
+    """Queries per request and request-cache hits/misses (X-Request-Cache header) on the busiest endpoints."""
+    app = make_app()
+    with app.app_context():
+        user, plan = seed_plan(n_categories)
+        category = BudgetCategory.query.filter_by(plan_id=plan.id).first()
+        now = datetime.now()
+        client = app.test_client()
+        login(client, user)
+
+        requests = [
+            ('GET /', lambda: client.get('/')),
+            ('POST /api/update-category-amount', lambda: client.post('/api/update-category-amount', json={
+                'category_id': category.id, 'amount': 500, 'month': now.month, 'year': now.year})),
+            ('POST /api/add-transaction', lambda: client.post('/api/add-transaction', json={
+                'category_id': category.id, 'amount': 1, 'description': 'Bench'})),
+            ('GET /api/categories', lambda: client.get('/api/categories')),
+            ('GET /transactions', lambda: client.get('/transactions')),
+        ]
+        print(f"{n_categories} categories")
+        print(f"{'request':<34} {'queries':>8}  cache")
+        for name, send in requests:
+            with QueryCounter() as counter:
+                response = send()
+            assert response.status_code == 200, (name, response.status_code)
+            print(f"{name:<34} {counter.count:>8}  {response.headers.get('X-Request-Cache', '-')}")
+
+
+def bench_visibility(repeats=20):
+    """Filtering a plan's categories by budget_pref: list membership per request vs. the cached visibility index."""
+    from website.utils.snapshot import filter_visible_categories
+
+    def list_membership(plan, categories):
+        # The check home() ran for every category before the visibility index
+        subcategories = plan.budget_pref['subcategories']
+        return [cat for cat in categories
+                if cat.name in subcategories.get('savings' if cat.main_category == 'investments' else cat.main_category, [])]
+
+    print(f"{'categories':>10} {'list (ms)':>10} {'index (ms)':>11}")
+    for n in (50, 500, 2000):
+        app = make_app()
+        with app.app_context():
+            user, plan = seed_plan(n, tx_per_category=0)
+            categories = BudgetCategory.query.filter_by(plan_id=plan.id).all()
+
+            started = time.perf_counter()
+            for _ in range(repeats):
+                expected = list_membership(plan, categories)
+            list_ms = (time.perf_counter() - started) * 1000 / repeats
+
+            started = time.perf_counter()
+            for _ in range(repeats):
+                visible = filter_visible_categories(plan, categories)
+            index_ms = (time.perf_counter() - started) * 1000 / repeats
+            assert visible == expected
+
+        print(f"{n:>10} {list_ms:>10.3f} {index_ms:>11.3f}")
+
+
+def bench_fragments(n_categories=40, repeats=20):
+    """Page render time and queries with the fragment cache cold (just after a write) vs. warm."""
+    app = make_app()
+    with app.app_context():
+        user, plan = seed_plan(n_categories, tx_per_category=10)
+        client = app.test_client()
+        login(client, user)
+        cache = app.extensions['fragment_cache']
+
+        print(f"{n_categories} categories, {n_categories * 10} transactions this month, mean of {repeats} requests")
+        print(f"{'page':<14} {'cold (ms)':>10} {'queries':>8} {'warm (ms)':>10} {'queries':>8}")
+        for path in ('/', '/transactions', '/reflect'):
+            cold_ms = warm_ms = 0.0
+            for _ in range(repeats):
+                cache.clear()
+                db.session.expire_all()  # start every request from a fresh session, as in production
+                with QueryCounter() as cold:
+                    started = time.perf_counter()
+                    client.get(path)
+                    cold_ms += (time.perf_counter() - started) * 1000
+                db.session.expire_all()
+                with QueryCounter() as warm:
+                    started = time.perf_counter()
+                    response = client.get(path)
+                    warm_ms += (time.perf_counter() - started) * 1000
+                assert response.status_code == 200, (path, response.status_code)
+            print(f"{path:<14} {cold_ms / repeats:>10.2f} {cold.count:>8} {warm_ms / repeats:>10.2f} {warm.count:>8}")
+        print(f"cache: {cache.stats()}")
+
+
+def bench_conditional(n_categories=40, repeats=20):
+    """Full response vs. 304 Not Modified when the client revalidates with its ETag."""
+    app = make_app()
+    with app.app_context():
+        user, plan = seed_plan(n_categories, tx_per_category=10)
+        client = app.test_client()
+        login(client, user)
+
+        print(f"{n_categories} categories, {n_categories * 10} transactions this month, mean of {repeats} requests")
+        print(f"{'path':<18} {'200 (ms)':>9} {'queries':>8} {'304 (ms)':>9} {'queries':>8}")
+        for path in ('/', '/transactions', '/reflect', '/api/transactions', '/api/categories', '/api/payees'):
+            full_ms = revalidate_ms = 0.0
+            for _ in range(repeats):
+                app.extensions['fragment_cache'].clear()
+                db.session.expire_all()
+                with QueryCounter() as full:
+                    started = time.perf_counter()
+                    response = client.get(path)
+                    full_ms += (time.perf_counter() - started) * 1000
+                assert response.status_code == 200 and response.headers.get('ETag'), path
+                db.session.expire_all()
+                with QueryCounter() as revalidate:
+                    started = time.perf_counter()
+                    response = client.get(path, headers={'If-None-Match': response.headers['ETag']})
+                    revalidate_ms += (time.perf_counter() - started) * 1000
+                assert response.status_code == 304, (path, response.status_code)
+            print(f"{path:<18} {full_ms / repeats:>9.2f} {full.count:>8} "
+                  f"{revalidate_ms / repeats:>9.2f} {revalidate.count:>8}")
+
+
+def bench_transactions_api(n_transactions=100_000, repeats=20):
+    """GET /api/transactions: the old unpaged list vs. keyset pages near the start and deep in the history."""
+    from website.utils.query_plans import explain
+    from website.utils.pagination import after_cursor, encode_cursor
+
+    app = make_app()
+    with app.app_context():
+        user, plan = seed_plan(1, tx_per_category=0)
+        category = BudgetCategory.query.filter_by(plan_id=plan.id).first()
+        first_day = datetime(2020, 1, 1)
+        db.session.execute(insert(Transaction), [
+            {'description': 'Bench', 'amount': -1.0, 'category_id': category.id, 'plan_id': plan.id,
+             'transaction_date': first_day + timedelta(hours=i * 0.7)}
+            for i in range(n_transactions)
+        ])
+        db.session.commit()
+        client = app.test_client()
+        login(client, user)
+
+        def timed_get(url, repeats):
+            started = time.perf_counter()
+            for _ in range(repeats):
+                response = client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+            return (time.perf_counter() - started) * 1000 / repeats, response
+
+        # What the endpoint did before: every row of the plan, serialized in one response
+        started = time.perf_counter()
+        rows = db.session.query(Transaction.id, Transaction.description, Transaction.amount,
+                                Transaction.created_date, BudgetCategory.name) \
+            .join(BudgetCategory, Transaction.category_id == BudgetCategory.id) \
+            .filter(Transaction.plan_id == plan.id).order_by(Transaction.created_date.desc()).all()
+        unpaged_bytes = len(app.json.dumps([{'id': r[0], 'description': r[1], 'amount': r[2],
+                                             'created_at': r[3].isoformat(), 'category_name': r[4]}
+                                            for r in rows]))
+        unpaged_ms = (time.perf_counter() - started) * 1000
+
+        first_ms, response = timed_get('/api/transactions?limit=50', repeats)
+        first_bytes = len(response.data)
+
+        # A cursor ~90% of the way through the history
+        deep = db.session.query(Transaction.transaction_date, Transaction.id) \
+            .filter(Transaction.plan_id == plan.id) \
+            .order_by(Transaction.transaction_date.desc(), Transaction.id.desc()) \
+            .offset(int(n_transactions * 0.9)).first()
+        deep_ms, _ = timed_get(f'/api/transactions?limit=50&cursor={encode_cursor(*deep)}', repeats)
+
+        filtered_ms, _ = timed_get('/api/transactions?limit=50&start=2021-03-01&end=2021-03-31&min_amount=0.5', repeats)
+
+        offset_query = db.session.query(Transaction.id).filter(Transaction.plan_id == plan.id) \
+            .order_by(Transaction.transaction_date.desc(), Transaction.id.desc()) \
+            .offset(int(n_transactions * 0.9)).limit(50)
+        started = time.perf_counter()
+        for _ in range(repeats):
+            offset_query.all()
+        offset_ms = (time.perf_counter() - started) * 1000 / repeats
+        keyset_query = db.session.query(Transaction.id).filter(
+            Transaction.plan_id == plan.id, after_cursor(Transaction.transaction_date, Transaction.id, deep)
+        ).order_by(Transaction.transaction_date.desc(), Transaction.id.desc()).limit(50)
+
+        print(f"{n_transactions} transactions, pages of 50 (mean of {repeats} requests)")
+        print(f"  unpaged list (before)     {unpaged_ms:8.2f} ms  {unpaged_bytes / 1024:8.0f} KiB")
+        print(f"  first page                {first_ms:8.2f} ms  {first_bytes / 1024:8.1f} KiB")
+        print(f"  page at 90% (cursor)      {deep_ms:8.2f} ms")
+        print(f"  one month, amount filter  {filtered_ms:8.2f} ms")
+        print(f"  same page via OFFSET      {offset_ms:8.2f} ms  (query only)")
+        print(f"  keyset plan: {'; '.join(explain(keyset_query))}")
+
+
+def bench_export(sizes=(10_000, 100_000)):
+    """Streaming CSV/NDJSON export: time, output size and peak Python memory as the history grows."""
+    import gzip
+    import tracemalloc
+
+    print(f"{'rows':>8} {'format':<12} {'ms':>8} {'output KiB':>11} {'peak KiB':>9}")
+    for n_transactions in sizes:
+        app = make_app()
+        with app.app_context():
+            user, plan = seed_plan(1, tx_per_category=0)
+            category = BudgetCategory.query.filter_by(plan_id=plan.id).first()
+            first_day = datetime(2020, 1, 1)
+            db.session.execute(insert(Transaction), [
+                {'description': f'Bench {i}', 'amount': -1.0, 'category_id': category.id, 'plan_id': plan.id,
+                 'transaction_date': first_day + timedelta(hours=i * 0.7)}
+                for i in range(n_transactions)
+            ])
+            db.session.commit()
+            client = app.test_client()
+            login(client, user)
+
+            for label, url, headers in (('csv', '/api/transactions/export', {}),
+                                        ('ndjson', '/api/transactions/export?format=ndjson', {}),
+                                        ('csv+gzip', '/api/transactions/export', {'Accept-Encoding': 'gzip'})):
+                def consume():
+                    db.session.expire_all()
+                    response = client.get(url, headers=headers, buffered=False)
+                    assert response.status_code == 200, (url, response.status_code)
+                    size = sum(len(chunk) for chunk in response.response)
+                    response.close()
+                    return size
+
+                started = time.perf_counter()
+                size = consume()
+                elapsed = (time.perf_counter() - started) * 1000
+                # Memory is measured on a second run, tracemalloc slows everything down
+                tracemalloc.start()
+                consume()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(f"{n_transactions:>8} {label:<12} {elapsed:>8.0f} {size / 1024:>11.0f} {peak / 1024:>9.0f}")
+
+            # Sanity check: the gzip stream decompresses to the plain CSV
+            plain = client.get('/api/transactions/export').data
+            packed = client.get('/api/transactions/export', headers={'Accept-Encoding': 'gzip'}).data
+            assert gzip.decompress(packed) == plain
+            assert plain.count(b'\n') == n_transactions + 1
+
+
+def bench_import(n_rows=100_000, batch_sizes=(1000, 5000, 20000)):
+    """Statement import of a generated CSV at several batch sizes, vs. /api/add-transaction one row at a time."""
+    import io
+    from website.utils.importer import import_statement, open_statement
+    from website.utils.counters import reconcile_spend
+
+    lines = ['Date,Description,Payee,Amount']
+    first_day = datetime(2020, 1, 1)
+    for i in range(n_rows):
+        when = first_day + timedelta(hours=i * 0.7)
+        lines.append(f"{when:%Y-%m-%d},Purchase {i},Shop {i % 500},-{1 + i % 97}.{i % 100:02d}")
+    data = ('\n'.join(lines) + '\n').encode('utf-8')
+
+    print(f"{n_rows} rows, {len(data) / 1024:.0f} KiB of CSV")
+    for batch_size in batch_sizes:
+        app = make_app()
+        with app.app_context():
+            user, plan = seed_plan(3, tx_per_category=0)
+            category = BudgetCategory.query.filter_by(plan_id=plan.id).first()
+            with QueryCounter() as queries:
+                started = time.perf_counter()
+                file_format, rows = open_statement(io.BytesIO(data), 'statement.csv')
+                totals = import_statement(plan, rows, file_format, category.id, batch_size=batch_size)
+                elapsed = time.perf_counter() - started
+            assert totals['imported'] == n_rows, totals
+            assert not reconcile_spend(plan_id=plan.id)
+            print(f"  batch {batch_size:>6}: {elapsed:6.2f} s  {n_rows / elapsed:>8.0f} rows/s  "
+                  f"{queries.count} statements, {totals['batches']} commits")
+
+    # The only way in before: one JSON request per transaction
+    app = make_app()
+    with app.app_context():
+        user, plan = seed_plan(3, tx_per_category=0)
+        category = BudgetCategory.query.filter_by(plan_id=plan.id).first()
+        # Room in this month's budget so no request is rejected
+        now = datetime.now()
+        db.session.add(MonthlyBudget(plan_id=plan.id, category_id=category.id, year=now.year, month=now.month,
+                                     assigned_amount=10 ** 9, spent_amount=0))
+        db.session.commit()
+        client = app.test_client()
+        login(client, user)
+        n_requests = 200
+        started = time.perf_counter()
+        for i in range(n_requests):
+            when = now.replace(day=1 + i % 28)
+            response = client.post('/api/add-transaction', json={'category_id': category.id, 'amount': 1 + i,
+                                                                 'description': f'Row {i}',
+                                                                 'transaction_date': f'{when:%Y-%m-%d}'})
+            assert response.status_code == 200, response.get_json()
+        per_row = (time.perf_counter() - started) / n_requests
+        print(f"  add-transaction: {per_row * 1000:6.2f} ms/row  (~{per_row * n_rows:.0f} s for {n_rows} rows)")
+
+
+def bench_batch(n_entries=200):
+    """n_entries transactions through /api/transactions/batch vs. one /api/add-transaction call each."""
+    results = {}
+    for mode in ('single', 'batch'):
+        app = make_app()
+        with app.app_context():
+            user, plan = seed_plan(10, tx_per_category=0)
+            categories = BudgetCategory.query.filter_by(plan_id=plan.id).all()
+            now = datetime.now()
+            for category in categories:
+                db.session.add(MonthlyBudget(plan_id=plan.id, category_id=category.id, year=now.year,
+                                             month=now.month, assigned_amount=10 ** 9, spent_amount=0))
+            db.session.commit()
+            client = app.test_client()
+            login(client, user)
+            entries = [{'category_id': categories[i % len(categories)].id, 'amount': 1 + i,
+                        'description': f'Entry {i}', 'transaction_date': now.replace(day=1 + i % 28).strftime('%Y-%m-%d')}
+                       for i in range(n_entries)]
+
+            with QueryCounter() as queries:
+                started = time.perf_counter()
+                if mode == 'single':
+                    for entry in entries:
+                        assert client.post('/api/add-transaction', json=entry).status_code == 200
+                else:
+                    response = client.post('/api/transactions/batch', json={'transactions': entries})
+                    assert response.get_json()['created'] == n_entries, response.get_json()
+                elapsed = (time.perf_counter() - started) * 1000
+            results[mode] = (elapsed, queries.count, queries.writes)
+
+    print(f"{n_entries} transactions over 10 categories")
+    for mode, (elapsed, count, writes) in results.items():
+        print(f"  {mode:<7} {elapsed:9.1f} ms  {count:6} statements  {writes:6} writes")
+
+
+def bench_search(n_transactions=1_000_000, repeats=20):
+    """/api/transactions/search (FTS5) vs. the LIKE scan it replaces, over a large plan."""
+    import random
+    from website.utils.search import search_transactions, index_new_transactions
+
+    words = ['coffee', 'groceries', 'rent', 'fuel', 'lunch', 'dinner', 'taxi', 'books', 'gym', 'pharmacy',
+             'cinema', 'electricity', 'water', 'internet', 'phone', 'gift', 'shoes', 'parking', 'bakery', 'market']
+    rng = random.Random(1)
+    app = make_app()
+    with app.app_context():
+        user, plan = seed_plan(1, tx_per_category=0)
+        category = BudgetCategory.query.filter_by(plan_id=plan.id).first()
+        first_day = datetime(2020, 1, 1)
+        started = time.perf_counter()
+        for chunk_start in range(0, n_transactions, 100_000):
+            db.session.execute(insert(Transaction), [
+                {'description': f"{rng.choice(words)} {rng.choice(words)} {i}", 'amount': -1.0,
+                 'category_id': category.id, 'plan_id': plan.id,
+                 'user_notes': 'paid with card' if i % 7 == 0 else None, 'source_type': 'import',
+                 'transaction_date': first_day + timedelta(minutes=i * 4)}
+                for i in range(chunk_start, min(chunk_start + 100_000, n_transactions))
+            ])
+            index_new_transactions(db.session.connection())  # as the statement importer does
+        db.session.commit()
+        load_s = time.perf_counter() - started
+        client = app.test_client()
+        login(client, user)
+
+        print(f"{n_transactions} transactions (inserted and indexed in {load_s:.1f} s), mean of {repeats}")
+        for terms in ('pharmacy cinema', 'coffee', 'gym 4242', 'bak'):
+            started = time.perf_counter()
+            for _ in range(repeats):
+                response = client.get('/api/transactions/search', query_string={'q': terms})
+            fts_ms = (time.perf_counter() - started) * 1000 / repeats
+            hits = len(response.get_json()['transactions'])
+
+            app.extensions['transaction_search_fts'] = False
+            started = time.perf_counter()
+            like_rows, _ = search_transactions(plan.id, terms)
+            like_ms = (time.perf_counter() - started) * 1000
+            app.extensions['transaction_search_fts'] = True
+            print(f"  {terms!r:<20} FTS5 {fts_ms:8.2f} ms ({hits} hits on page 1)   LIKE {like_ms:8.1f} ms")
+
+
+def bench_loading(n_categories=40, repeats=20):
+    """Queries per page render with the relationships each page reads loaded explicitly, and the strict check."""
+    app = make_app()
+    with app.app_context():
+        user, plan = seed_plan(n_categories, tx_per_category=10)
+        # One payee per category, and receipt transactions for the receipt AI page
+        payees = [Payee(name=f"Payee {i}", plan_id=plan.id) for i in range(n_categories)]
+        db.session.add_all(payees)
+        db.session.flush()
+        for i, transaction in enumerate(Transaction.query.filter_by(plan_id=plan.id)):
+            transaction.payee_id = payees[i % n_categories].id
+            if i % 10 == 0:
+                transaction.description = f"Receipt AI: Payee {i % n_categories}"
+        db.session.commit()
+        client = app.test_client()
+        login(client, user)
+
+        print(f"{n_categories} categories and payees, {n_categories * 10} transactions this month, mean of {repeats} requests")
+        print(f"{'page':<14} {'ms':>8} {'queries':>8}  strict (RAISE_ON_LAZY_LOAD)")
+        for path in ('/transactions', '/reflect', '/receipt_ai'):
+            elapsed_ms = 0.0
+            for _ in range(repeats):
+                app.extensions['fragment_cache'].clear()
+                db.session.expire_all()
+                with QueryCounter() as counter:
+                    started = time.perf_counter()
+                    response = client.get(path)
+                    elapsed_ms += (time.perf_counter() - started) * 1000
+                assert response.status_code == 200, (path, response.status_code)
+
+            # The same render with every implicit lazy load raising
+            app.extensions['fragment_cache'].clear()
+            db.session.expire_all()
+            app.config['RAISE_ON_LAZY_LOAD'] = True
+            try:
+                strict = 'ok' if client.get(path).status_code == 200 else 'failed'
+            finally:
+                app.config['RAISE_ON_LAZY_LOAD'] = False
+            print(f"{path:<14} {elapsed_ms / repeats:>8.2f} {counter.count:>8}  {strict}")
+
+
+def bench_duplicates(n_transactions=100_000, repeats=200):
+    """The duplicate check before adding a transaction: fingerprint index probe vs. the amount/LIKE scan it replaces."""
+    from sqlalchemy.orm.attributes import flag_modified
+    from website.views import check_duplicate_transaction
+
+    app = make_app()
+    with app.app_context():
+        user, plan = seed_plan(1, tx_per_category=0)
+        category = BudgetCategory.query.filter_by(plan_id=plan.id).first()
+        # A week of heavy history (e.g. imported statements), all inside a one-week window
+        now = datetime.now()
+        db.session.execute(insert(Transaction), [
+            {'description': f'Shop {i % 500}', 'amount': -float(1 + i % 40), 'category_id': category.id,
+             'plan_id': plan.id, 'transaction_date': now - timedelta(minutes=i * 0.1)}
+            for i in range(n_transactions)
+        ])
+        plan.budget_pref['duplicate_check'] = {'window_hours': 168, 'match_payee': True}
+        flag_modified(plan, 'budget_pref')
+        db.session.commit()
+
+        def old_check(amount, description):
+            # What check_duplicate_transaction() ran before
+            return Transaction.query.filter(
+                Transaction.plan_id == plan.id,
+                func.abs(Transaction.amount) == amount,
+                Transaction.transaction_date >= now - timedelta(hours=168),
+                func.lower(Transaction.description).like(f"%{description.lower()}%")
+            ).all()
+
+        print(f"{n_transactions} transactions in the last week, 168 hour window, mean of {repeats} checks")
+        for label, amount, description in (('duplicate', 5.0, 'Shop 4'), ('new', 5.0, 'Bakery')):
+            started = time.perf_counter()
+            for _ in range(repeats):
+                old_found = bool(old_check(amount, description))
+            old_ms = (time.perf_counter() - started) * 1000 / repeats
+            started = time.perf_counter()
+            for _ in range(repeats):
+                found, _ = check_duplicate_transaction(plan, amount, description)
+            new_ms = (time.perf_counter() - started) * 1000 / repeats
+            assert found == old_found, label
+            print(f"  {label:<10} scan {old_ms:8.2f} ms   fingerprint {new_ms:6.3f} ms")
+
+
+def bench_bulk(n_selected=500, n_transactions=20_000):
+    """Deleting and recategorising n_selected transactions: the bulk endpoints vs. one request per transaction."""
+    results = []
+    for label, bulk in (('one DELETE each', False), ('bulk-delete', True), ('bulk-edit category', True)):
+        app = make_app()
+        with app.app_context():
+            user, plan = seed_plan(10, tx_per_category=0)
+            categories = BudgetCategory.query.filter_by(plan_id=plan.id).all()
+            first_day = datetime.now() - timedelta(days=365)
+            db.session.execute(insert(Transaction), [
+                {'description': 'Bench', 'amount': -1.0, 'category_id': categories[i % 10].id, 'plan_id': plan.id,
+                 'transaction_date': first_day + timedelta(minutes=i * 20)}
+                for i in range(n_transactions)
+            ])
+            db.session.commit()
+            reconcile_spend(plan_id=plan.id, repair=True)
+            rebuild_rollups(plan_id=plan.id)
+            db.session.commit()
+            client = app.test_client()
+            login(client, user)
+            # The newest rows, like a bad import being cleaned up
+            ids = [row.id for row in db.session.query(Transaction.id).order_by(Transaction.id.desc()).limit(n_selected)]
+
+            with QueryCounter() as queries:
+                started = time.perf_counter()
+                if not bulk:
+                    for transaction_id in ids:
+                        assert client.delete(f'/api/transactions/{transaction_id}').status_code == 200
+                elif label == 'bulk-delete':
+                    assert client.post('/api/transactions/bulk-delete', json={'ids': ids}).get_json()['deleted'] == n_selected
+                else:
+                    response = client.post('/api/transactions/bulk-edit', json={'ids': ids, 'category_id': categories[0].id})
+                    assert response.get_json()['updated'] == n_selected
+                elapsed = (time.perf_counter() - started) * 1000
+            assert reconcile_spend(plan_id=plan.id) == [], label  # counters still match the transactions
+            results.append((label, elapsed, queries.count))
+
+    print(f"{n_selected} of {n_transactions} transactions over 10 categories")
+    for label, elapsed, count in results:
+        print(f"  {label:<20} {elapsed:9.1f} ms  {count:6} statements")
+
+
+def bench_write_latency(n_inserts=500, n_transactions=20_000):
+    """Per-request latency (p50/p99) and statements of adding one transaction, manually and from a receipt."""
+    import contextlib
+    import io
+    import statistics
+
+    app = make_app()
+    with app.app_context():
+        user, plan = seed_plan(10, tx_per_category=0)
+        categories = BudgetCategory.query.filter_by(plan_id=plan.id).all()
+        now = datetime.now()
+        first_day = now - timedelta(days=365)
+        db.session.execute(insert(Transaction), [
+            {'description': 'Bench', 'amount': -1.0, 'category_id': categories[i % 10].id, 'plan_id': plan.id,
+             'transaction_date': first_day + timedelta(minutes=i * 20)}
+            for i in range(n_transactions)
+        ])
+        for category in categories:
+            db.session.add(MonthlyBudget(plan_id=plan.id, category_id=category.id, year=now.year,
+                                         month=now.month, assigned_amount=10 ** 9, spent_amount=0))
+        db.session.commit()
+        reconcile_spend(plan_id=plan.id, repair=True)
+        rebuild_rollups(plan_id=plan.id)
+        recompute_rollovers_from(plan, *ledger_start(plan))
+        db.session.commit()
+        client = app.test_client()
+        login(client, user)
+
+        endpoints = {
+            'add-transaction': ('/api/add-transaction', lambda i: {
+                'category_id': categories[i % 10].id, 'amount': 1 + i % 50, 'description': f'Entry {i}',
+                'transaction_date': now.strftime('%Y-%m-%d')}),
+            'receipt AI': ('/api/receipt_ai/create_transaction', lambda i: {
+                'category_id': categories[i % 10].id, 'amount': 1 + i % 50, 'vendor': 'Bench Mart',
+                'date': now.strftime('%Y-%m-%d')}),
+        }
+        print(f"{n_inserts} inserts per endpoint into a plan with {n_transactions} transactions")
+        print(f"{'endpoint':<16} {'p50 (ms)':>9} {'p99 (ms)':>9} {'mean':>7} {'statements':>11}")
+        for name, (url, body) in endpoints.items():
+            latencies = []
+            with QueryCounter() as queries, contextlib.redirect_stdout(io.StringIO()):
+                for i in range(n_inserts):
+                    db.session.expire_all()
+                    started = time.perf_counter()
+                    response = client.post(url, json=body(i))
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    assert response.get_json()['success'], response.get_json()
+            cuts = statistics.quantiles(latencies, n=100)
+            print(f"{name:<16} {cuts[49]:>9.2f} {cuts[98]:>9.2f} {statistics.mean(latencies):>7.2f} "
+                  f"{queries.count / n_inserts:>11.1f}")
+        assert reconcile_spend(plan_id=plan.id) == []  # the counters still match the transactions
+
+
+def bench_idempotency(n_requests=500, n_transactions=20_000):
+    """Latency and statements of a keyed add-transaction, and of retrying it with the same Idempotency-Key."""
+    import contextlib
+    import io
+    import statistics
+
+    app = make_app()
+    with app.app_context():
+        user, plan = seed_plan(10, tx_per_category=0)
+        categories = BudgetCategory.query.filter_by(plan_id=plan.id).all()
+        now = datetime.now()
+        first_day = now - timedelta(days=365)
+        db.session.execute(insert(Transaction), [
+            {'description': 'Bench', 'amount': -1.0, 'category_id': categories[i % 10].id, 'plan_id': plan.id,
+             'transaction_date': first_day + timedelta(minutes=i * 20)}
+            for i in range(n_transactions)
+        ])
+        for category in categories:
+            db.session.add(MonthlyBudget(plan_id=plan.id, category_id=category.id, year=now.year,
+                                         month=now.month, assigned_amount=10 ** 9, spent_amount=0))
+        db.session.commit()
+        reconcile_spend(plan_id=plan.id, repair=True)
+        rebuild_rollups(plan_id=plan.id)
+        recompute_rollovers_from(plan, *ledger_start(plan))
+        db.session.commit()
+        client = app.test_client()
+        login(client, user)
+
+        def body(i):
+            return {'category_id': categories[i % 10].id, 'amount': 1 + i % 50, 'description': f'Entry {i}',
+                    'transaction_date': now.strftime('%Y-%m-%d')}
+
+        print(f"{n_requests} keyed add-transaction requests, each retried once, "
+              f"in a plan with {n_transactions} transactions")
+        print(f"{'request':<10} {'p50 (ms)':>9} {'p99 (ms)':>9} {'statements':>11}")
+        originals = {}
+        for name in ('first', 'retry'):
+            latencies = []
+            with QueryCounter() as queries, contextlib.redirect_stdout(io.StringIO()):
+                for i in range(n_requests):
+                    db.session.expire_all()
+                    started = time.perf_counter()
+                    response = client.post('/api/add-transaction', json=body(i),
+                                           headers={'Idempotency-Key': f'bench-{i}'})
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    if name == 'first':
+                        assert response.get_json()['success'], response.get_json()
+                        originals[i] = response.get_json()
+                    else:
+                        assert response.headers.get('Idempotent-Replayed') == 'true'
+                        assert response.get_json() == originals[i]
+            cuts = statistics.quantiles(latencies, n=100)
+            print(f"{name:<10} {cuts[49]:>9.2f} {cuts[98]:>9.2f} {queries.count / n_requests:>11.1f}")
+        assert Transaction.query.filter_by(plan_id=plan.id).count() == n_transactions + n_requests
+        assert reconcile_spend(plan_id=plan.id) == []
+
+
+def bench_reflect(history_sizes=(10_000, 100_000), repeats=10):
+    """Reflect page render time, queries and peak memory as the plan's history grows."""
+    import tracemalloc
+
+    print(f"{'history':>8} {'ms':>8} {'queries':>8} {'peak KiB':>9}")
+    for n_transactions in history_sizes:
+        app = make_app()
+        with app.app_context():
+            user, plan = seed_plan(12, tx_per_category=10)
+            categories = BudgetCategory.query.filter_by(plan_id=plan.id).all()
+            first_day = datetime.now() - timedelta(days=3 * 365)
+            db.session.execute(insert(Transaction), [
+                {'description': 'Bench', 'amount': -(1.0 + i % 97), 'category_id': categories[i % 12].id,
+                 'plan_id': plan.id, 'transaction_date': first_day + timedelta(minutes=i * 10)}
+                for i in range(n_transactions)
+            ])
+            rebuild_rollups(plan_id=plan.id)
+            db.session.commit()
+            client = app.test_client()
+            login(client, user)
+
+            elapsed_ms = peak = 0
+            for _ in range(repeats):
+                app.extensions['fragment_cache'].clear()
+                db.session.expire_all()
+                tracemalloc.start()
+                with QueryCounter() as counter:
+                    started = time.perf_counter()
+                    response = client.get('/reflect')
+                    elapsed_ms += (time.perf_counter() - started) * 1000
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+                assert response.status_code == 200
+            print(f"{n_transactions:>8} {elapsed_ms / repeats:>8.2f} {counter.count:>8} {peak / 1024:>9.0f}")
+
+
+def bench_daily_series(month_sizes=(10_000, 50_000), repeats=10):
+    """The reflect page's daily chart series for one busy month: per-transaction Python loops vs the numpy kernel."""
+    import calendar
+    import numpy as np
+    from sqlalchemy import case
+    from sqlalchemy.orm import joinedload
+    from website.utils.analytics import MAIN_CATEGORIES, daily_columns, daily_series
+    from website.utils.dates import in_month
+
+    year, month = 2025, 3
+    days_in_month = calendar.monthrange(year, month)[1]
+
+    def python_loops(plan_id):
+        # What reflect did before: every transaction as an ORM object, then dicts per day and main category
+        transactions = Transaction.query.options(joinedload(Transaction.category)).filter(
+            Transaction.plan_id == plan_id, in_month(Transaction.transaction_date, year, month)).all()
+        daily_totals = {}
+        for tx in transactions:
+            daily_totals[tx.transaction_date.day] = daily_totals.get(tx.transaction_date.day, 0) + abs(tx.amount)
+        by_main = {}
+        for main_category in MAIN_CATEGORIES:
+            totals = {}
+            for tx in transactions:
+                if tx.category.main_category == main_category:
+                    totals[tx.transaction_date.day] = totals.get(tx.transaction_date.day, 0) + abs(tx.amount)
+            by_main[main_category] = [totals.get(day, 0) for day in range(1, days_in_month + 1)]
+        return [daily_totals.get(day, 0) for day in range(1, days_in_month + 1)], by_main
+
+    def numpy_per_transaction(plan_id):
+        # One (day, main category, amount) row per transaction into numpy
+        main_index = case({name: i for i, name in enumerate(MAIN_CATEGORIES)},
+                          value=BudgetCategory.main_category, else_=len(MAIN_CATEGORIES))
+        rows = db.session.query(
+            func.extract('day', Transaction.transaction_date), main_index, Transaction.amount
+        ).join(BudgetCategory, Transaction.category_id == BudgetCategory.id).filter(
+            Transaction.plan_id == plan_id, in_month(Transaction.transaction_date, year, month)).all()
+        columns = np.array(rows, dtype=float).reshape(-1, 3)
+        return daily_series(columns[:, 0], columns[:, 1], columns[:, 2], days_in_month)
+
+    def numpy_grouped(plan_id):
+        # What reflect does: SQLite sums per day and main category, numpy builds every series
+        return daily_series(*daily_columns(plan_id, year, month), days_in_month)
+
+    print(f"{'transactions':>12} {'method':<24} {'ms':>9}")
+    for n_transactions in month_sizes:
+        app = make_app()
+        with app.app_context():
+            user, plan = seed_plan(12, tx_per_category=0)
+            categories = BudgetCategory.query.filter_by(plan_id=plan.id).all()
+            step = days_in_month * 86400 / n_transactions
+            db.session.execute(insert(Transaction), [
+                {'description': 'Bench', 'amount': -(1.0 + i % 97), 'category_id': categories[i % 12].id,
+                 'plan_id': plan.id, 'transaction_date': datetime(year, month, 1) + timedelta(seconds=i * step)}
+                for i in range(n_transactions)
+            ])
+            db.session.commit()
+
+            expected, expected_by_main = python_loops(plan.id)
+            for method in (python_loops, numpy_per_transaction, numpy_grouped):
+                started = time.perf_counter()
+                for _ in range(repeats):
+                    db.session.expire_all()
+                    method(plan.id)
+                elapsed_ms = (time.perf_counter() - started) * 1000 / repeats
+                print(f"{n_transactions:>12} {method.__name__:<24} {elapsed_ms:>9.2f}")
+            series = numpy_grouped(plan.id)
+            assert all(abs(a - b) < 1e-6 for a, b in zip(series['total'].tolist(), expected))
+            assert all(abs(a - b) < 1e-6 for name in MAIN_CATEGORIES
+                       for a, b in zip(series['by_main_category'][name].tolist(), expected_by_main[name]))
+
+
+
+def bench_trend(n_transactions=200_000, repeats=20):
+    """/api/analytics/trend: response time, queries and payload size from one month to five years."""
+    app = make_app()
+    with app.app_context():
+        user, plan = seed_plan(12, tx_per_category=0)
+        categories = BudgetCategory.query.filter_by(plan_id=plan.id).all()
+        last_day = datetime(2025, 6, 30)
+        step = 5 * 365 * 86400 / n_transactions
+        db.session.execute(insert(Transaction), [
+            {'description': 'Bench', 'amount': -(1.0 + i % 97), 'category_id': categories[i % 12].id,
+             'plan_id': plan.id, 'transaction_date': last_day - timedelta(seconds=i * step)}
+            for i in range(n_transactions)
+        ])
+        rebuild_rollups(plan_id=plan.id)
+        db.session.commit()
+        client = app.test_client()
+        login(client, user)
+
+        print(f"{'range':<8} {'group':<9} {'granularity':>11} {'points':>6} {'ms':>8} {'queries':>8} {'KiB':>6}")
+        for label, first in (('1 month', '2025-06-01'), ('1 year', '2024-07-01'), ('5 years', '2020-07-01')):
+            for group in ('main', 'category'):
+                url = f'/api/analytics/trend?from={first}&to=2025-06-30&granularity=day&group={group}'
+                elapsed_ms = 0
+                for _ in range(repeats):
+                    db.session.expire_all()
+                    with QueryCounter() as counter:
+                        started = time.perf_counter()
+                        response = client.get(url)
+                        elapsed_ms += (time.perf_counter() - started) * 1000
+                body = response.get_json()
+                assert body['success'], body
+                print(f"{label:<8} {group:<9} {body['granularity']:>11} {len(body['buckets']):>6} "
+                      f"{elapsed_ms / repeats:>8.2f} {counter.count:>8} {len(response.data) / 1024:>6.1f}")
+
+        # Same figures as summing the transactions themselves
+        body = client.get('/api/analytics/trend?from=2020-07-01&to=2025-06-30&granularity=month').get_json()
+        spent = db.session.query(func.sum(func.abs(Transaction.amount))).filter(
+            Transaction.plan_id == plan.id, Transaction.transaction_date >= datetime(2020, 7, 1)).scalar()
+        assert abs(sum(body['total']) - spent) < 1
+
+
+
+def bench_chart_payload(n_transactions=100_000, months=12, repeats=5):
+    """Reflect page weight and uncached render time over a year of months, and trend API payload sizes per encoding."""
+    import re
+    from website.utils.columnar import decode_column
+
+    app = make_app()
+    with app.app_context():
+        user, plan = seed_plan(12, tx_per_category=0)
+        categories = BudgetCategory.query.filter_by(plan_id=plan.id).all()
+        first_day = datetime(2025, 1, 1)
+        step = months * 30.4 * 86400 / n_transactions
+        db.session.execute(insert(Transaction), [
+            {'description': 'Bench', 'amount': -round(1.0 + (i * 7919 % 9700) / 100, 2),
+             'category_id': categories[i % 12].id, 'plan_id': plan.id,
+             'transaction_date': first_day + timedelta(seconds=i * step)}
+            for i in range(n_transactions)
+        ])
+        rebuild_rollups(plan_id=plan.id)
+        db.session.commit()
+        client = app.test_client()
+        login(client, user)
+
+        page_bytes = chart_bytes = elapsed_ms = 0
+        for month in range(1, months + 1):
+            for _ in range(repeats):
+                app.extensions['fragment_cache'].clear()
+                started = time.perf_counter()
+                response = client.get(f'/reflect/2025/{month}')
+                elapsed_ms += (time.perf_counter() - started) * 1000
+            assert response.status_code == 200
+            html = response.get_data(as_text=True)
+            page_bytes += len(html)
+            chart_bytes += len(re.search(r'// Get data from backend(.*?)// Initialize pie chart', html, re.S).group(1))
+        print(f"reflect, {months} months: {page_bytes / 1024:.1f} KiB of pages, {chart_bytes / 1024:.1f} KiB "
+              f"of chart data, {elapsed_ms / repeats / months:.2f} ms per uncached render")
+
+        print(f"{'trend, 1 year by day':<28} {'KiB':>7}")
+        query = '/api/analytics/trend?from=2025-01-01&to=2025-12-31&granularity=day&group=category&max_points=400'
+        bodies = {}
+        for encoding in ('plain', 'delta'):
+            response = client.get(f'{query}&encoding={encoding}')
+            bodies[encoding] = response.get_json()
+            assert bodies[encoding]['success']
+            print(f"{encoding:<28} {len(response.data) / 1024:>7.1f}")
+        assert all(abs(a - b) < 0.006 for a, b in zip(
+            decode_column(bodies['delta']['total']), bodies['plain']['total']))
+
+
+BENCHMARKS = {
+    'snapshot': bench_snapshot,
+    'budget_limit': bench_budget_limit,
+    'request_cache': bench_request_cache,
+    'visibility': bench_visibility,
+    'fragments': bench_fragments,
+    'conditional': bench_conditional,
+    'transactions_api': bench_transactions_api,
+    'export': bench_export,
+    'import': bench_import,
+    'batch': bench_batch,
+    'search': bench_search,
+    'loading': bench_loading,
+    'reflect': bench_reflect,
+    'daily_series': bench_daily_series,
+    'trend': bench_trend,
+    'chart_payload': bench_chart_payload,
+    'duplicates': bench_duplicates,
+    'bulk': bench_bulk,
+    'write_latency': bench_write_latency,
+    'idempotency': bench_idempotency,
+}
+
+
+if __name__ == '__main__':
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for name in selected:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
+        print()
@@ -0,0 +1,47 @@
+"""add indexes for hot queries and unique monthly budget per category/month
+
+Revision ID: 4c7e1a2b9d10
+Revises: 05d40e2af386
+Create Date: 2025-08-02 10:15:42.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c7e1a2b9d10'
+down_revision = '05d40e2af386'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep one MonthlyBudget row per category and month (the lowest id is the
+    # one the app has always read) before enforcing uniqueness. Spend counters
+    # on the kept rows are recomputed by e1f7b3a9c524 (backfill spend counters).
+    op.execute(
+        "DELETE FROM monthly_budget WHERE id NOT IN "
+        "(SELECT MIN(id) FROM monthly_budget GROUP BY category_id, year, month)"
+    )
+
+    # if_not_exists: create_app() runs db.create_all(), which may already have built them
+    op.create_index('uq_monthly_budget_category_month', 'monthly_budget', ['category_id', 'year', 'month'], unique=True, if_not_exists=True)
+    op.create_index('ix_monthly_budget_plan_month', 'monthly_budget', ['plan_id', 'year', 'month'], unique=False, if_not_exists=True)
+    op.create_index('ix_transaction_plan_date', 'transaction', ['plan_id', 'transaction_date'], unique=False, if_not_exists=True)
+    op.create_index('ix_transaction_category_date', 'transaction', ['category_id', 'transaction_date'], unique=False, if_not_exists=True)
+    op.create_index('ix_monthly_rollover_plan_month', 'monthly_rollover', ['plan_id', 'year', 'month'], unique=False, if_not_exists=True)
+    op.create_index('ix_additional_income_plan_month', 'additional_income', ['plan_id', 'year', 'month'], unique=False, if_not_exists=True)
+    op.create_index('ix_budget_category_plan_id', 'budget_category', ['plan_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_payee_plan_id', 'payee', ['plan_id'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_payee_plan_id', table_name='payee')
+    op.drop_index('ix_budget_category_plan_id', table_name='budget_category')
+    op.drop_index('ix_additional_income_plan_month', table_name='additional_income')
+    op.drop_index('ix_monthly_rollover_plan_month', table_name='monthly_rollover')
+    op.drop_index('ix_transaction_category_date', table_name='transaction')
+    op.drop_index('ix_transaction_plan_date', table_name='transaction')
+    op.drop_index('ix_monthly_budget_plan_month', table_name='monthly_budget')
+    op.drop_index('uq_monthly_budget_category_month', table_name='monthly_budget')
@@ -0,0 +1,31 @@
+"""add pref_version to plan
+
+Revision ID: 7b2f5d8e1c34
+Revises: 4c7e1a2b9d10
+Create Date: 2025-08-04 18:27:09.531442
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b2f5d8e1c34'
+down_revision = '4c7e1a2b9d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have added the column
+    columns = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('plan')}
+    if 'pref_version' in columns:
+        return
+
+    with op.batch_alter_table('plan', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('pref_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('plan', schema=None) as batch_op:
+        batch_op.drop_column('pref_version')
@@ -0,0 +1,62 @@
+"""add monthly_category_rollup table
+
+Revision ID: a3f9c2d5b718
+Revises: c7d1f4a9e286
+Create Date: 2025-08-12 14:03:27.915640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f9c2d5b718'
+down_revision = 'c7d1f4a9e286'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have created it
+    if 'monthly_category_rollup' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table('monthly_category_rollup',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('month', sa.Integer(), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('total_amount', sa.Float(), nullable=False),
+        sa.Column('transaction_count', sa.Integer(), nullable=False),
+        sa.Column('min_amount', sa.Float(), nullable=False),
+        sa.Column('max_amount', sa.Float(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.Column('plan_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['category_id'], ['budget_category.id'], ),
+        sa.ForeignKeyConstraint(['plan_id'], ['plan.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    op.create_index('uq_monthly_category_rollup_category_month', 'monthly_category_rollup',
+                    ['category_id', 'year', 'month'], unique=True, if_not_exists=True)
+    op.create_index('ix_monthly_category_rollup_plan_month', 'monthly_category_rollup',
+                    ['plan_id', 'year', 'month'], unique=False, if_not_exists=True)
+
+    # Fill it from the existing transactions (the same query as `flask rebuild-rollups`)
+    transaction = sa.table('transaction', sa.column('id'), sa.column('plan_id'), sa.column('category_id'),
+                           sa.column('amount'), sa.column('transaction_date'))
+    rollup = sa.table('monthly_category_rollup', sa.column('plan_id'), sa.column('category_id'),
+                      sa.column('year'), sa.column('month'), sa.column('total_amount'),
+                      sa.column('transaction_count'), sa.column('min_amount'), sa.column('max_amount'))
+    year = sa.cast(sa.extract('year', transaction.c.transaction_date), sa.Integer)
+    month = sa.cast(sa.extract('month', transaction.c.transaction_date), sa.Integer)
+    spend = sa.func.abs(transaction.c.amount)
+    op.execute(sa.delete(rollup))
+    op.execute(rollup.insert().from_select(
+        ['plan_id', 'category_id', 'year', 'month', 'total_amount', 'transaction_count', 'min_amount', 'max_amount'],
+        sa.select(transaction.c.plan_id, transaction.c.category_id, year, month, sa.func.sum(spend),
+                  sa.func.count(transaction.c.id), sa.func.min(spend), sa.func.max(spend))
+        .group_by(transaction.c.plan_id, transaction.c.category_id, year, month)
+    ))
+
+
+def downgrade():
+    op.drop_index('ix_monthly_category_rollup_plan_month', table_name='monthly_category_rollup')
+    op.drop_index('uq_monthly_category_rollup_category_month', table_name='monthly_category_rollup')
+    op.drop_table('monthly_category_rollup')
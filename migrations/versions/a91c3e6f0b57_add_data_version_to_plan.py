@@ -0,0 +1,31 @@
+"""add data_version to plan
+
+Revision ID: a91c3e6f0b57
+Revises: 7b2f5d8e1c34
+Create Date: 2025-08-06 09:12:44.870213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a91c3e6f0b57'
+down_revision = '7b2f5d8e1c34'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have added the column
+    columns = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('plan')}
+    if 'data_version' in columns:
+        return
+
+    with op.batch_alter_table('plan', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('plan', schema=None) as batch_op:
+        batch_op.drop_column('data_version')
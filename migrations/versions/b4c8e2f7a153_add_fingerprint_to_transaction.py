@@ -0,0 +1,58 @@
+"""add duplicate-detection fingerprint to transaction
+
+Revision ID: b4c8e2f7a153
+Revises: f2a6d3b8c917
+Create Date: 2025-08-10 11:07:44.618203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from website.models import transaction_fingerprint
+from website.utils.search import create_search_index, drop_search_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4c8e2f7a153'
+down_revision = 'f2a6d3b8c917'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have added the column
+    columns = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('transaction')}
+    if 'fingerprint' not in columns:
+        with op.batch_alter_table('transaction', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('fingerprint', sa.String(length=16), nullable=True))
+
+    # Fingerprint the existing transactions
+    bind = op.get_bind()
+    transaction = sa.table('transaction', sa.column('id'), sa.column('description'),
+                           sa.column('amount'), sa.column('fingerprint'))
+    rows = bind.execute(sa.select(transaction.c.id, transaction.c.description, transaction.c.amount)
+                        .where(transaction.c.fingerprint.is_(None))).all()
+    if rows:
+        bind.execute(
+            transaction.update().where(transaction.c.id == sa.bindparam('row_id'))
+            .values(fingerprint=sa.bindparam('row_fingerprint')),
+            [{'row_id': id_, 'row_fingerprint': transaction_fingerprint(description, amount)}
+             for id_, description, amount in rows]
+        )
+
+    op.create_index('ix_transaction_plan_fingerprint_date', 'transaction',
+                    ['plan_id', 'fingerprint', 'transaction_date'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    bind = op.get_bind()
+    op.drop_index('ix_transaction_plan_fingerprint_date', table_name='transaction', if_exists=True)
+    # On SQLite the batch recreates the table, which the search index's triggers
+    # reference; take the index down for the duration and rebuild it after
+    sqlite = bind.dialect.name == 'sqlite'
+    if sqlite:
+        drop_search_index(bind)
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.drop_column('fingerprint')
+    if sqlite:
+        create_search_index(bind)
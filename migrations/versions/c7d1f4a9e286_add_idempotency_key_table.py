@@ -0,0 +1,43 @@
+"""add idempotency_key table
+
+Revision ID: c7d1f4a9e286
+Revises: b4c8e2f7a153
+Create Date: 2025-08-11 09:26:51.730412
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d1f4a9e286'
+down_revision = 'b4c8e2f7a153'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have created it
+    if 'idempotency_key' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table('idempotency_key',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('endpoint', sa.String(length=100), nullable=False),
+        sa.Column('request_hash', sa.String(length=64), nullable=False),
+        sa.Column('response_body', sa.JSON(), nullable=False),
+        sa.Column('created_date', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('transaction_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.ForeignKeyConstraint(['transaction_id'], ['transaction.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id')
+        )
+    op.create_index('uq_idempotency_key_user_key', 'idempotency_key', ['user_id', 'key'], unique=True, if_not_exists=True)
+    op.create_index('ix_idempotency_key_expires_at', 'idempotency_key', ['expires_at'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_idempotency_key_expires_at', table_name='idempotency_key')
+    op.drop_index('uq_idempotency_key_user_key', table_name='idempotency_key')
+    op.drop_table('idempotency_key')
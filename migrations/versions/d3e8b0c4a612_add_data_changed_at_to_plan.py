@@ -0,0 +1,31 @@
+"""add data_changed_at to plan
+
+Revision ID: d3e8b0c4a612
+Revises: a91c3e6f0b57
+Create Date: 2025-08-07 14:03:51.227906
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3e8b0c4a612'
+down_revision = 'a91c3e6f0b57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have added the column
+    columns = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('plan')}
+    if 'data_changed_at' in columns:
+        return
+
+    with op.batch_alter_table('plan', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_changed_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('plan', schema=None) as batch_op:
+        batch_op.drop_column('data_changed_at')
@@ -0,0 +1,56 @@
+"""add daily_category_rollup table
+
+Revision ID: d5e8a1c4b392
+Revises: a3f9c2d5b718
+Create Date: 2025-08-13 10:21:52.307418
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5e8a1c4b392'
+down_revision = 'a3f9c2d5b718'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have created it
+    if 'daily_category_rollup' not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table('daily_category_rollup',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('total_amount', sa.Float(), nullable=False),
+        sa.Column('transaction_count', sa.Integer(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.Column('plan_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['category_id'], ['budget_category.id'], ),
+        sa.ForeignKeyConstraint(['plan_id'], ['plan.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    op.create_index('uq_daily_category_rollup_category_date', 'daily_category_rollup',
+                    ['category_id', 'date'], unique=True, if_not_exists=True)
+    op.create_index('ix_daily_category_rollup_plan_date', 'daily_category_rollup',
+                    ['plan_id', 'date'], unique=False, if_not_exists=True)
+
+    # Fill it from the existing transactions (the same query as `flask rebuild-rollups`)
+    transaction = sa.table('transaction', sa.column('id'), sa.column('plan_id'), sa.column('category_id'),
+                           sa.column('amount'), sa.column('transaction_date'))
+    rollup = sa.table('daily_category_rollup', sa.column('plan_id'), sa.column('category_id'),
+                      sa.column('date'), sa.column('total_amount'), sa.column('transaction_count'))
+    day = sa.func.date(transaction.c.transaction_date)
+    op.execute(sa.delete(rollup))
+    op.execute(rollup.insert().from_select(
+        ['plan_id', 'category_id', 'date', 'total_amount', 'transaction_count'],
+        sa.select(transaction.c.plan_id, transaction.c.category_id, day,
+                  sa.func.sum(sa.func.abs(transaction.c.amount)), sa.func.count(transaction.c.id))
+        .group_by(transaction.c.plan_id, transaction.c.category_id, day)
+    ))
+
+
+def downgrade():
+    op.drop_index('ix_daily_category_rollup_plan_date', table_name='daily_category_rollup')
+    op.drop_index('uq_daily_category_rollup_category_date', table_name='daily_category_rollup')
+    op.drop_table('daily_category_rollup')
@@ -0,0 +1,60 @@
+"""backfill the spend counters from the transactions
+
+Revision ID: e1f7b3a9c524
+Revises: d5e8a1c4b392
+Create Date: 2025-08-14 09:12:38.540127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e1f7b3a9c524'
+down_revision = 'd5e8a1c4b392'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Pages read spend from MonthlyBudget.spent_amount and BudgetCategory.spent_amount
+    # (utils/counters.py); rows older than the counters only hold what past page views
+    # wrote. Recompute them from the transactions, the same figures as
+    # `flask reconcile-spend --repair`. The rollover ledger reads these counters and
+    # is rebuilt after them, in f4b2c8d6e913.
+    transaction = sa.table('transaction', sa.column('plan_id'), sa.column('category_id'),
+                           sa.column('amount'), sa.column('transaction_date'))
+    monthly_budget = sa.table('monthly_budget', sa.column('plan_id'), sa.column('category_id'),
+                              sa.column('year'), sa.column('month'),
+                              sa.column('assigned_amount'), sa.column('spent_amount'))
+    budget_category = sa.table('budget_category', sa.column('id'), sa.column('spent_amount'))
+    year = sa.cast(sa.extract('year', transaction.c.transaction_date), sa.Integer)
+    month = sa.cast(sa.extract('month', transaction.c.transaction_date), sa.Integer)
+    spend = sa.func.coalesce(sa.func.sum(sa.func.abs(transaction.c.amount)), 0)
+
+    op.execute(monthly_budget.update().values(spent_amount=sa.select(spend).where(
+        transaction.c.category_id == monthly_budget.c.category_id,
+        year == monthly_budget.c.year,
+        month == monthly_budget.c.month
+    ).scalar_subquery()))
+
+    # Months with spending but no MonthlyBudget row
+    op.execute(monthly_budget.insert().from_select(
+        ['plan_id', 'category_id', 'year', 'month', 'assigned_amount', 'spent_amount'],
+        sa.select(transaction.c.plan_id, transaction.c.category_id, year, month, sa.literal(0.0), spend)
+        .where(~sa.exists().where(
+            monthly_budget.c.category_id == transaction.c.category_id,
+            monthly_budget.c.year == year,
+            monthly_budget.c.month == month
+        ))
+        .group_by(transaction.c.plan_id, transaction.c.category_id, year, month)
+    ))
+
+    op.execute(budget_category.update().values(spent_amount=sa.select(spend).where(
+        transaction.c.category_id == budget_category.c.id
+    ).scalar_subquery()))
+
+
+def downgrade():
+    # Data only: the recomputed counters are as valid under the previous revision
+    pass
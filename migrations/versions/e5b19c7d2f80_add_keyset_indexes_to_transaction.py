@@ -0,0 +1,30 @@
+"""index transactions for keyset pagination and payee filters
+
+Revision ID: e5b19c7d2f80
+Revises: d3e8b0c4a612
+Create Date: 2025-08-08 10:21:09.384117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b19c7d2f80'
+down_revision = 'd3e8b0c4a612'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # (plan_id, transaction_date, id) serves everything (plan_id, transaction_date)
+    # did, plus the (transaction_date, id) ordering of paged transaction lists
+    op.create_index('ix_transaction_plan_date_id', 'transaction', ['plan_id', 'transaction_date', 'id'], unique=False, if_not_exists=True)
+    op.create_index('ix_transaction_payee_date', 'transaction', ['payee_id', 'transaction_date'], unique=False, if_not_exists=True)
+    op.drop_index('ix_transaction_plan_date', table_name='transaction', if_exists=True)
+
+
+def downgrade():
+    op.create_index('ix_transaction_plan_date', 'transaction', ['plan_id', 'transaction_date'], unique=False, if_not_exists=True)
+    op.drop_index('ix_transaction_payee_date', table_name='transaction')
+    op.drop_index('ix_transaction_plan_date_id', table_name='transaction')
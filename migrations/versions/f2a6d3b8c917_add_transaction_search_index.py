@@ -0,0 +1,30 @@
+"""add full-text search index over transactions
+
+Revision ID: f2a6d3b8c917
+Revises: e5b19c7d2f80
+Create Date: 2025-08-09 16:42:18.206531
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from website.utils.search import create_search_index, drop_search_index
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a6d3b8c917'
+down_revision = 'e5b19c7d2f80'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # FTS5 table plus the triggers that keep it in sync, filled from the
+    # existing transactions. A no-op on databases without FTS5, where search
+    # falls back to LIKE.
+    create_search_index(op.get_bind())
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        drop_search_index(op.get_bind())
@@ -0,0 +1,47 @@
+"""rebuild the rollover ledger from the spend counters
+
+Revision ID: f4b2c8d6e913
+Revises: e1f7b3a9c524
+Create Date: 2025-08-14 09:47:05.218364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+from website import db
+from website.models import Plan, MonthlyRollover
+from website.utils.ledger import recompute_rollovers_from, ledger_start
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4b2c8d6e913'
+down_revision = 'e1f7b3a9c524'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # MonthlyRollover rows written before the ledger was kept up to date on every
+    # write only hold what past home-page views happened to store, and
+    # recompute_rollovers_from() builds on the previous month's row. Delete each
+    # plan's ledger and rebuild it from its first month (what `flask rebuild-rollovers`
+    # does), now that e1f7b3a9c524 has fixed the spend counters it reads.
+    #
+    # The ledger code queries through db.session; point it at this migration's
+    # connection so SQLite doesn't see a second writer
+    session = orm.Session(bind=op.get_bind())
+    db.session.registry.set(session)
+    try:
+        for plan in session.query(Plan).all():
+            session.query(MonthlyRollover).filter_by(plan_id=plan.id).delete(synchronize_session=False)
+            recompute_rollovers_from(plan, *ledger_start(plan))
+        session.commit()
+    finally:
+        session.close()
+        db.session.registry.clear()
+
+
+def downgrade():
+    # Data only: the rebuilt ledger is as valid under the previous revision
+    pass
@@ -9,7 +9,7 @@ from flask_migrate import Migrate
 from authlib.integrations.flask_client import OAuth
 from dotenv import load_dotenv
 from werkzeug.middleware.proxy_fix import ProxyFix
-import os, pathlib
+import hashlib, os, pathlib
 
 load_dotenv()
 
@@ -20,7 +20,19 @@ mail  = Mail()
 
 DB_NAME = "database.db"                       # will sit inside /website
 
-def create_app():
+
+def source_fingerprint():
+    """Hash of the app's code, templates and static files: the same in every worker, new with every deploy."""
+    root = pathlib.Path(__file__).parent
+    digest = hashlib.sha256()
+    for path in sorted(root.rglob("*")):
+        if path.is_file() and "__pycache__" not in path.parts and path.name != DB_NAME \
+                and (path.suffix == ".py" or {"templates", "static"} & set(path.relative_to(root).parts)):
+            digest.update(str(path.relative_to(root)).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+def create_app(test_config=None):
     app = Flask(__name__)
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
 
@@ -38,6 +50,13 @@ def create_app():
     app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+    # Part of every ETag, so pages cached by browsers are refetched after a deploy.
+    # Workers are started separately (no --preload), so the fallback must not depend on the process
+    app.config["ETAG_SALT"] = os.getenv("RENDER_GIT_COMMIT") or source_fingerprint()
+
+    # Make implicit relationship lazy loads raise (CI / local checks, see utils/loading.py)
+    app.config["RAISE_ON_LAZY_LOAD"] = os.getenv("RAISE_ON_LAZY_LOAD") == "1"
+
     app.config.update(
         MAIL_SERVER   = "smtp.gmail.com",
         MAIL_PORT     = 587,
@@ -47,6 +66,10 @@ def create_app():
         MAIL_DEFAULT_SENDER = os.getenv("MAIL_USERNAME"),   # ★ add this
     )
 
+    # Overrides for scripts such as benchmark.py (e.g. an in-memory database)
+    if test_config:
+        app.config.update(test_config)
+
     # ── Initialise extensions ─────────────────
     db.init_app(app)
     oauth.init_app(app)
@@ -55,7 +78,10 @@ def create_app():
     login_manager = LoginManager()
     login_manager.login_view = "auth.login"
     login_manager.init_app(app)
-    migrate.init_app(app, db)
+    # Autogenerate must not try to drop the search index's tables (see utils/search.py)
+    from .utils.search import is_search_table
+    migrate.init_app(app, db, include_object=lambda obj, name, type_, reflected, compare_to:
+                     not (type_ == 'table' and reflected and is_search_table(name)))
 
     # ── Blueprints ────────────────────────────
     from .views import views
@@ -65,19 +91,43 @@ def create_app():
     app.register_blueprint(views, url_prefix="/")
     app.register_blueprint(auth,  url_prefix="/")
 
+    # ── CLI maintenance commands (flask <command>) ──
+    from .commands import register_commands
+    register_commands(app)
+
+    # ── Request-scoped cache (active plan, categories, payees) ──
+    from .utils.request_cache import init_request_cache
+    init_request_cache(app)
+
+    # ── Plan data versions and the rendered-fragment cache keyed by them ──
+    from .utils.data_version import init_data_version
+    from .utils.fragment_cache import init_fragment_cache
+    init_data_version()
+    init_fragment_cache(app)
+
+    # ── Relationship loading checks (RAISE_ON_LAZY_LOAD) ──
+    from .utils.loading import init_strict_loading
+    init_strict_loading()
+
 
 
     @login_manager.user_loader
     def load_user(user_id):
         from .models import User
-        return User.query.get(int(user_id))
+        from sqlalchemy.orm import joinedload
+        # Nearly every view starts from the user's active plan, so load it with the user
+        return User.query.options(joinedload(User.active_plan)).get(int(user_id))
 
     @app.get("/health")
     def health():
         return {"status": "ok"}, 200
 
     with app.app_context():
-        from .models import User, Note, Plan, BudgetCategory, MonthlyBudget, Transaction, Payee, MonthlyRollover, AdditionalIncome
+        from .models import User, Note, Plan, BudgetCategory, MonthlyBudget, Transaction, Payee, MonthlyRollover, AdditionalIncome, IdempotencyKey, MonthlyCategoryRollup, DailyCategoryRollup
         db.create_all()
 
+    # ── Full-text search index (an FTS5 table create_all() can't make) ──
+    from .utils.search import init_search
+    init_search(app)
+
     return app
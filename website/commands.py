@@ -0,0 +1,215 @@
+import click
+from datetime import datetime
+from flask.cli import with_appcontext
+from sqlalchemy.exc import InvalidRequestError
+from . import db, create_app
+from .models import Plan, User, BudgetCategory, Payee, Transaction
+from .utils.counters import reconcile_spend
+from .utils.ledger import recompute_rollovers_from, ledger_start
+from .utils.query_plans import hot_queries, find_full_scans, explain
+from .utils.importer import import_statement, open_statement, StatementError, DEFAULT_BATCH_SIZE
+from .utils.idempotency import purge_expired_keys
+from .utils.rollups import rebuild_rollups
+
+
+@click.command('rebuild-rollovers')
+@click.option('--plan-id', type=int, default=None, help='Only rebuild this plan.')
+@with_appcontext
+def rebuild_rollovers(plan_id):
+    """Rebuild the MonthlyRollover ledger from each plan owner's first month."""
+    plans = Plan.query.filter_by(id=plan_id).all() if plan_id else Plan.query.all()
+    for plan in plans:
+        recompute_rollovers_from(plan, *ledger_start(plan))
+        click.echo(f"Rebuilt rollovers for plan {plan.id} ({plan.name})")
+    db.session.commit()
+
+
+@click.command('reconcile-spend')
+@click.option('--plan-id', type=int, default=None, help='Only check this plan.')
+@click.option('--repair', is_flag=True, help='Fix the counters that drifted.')
+@with_appcontext
+def reconcile_spend_command(plan_id, repair):
+    """Check the monthly and lifetime spend counters against the transactions."""
+    drift = reconcile_spend(plan_id=plan_id, repair=repair)
+    for kind, category_id, year, month, stored, actual in drift:
+        period = f"{year}-{month:02d}" if year else "lifetime"
+        click.echo(f"category {category_id} {period}: stored {stored}, actual {actual:.2f}")
+
+    if not drift:
+        click.echo("Spend counters are in sync.")
+    elif repair:
+        # Repaired counters change monthly spend, so the rollover ledger has to follow
+        plans = Plan.query.filter_by(id=plan_id).all() if plan_id else Plan.query.all()
+        for plan in plans:
+            recompute_rollovers_from(plan, *ledger_start(plan))
+        db.session.commit()
+        click.echo(f"Repaired {len(drift)} counter(s).")
+    else:
+        click.echo(f"{len(drift)} counter(s) drifted. Run again with --repair to fix them.")
+        raise SystemExit(1)
+
+
+@click.command('rebuild-rollups')
+@click.option('--plan-id', type=int, default=None, help='Only rebuild this plan.')
+@with_appcontext
+def rebuild_rollups_command(plan_id):
+    """Rebuild the monthly and daily category rollups from the transactions."""
+    monthly_rows, daily_rows = rebuild_rollups(plan_id=plan_id)
+    db.session.commit()
+    click.echo(f"Rebuilt {monthly_rows} monthly and {daily_rows} daily rollup row(s).")
+
+
+@click.command('check-query-plans')
+@click.option('--verbose', is_flag=True, help='Print the plan of every query, not just the failures.')
+@with_appcontext
+def check_query_plans(verbose):
+    """Fail if a hot query fully scans transaction or one of the tables keyed for lookups (SQLite only)."""
+    if db.engine.dialect.name != 'sqlite':
+        click.echo("EXPLAIN QUERY PLAN checks only run on SQLite, skipping.")
+        return
+
+    queries = hot_queries()
+    offenders = find_full_scans(queries)
+    for name, query in queries.items():
+        if verbose or name in offenders:
+            status = "FULL SCAN" if name in offenders else "ok"
+            click.echo(f"[{status}] {name}")
+            for line in explain(query):
+                click.echo(f"    {line}")
+
+    if offenders:
+        click.echo(f"{len(offenders)} hot query(ies) scan a whole table.")
+        raise SystemExit(1)
+    click.echo(f"All {len(queries)} hot queries use an index.")
+
+
+# Pages `flask check-lazy-loads` renders by default: the ones that list transactions with their relationships
+LAZY_LOAD_PAGES = ('/transactions', '/reflect', '/receipt_ai')
+
+
+def _seed_sample_plan(n_categories=6, tx_per_category=4):
+    """A user with one plan, categories, payees and this month's spending (some from Receipt AI). Returns the user id."""
+    now = datetime.now()
+    main_categories = ['needs', 'wants', 'investments']
+    names = {'needs': [], 'wants': [], 'savings': []}
+    categories = []
+    for i in range(n_categories):
+        main_category = main_categories[i % 3]
+        names['savings' if main_category == 'investments' else main_category].append(f"Category {i}")
+        categories.append(BudgetCategory(name=f"Category {i}", main_category=main_category))
+
+    user = User(email='lazy-load-check@example.com', first_name='Check', profile_complete=True,
+                date_created=datetime(now.year, 1, 1))
+    plan = Plan(name='Lazy load check', monthly_income=10000,
+                budget_pref={'ratios': {'needs': 50, 'wants': 30, 'savings': 20}, 'subcategories': names},
+                user=user)
+    db.session.add_all([user, plan])
+    db.session.flush()
+    user.active_plan_id = plan.id
+    payees = [Payee(name=f"Payee {i}", plan_id=plan.id) for i in range(n_categories)]
+    for category in categories:
+        category.plan_id = plan.id
+    db.session.add_all(categories + payees)
+    db.session.flush()
+
+    for i, category in enumerate(categories):
+        for day in range(1, tx_per_category + 1):
+            db.session.add(Transaction(
+                description=f"Receipt AI: Payee {i}" if day == 1 else 'Lunch', amount=-10.0 * day,
+                category_id=category.id, payee_id=payees[i].id, plan_id=plan.id,
+                transaction_date=datetime(now.year, now.month, day), source_type='receipt' if day == 1 else 'manual'
+            ))
+    db.session.flush()
+    # Fill the counters, rollups and ledger the pages read
+    reconcile_spend(plan_id=plan.id, repair=True)
+    rebuild_rollups(plan_id=plan.id)
+    recompute_rollovers_from(plan, *ledger_start(plan))
+    db.session.commit()
+    return user.id
+
+
+@click.command('check-lazy-loads')
+@click.option('--path', 'paths', multiple=True,
+              help=f"Page to render; repeat for more (default: {', '.join(LAZY_LOAD_PAGES)}).")
+def check_lazy_loads(paths):
+    """Fail if a page lazy-loads a relationship, rendering it with RAISE_ON_LAZY_LOAD on a throwaway database."""
+    # A separate in-memory app, so the sample plan never touches the configured database
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'TESTING': True, 'RAISE_ON_LAZY_LOAD': True})
+    with app.app_context():
+        user_id = _seed_sample_plan()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+    failures = 0
+    for path in paths or LAZY_LOAD_PAGES:
+        # Each request gets its own app context and session, so nothing is already loaded
+        try:
+            response = client.get(path)
+            error = None if response.status_code == 200 else f"HTTP {response.status_code}"
+        except InvalidRequestError as e:
+            error = str(e).splitlines()[0]
+        if error is None:
+            click.echo(f"[ok] {path}")
+        else:
+            click.echo(f"[FAILED] {path}\n    {error}")
+            failures += 1
+
+    if failures:
+        click.echo(f"{failures} page(s) failed with RAISE_ON_LAZY_LOAD.")
+        raise SystemExit(1)
+    click.echo(f"All {len(paths or LAZY_LOAD_PAGES)} pages render without lazy loads.")
+
+
+@click.command('import-statement')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--plan-id', type=int, required=True, help='Plan to import into.')
+@click.option('--category-id', type=int, required=True, help='Category for rows the file does not categorise.')
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ofx', 'qif']), default=None,
+              help='Statement format (default: detect from the file).')
+@click.option('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, show_default=True, help='Rows per commit.')
+@click.option('--expenses-positive', is_flag=True, help='The file lists spending as positive amounts.')
+@with_appcontext
+def import_statement_command(path, plan_id, category_id, file_format, batch_size, expenses_positive):
+    """Import a CSV, OFX or QIF bank statement into a plan."""
+    plan = db.session.get(Plan, plan_id)
+    if not plan:
+        raise click.ClickException(f"No plan with id {plan_id}")
+
+    def report(totals):
+        click.echo(f"batch {totals['batches']}: {totals['rows']} rows read, {totals['imported']} imported")
+
+    with open(path, 'rb') as f:
+        file_format, lines = open_statement(f, path, file_format)
+        try:
+            totals = import_statement(plan, lines, file_format, category_id, batch_size=batch_size,
+                                      positive_is_expense=expenses_positive, progress=report)
+        except StatementError as e:
+            raise click.ClickException(str(e))
+
+    for error in totals['errors']:
+        click.echo(f"  rejected {error}")
+    click.echo(f"Imported {totals['imported']} of {totals['rows']} rows from {file_format.upper()} "
+               f"({totals['skipped_credits']} credits skipped, {totals['rejected']} rejected, "
+               f"{totals['payees_created']} new payees).")
+
+
+@click.command('purge-idempotency-keys')
+@with_appcontext
+def purge_idempotency_keys():
+    """Delete expired idempotency keys (keyed writes also purge them as they go)."""
+    purged = purge_expired_keys()
+    db.session.commit()
+    click.echo(f"Purged {purged} expired idempotency key(s).")
+
+
+def register_commands(app):
+    app.cli.add_command(rebuild_rollovers)
+    app.cli.add_command(reconcile_spend_command)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(check_query_plans)
+    app.cli.add_command(check_lazy_loads)
+    app.cli.add_command(import_statement_command)
+    app.cli.add_command(purge_idempotency_keys)
@@ -3,6 +3,8 @@ from flask_login import UserMixin
 from sqlalchemy.sql import func
 from sqlalchemy.sql import func
 from sqlalchemy.types import JSON
+import hashlib
+import re
 
 # Note model remains the same
 class Note(db.Model):
@@ -17,7 +19,15 @@ class Plan(db.Model):  # Inheritance from SQLAlchemy's declarative base
     name = db.Column(db.String(100), nullable=False)  # Plan name
     monthly_income = db.Column(db.Float)  # User's monthly income
     budget_pref = db.Column(JSON)  # JSON storage for preferences
+    pref_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped when budget_pref subcategories change
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Bumped by every write to the plan's data
+    data_changed_at = db.Column(db.DateTime(timezone=True))  # When data_version was last bumped (UTC)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Foreign key
+
+    def bump_pref_version(self):
+        """Mark the subcategory preferences as changed so lookups cached from them are rebuilt."""
+        self.pref_version = (self.pref_version or 0) + 1
+
 # Budget Category model
 class BudgetCategory(db.Model):  # Child model demonstrating relationships
     id = db.Column(db.Integer, primary_key=True)  # Unique identifier
@@ -26,7 +36,7 @@ class BudgetCategory(db.Model):  # Child model demonstrating relationships
     main_category = db.Column(db.String(50), nullable=False)  # Parent category
     assigned_amount = db.Column(db.Float, default=0.0)  # Budget allocation
     spent_amount = db.Column(db.Float, default=0.0)
-    plan_id = db.Column(db.Integer, db.ForeignKey('plan.id'), nullable=False)  # Links to plan
+    plan_id = db.Column(db.Integer, db.ForeignKey('plan.id'), nullable=False, index=True)  # Links to plan
     created_date = db.Column(db.DateTime(timezone=True), default=func.now())
     
     # Relationship
@@ -61,10 +71,67 @@ class MonthlyBudget(db.Model):
     category = db.relationship('BudgetCategory', backref=db.backref('monthly_budgets', lazy=True, cascade="all, delete-orphan"))
     plan = db.relationship('Plan', backref=db.backref('monthly_budgets', lazy=True, cascade="all, delete-orphan"))
 
+    # One row per category and month; plan/month lookups load a whole month at once
+    __table_args__ = (
+        db.Index('uq_monthly_budget_category_month', 'category_id', 'year', 'month', unique=True),
+        db.Index('ix_monthly_budget_plan_month', 'plan_id', 'year', 'month'),
+    )
+
     @property
     def available_amount(self):
         return self.assigned_amount - self.spent_amount
 
+# Spending per category and month (sum, count, smallest and largest amount, all
+# positive), kept in step with the transactions in the same commit as every
+# write, so analytics over months and years read one row per category and month
+# instead of the transactions themselves. See utils/rollups.py.
+class MonthlyCategoryRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Integer, nullable=False)  # 1-12
+    year = db.Column(db.Integer, nullable=False)
+
+    total_amount = db.Column(db.Float, nullable=False, default=0.0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    min_amount = db.Column(db.Float, nullable=False)
+    max_amount = db.Column(db.Float, nullable=False)
+
+    # Foreign keys
+    category_id = db.Column(db.Integer, db.ForeignKey('budget_category.id'), nullable=False)
+    plan_id = db.Column(db.Integer, db.ForeignKey('plan.id'), nullable=False)
+
+    # Relationships
+    category = db.relationship('BudgetCategory', backref=db.backref('monthly_rollups', lazy=True, cascade="all, delete-orphan"))
+    plan = db.relationship('Plan', backref=db.backref('monthly_rollups', lazy=True, cascade="all, delete-orphan"))
+
+    # One row per category and month; analytics read a plan's months in a range
+    __table_args__ = (
+        db.Index('uq_monthly_category_rollup_category_month', 'category_id', 'year', 'month', unique=True),
+        db.Index('ix_monthly_category_rollup_plan_month', 'plan_id', 'year', 'month'),
+    )
+
+# The same per category and day (sum and count), for charts finer than a month.
+# Maintained alongside MonthlyCategoryRollup, see utils/rollups.py.
+class DailyCategoryRollup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    date = db.Column(db.Date, nullable=False)
+
+    total_amount = db.Column(db.Float, nullable=False, default=0.0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+
+    # Foreign keys
+    category_id = db.Column(db.Integer, db.ForeignKey('budget_category.id'), nullable=False)
+    plan_id = db.Column(db.Integer, db.ForeignKey('plan.id'), nullable=False)
+
+    # Relationships
+    category = db.relationship('BudgetCategory', backref=db.backref('daily_rollups', lazy=True, cascade="all, delete-orphan"))
+    plan = db.relationship('Plan', backref=db.backref('daily_rollups', lazy=True, cascade="all, delete-orphan"))
+
+    # One row per category and day; trend charts read a plan's days in a range
+    __table_args__ = (
+        db.Index('uq_daily_category_rollup_category_date', 'category_id', 'date', unique=True),
+        db.Index('ix_daily_category_rollup_plan_date', 'plan_id', 'date'),
+    )
+
 # Rollover model to store leftover money from a month
 class MonthlyRollover(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -78,6 +145,10 @@ class MonthlyRollover(db.Model):
     # Relationships
     plan = db.relationship('Plan', backref=db.backref('rollovers', lazy=True, cascade="all, delete-orphan"))
 
+    __table_args__ = (
+        db.Index('ix_monthly_rollover_plan_month', 'plan_id', 'year', 'month'),
+    )
+
 # Additional Income model to track extra income added to specific months
 class AdditionalIncome(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -93,16 +164,36 @@ class AdditionalIncome(db.Model):
     # Relationships
     plan = db.relationship('Plan', backref=db.backref('additional_incomes', lazy=True, cascade="all, delete-orphan"))
 
+    __table_args__ = (
+        db.Index('ix_additional_income_plan_month', 'plan_id', 'year', 'month'),
+    )
+
 # Transaction model
 class Payee(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    plan_id = db.Column(db.Integer, db.ForeignKey('plan.id'), nullable=False)
+    plan_id = db.Column(db.Integer, db.ForeignKey('plan.id'), nullable=False, index=True)
     created_date = db.Column(db.DateTime(timezone=True), default=func.now())
 
     plan = db.relationship('Plan', backref=db.backref('payees', lazy=True, cascade="all, delete-orphan"))
 
 
+def transaction_fingerprint(description, amount):
+    """
+    Duplicate-detection key for a transaction: its description with case, punctuation
+    and spacing normalised, plus its absolute amount in cents, hashed to 16 hex chars.
+    """
+    words = re.findall(r'\w+', (description or '').lower())
+    cents = round(abs(amount or 0) * 100)
+    return hashlib.sha1(f"{cents}:{' '.join(words)}".encode('utf-8')).hexdigest()[:16]
+
+
+def _fingerprint_default(context):
+    # Column default, so ORM adds and Core inserts (the statement importer) both fill it
+    params = context.get_current_parameters()
+    return transaction_fingerprint(params.get('description'), params.get('amount'))
+
+
 class Transaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     description = db.Column(db.String(200), nullable=False)
@@ -116,12 +207,47 @@ class Transaction(db.Model):
     # Transaction source
     source_type = db.Column(db.String(20), default='manual')  # 'manual', 'receipt'
     user_notes = db.Column(db.Text, nullable=True)  # User's payment notes for categorization
+    fingerprint = db.Column(db.String(16), default=_fingerprint_default)  # transaction_fingerprint(), for duplicate checks
 
     
     # Relationships
     plan = db.relationship('Plan', backref=db.backref('transactions', lazy=True, cascade="all, delete-orphan"))
     payee = db.relationship('Payee', backref=db.backref('transactions', lazy=True))
 
+    # Spend queries filter by plan or category plus a transaction_date range;
+    # transaction lists page through a plan in (transaction_date, id) order;
+    # duplicate checks probe one fingerprint within a recent date window
+    __table_args__ = (
+        db.Index('ix_transaction_plan_date_id', 'plan_id', 'transaction_date', 'id'),
+        db.Index('ix_transaction_category_date', 'category_id', 'transaction_date'),
+        db.Index('ix_transaction_payee_date', 'payee_id', 'transaction_date'),
+        db.Index('ix_transaction_plan_fingerprint_date', 'plan_id', 'fingerprint', 'transaction_date'),
+    )
+
+
+
+# A client-supplied Idempotency-Key for a transaction-creating request, kept with
+# the transaction it created and the response sent, so a retry of the request is
+# answered from here instead of writing again. Keys are per user and expire after
+# utils/idempotency.IDEMPOTENCY_TTL.
+class IdempotencyKey(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(255), nullable=False)
+    endpoint = db.Column(db.String(100), nullable=False)  # Flask endpoint the key was used on
+    request_hash = db.Column(db.String(64), nullable=False)  # sha256 of the request body
+    response_body = db.Column(JSON, nullable=False)
+    created_date = db.Column(db.DateTime(timezone=True), default=func.now())
+    expires_at = db.Column(db.DateTime(timezone=True), nullable=False)  # UTC
+
+    # Foreign keys
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.id', ondelete='SET NULL'), nullable=True)
+
+    # One lookup per (user, key); expired keys are purged by expires_at
+    __table_args__ = (
+        db.Index('uq_idempotency_key_user_key', 'user_id', 'key', unique=True),
+        db.Index('ix_idempotency_key_expires_at', 'expires_at'),
+    )
 
 
 # User model updated for multi-plan support
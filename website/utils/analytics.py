@@ -0,0 +1,251 @@
+import math
+from datetime import date, timedelta
+import numpy as np
+from sqlalchemy import case, func
+from .. import db
+from ..models import BudgetCategory, DailyCategoryRollup, MonthlyCategoryRollup, Transaction
+from .columnar import encode_column
+from .dates import in_month
+
+# Spending aggregates for the reflect page. Per-category and per-month
+# figures read the monthly rollups (utils/rollups.py), one row per category
+# and month, so a year of history is a few hundred rows whatever the number of
+# transactions. Daily series are finer than the rollups and GROUP BY the one
+# month's transactions, a single index range (see dates.py); extract() is
+# only used to group.
+#
+# The daily chart series (per main category, total, cumulative and rolling)
+# are computed together by daily_series(), one numpy bincount over parallel
+# day / main category / amount columns. Those columns come from SQLite
+# already summed per day and main category: fetching one row per transaction
+# into Python costs far more than the arithmetic saves.
+#
+# Trend series over arbitrary ranges (trend_series(), /api/analytics/trend)
+# never touch the transactions: days and weeks sum the daily rollups, months
+# the monthly ones. A range with more buckets than the caller asked for is
+# downsampled by moving up to weeks, then months, then groups of months, so
+# a 5-year range reads about as many rows as a short one.
+#
+# Amounts are returned as positive spending, like the spend counters.
+
+SPEND = func.sum(func.abs(Transaction.amount))
+
+# Main categories, in the order of daily_series()' rows
+MAIN_CATEGORIES = ('needs', 'wants', 'investments')
+
+# Days in the trailing mean of daily_series()' 'rolling' series
+ROLLING_DAYS = 7
+
+# trend_series() granularities, finest first, and its groupings
+GRANULARITIES = ('day', 'week', 'month')
+TREND_GROUPS = ('main', 'category')
+
+
+def _month_number(year, month):
+    return int(year) * 12 + int(month) - 1
+
+
+def category_totals_query(plan_id, year, month):
+    """Query behind category_totals()."""
+    return db.session.query(
+        BudgetCategory.name, BudgetCategory.main_category, MonthlyCategoryRollup.total_amount
+    ).join(
+        BudgetCategory, MonthlyCategoryRollup.category_id == BudgetCategory.id
+    ).filter(
+        MonthlyCategoryRollup.plan_id == plan_id,
+        MonthlyCategoryRollup.year == int(year),
+        MonthlyCategoryRollup.month == int(month)
+    ).order_by(BudgetCategory.id)
+
+
+def category_totals(plan_id, year, month):
+    """(category name, main category, spent) per category with spending in the month, oldest category first."""
+    return category_totals_query(plan_id, year, month).all()
+
+
+def daily_columns_query(plan_id, year, month):
+    """Query behind daily_columns(): (day, main category index, spent) rows."""
+    day = func.extract('day', Transaction.transaction_date)
+    main_index = case(
+        {name: index for index, name in enumerate(MAIN_CATEGORIES)},
+        value=BudgetCategory.main_category, else_=len(MAIN_CATEGORIES)
+    )
+    return db.session.query(
+        day, main_index, SPEND
+    ).join(
+        BudgetCategory, Transaction.category_id == BudgetCategory.id
+    ).filter(
+        Transaction.plan_id == plan_id,
+        in_month(Transaction.transaction_date, year, month)
+    ).group_by(day, main_index)
+
+
+def daily_columns(plan_id, year, month):
+    """
+    (days, main category indexes, amounts) numpy columns for daily_series(), one entry
+    per day and main category with spending in the month. Main categories outside
+    MAIN_CATEGORIES get index len(MAIN_CATEGORIES).
+    """
+    rows = daily_columns_query(plan_id, year, month).all()
+    columns = np.array(rows, dtype=float).reshape(-1, 3)
+    return columns[:, 0].astype(np.intp), columns[:, 1].astype(np.intp), columns[:, 2]
+
+
+def daily_series(days, main_indexes, amounts, days_in_month, rolling_days=ROLLING_DAYS):
+    """
+    Every daily series of a month in one vectorised pass. days (1-based), main_indexes
+    (into MAIN_CATEGORIES) and amounts are parallel columns; rows may be single
+    transactions or pre-summed groups, bincount adds up repeats.
+
+    Returns numpy arrays of days_in_month values: 'total', 'cumulative', 'rolling' (mean
+    of the trailing rolling_days days, fewer at the start of the month) and
+    'by_main_category' {name: series}. Unknown main categories count in the total only.
+    """
+    groups = len(MAIN_CATEGORIES) + 1
+    cells = np.asarray(main_indexes, dtype=np.intp) * days_in_month + np.asarray(days, dtype=np.intp) - 1
+    grid = np.bincount(
+        cells, weights=np.abs(np.asarray(amounts, dtype=float)), minlength=groups * days_in_month
+    ).reshape(groups, days_in_month)
+
+    total = grid.sum(axis=0)
+    cumulative = np.cumsum(total)
+    trailing = cumulative.copy()
+    trailing[rolling_days:] -= cumulative[:-rolling_days]
+    rolling = trailing / np.minimum(np.arange(1, days_in_month + 1), rolling_days)
+    return {
+        'total': total,
+        'cumulative': cumulative,
+        'rolling': rolling,
+        'by_main_category': dict(zip(MAIN_CATEGORIES, grid)),
+    }
+
+
+def monthly_totals_query(plan_id, first_month, last_month):
+    """Query behind monthly_totals()."""
+    rollup = MonthlyCategoryRollup
+    month_number = rollup.year * 12 + rollup.month - 1
+    return db.session.query(rollup.year, rollup.month, func.sum(rollup.total_amount)).filter(
+        rollup.plan_id == plan_id,
+        month_number.between(_month_number(*first_month), _month_number(*last_month))
+    ).group_by(rollup.year, rollup.month)
+
+
+def monthly_totals(plan_id, first_month, last_month):
+    """{(year, month): spent} for the months with spending from first_month to last_month, (year, month) pairs inclusive."""
+    rows = monthly_totals_query(plan_id, first_month, last_month).all()
+    return {(year, month): spent for year, month, spent in rows}
+
+
+def largest_transaction(plan_id):
+    """The largest amount the plan has ever spent in one transaction, 0 without any."""
+    return db.session.query(func.max(MonthlyCategoryRollup.max_amount)).filter(
+        MonthlyCategoryRollup.plan_id == plan_id
+    ).scalar() or 0
+
+
+def _bucket_count(start, end, granularity):
+    if granularity == 'day':
+        return (end - start).days + 1
+    if granularity == 'week':
+        return (end - start).days // 7 + 1
+    return _month_number(end.year, end.month) - _month_number(start.year, start.month) + 1
+
+
+def _align(start, end, granularity):
+    """start and end widened to whole buckets: weeks run Monday to Sunday, months 1st to last day."""
+    if granularity == 'week':
+        start -= timedelta(days=start.weekday())
+        end = date.fromordinal(min(end.toordinal() + 6 - end.weekday(), date.max.toordinal()))
+    elif granularity == 'month':
+        start = start.replace(day=1)
+        end = date(end.year, 12, 31) if end.month == 12 else date(end.year, end.month + 1, 1) - timedelta(days=1)
+    return start, end
+
+
+def trend_rows_query(plan_id, first, last, granularity, group):
+    """
+    Query behind trend_series(): (period, *group keys, spent) rows from the rollups for
+    first to last, whole buckets of granularity. Periods are dates, or month numbers
+    for granularity='month'.
+    """
+    if group == 'main':
+        keys = (BudgetCategory.main_category,)
+    else:
+        keys = (BudgetCategory.id, BudgetCategory.name, BudgetCategory.main_category)
+    if granularity == 'month':
+        rollup = MonthlyCategoryRollup
+        period = rollup.year * 12 + rollup.month - 1
+        in_range = period.between(_month_number(first.year, first.month), _month_number(last.year, last.month))
+    else:
+        rollup = DailyCategoryRollup
+        period = rollup.date
+        in_range = rollup.date.between(first, last)
+    return db.session.query(period, *keys, func.sum(rollup.total_amount)).join(
+        BudgetCategory, rollup.category_id == BudgetCategory.id
+    ).filter(
+        rollup.plan_id == plan_id, in_range
+    ).group_by(period, *keys)
+
+
+def trend_series(plan_id, start, end, granularity='day', group='main', max_points=120, delta=False):
+    """
+    Spending from start to end (dates, inclusive) per bucket of granularity, one series
+    per main category (group='main') or category (group='category'), read from the rollups.
+
+    Ranges that would take more than max_points buckets are downsampled: the next coarser
+    granularity is used, and past months each bucket spans 'step' months. start and end
+    are widened to whole buckets and returned as 'from' and 'to'; 'buckets' holds each
+    bucket's first day. The values are chart columns, delta-encoded with delta=True
+    (see utils/columnar.py).
+    """
+    requested = granularity
+    for granularity in GRANULARITIES[GRANULARITIES.index(requested):]:
+        first, last = _align(start, end, granularity)
+        count = _bucket_count(first, last, granularity)
+        if count <= max_points:
+            break
+    step = math.ceil(count / max_points) if granularity == 'month' else 1
+    points = math.ceil(count / step)
+
+    # One row per (period, group) from the rollups
+    rows = trend_rows_query(plan_id, first, last, granularity, group).all()
+
+    # The series: main categories in their usual order, categories oldest first
+    found = sorted({tuple(row[1:-1]) for row in rows})
+    if group == 'main':
+        found = [(name,) for name in MAIN_CATEGORIES] + sorted(key for key in found if key[0] not in MAIN_CATEGORIES)
+    index = {key: position for position, key in enumerate(found)}
+
+    if granularity == 'month':
+        offsets = np.array([row[0] for row in rows], dtype=np.intp) - _month_number(first.year, first.month)
+        buckets = offsets // step
+        starts = [date(number // 12, number % 12 + 1, 1) for number in
+                  range(_month_number(first.year, first.month), _month_number(last.year, last.month) + 1, step)]
+    else:
+        days = 7 if granularity == 'week' else 1
+        offsets = np.array([(row[0] - first).days for row in rows], dtype=np.intp)
+        buckets = offsets // days
+        starts = [first + timedelta(days=days * bucket) for bucket in range(points)]
+    series = np.array([index[tuple(row[1:-1])] for row in rows], dtype=np.intp)
+    grid = np.bincount(
+        series * points + buckets, weights=np.array([row[-1] for row in rows], dtype=float),
+        minlength=len(found) * points
+    ).reshape(len(found), points)
+
+    return {
+        'from': first.isoformat(),
+        'to': last.isoformat(),
+        'granularity': granularity,
+        'requested_granularity': requested,
+        'step': step,
+        'downsampled': granularity != requested or step > 1,
+        'group': group,
+        'encoding': 'delta' if delta else 'plain',
+        'buckets': [day.isoformat() for day in starts],
+        'series': [
+            {'key': key[0], 'name': key[0], 'values': encode_column(values, delta)} if group == 'main' else
+            {'key': key[0], 'name': key[1], 'main_category': key[2], 'values': encode_column(values, delta)}
+            for key, values in zip(found, grid)
+        ],
+        'total': encode_column(grid.sum(axis=0), delta),
+    }
@@ -0,0 +1,33 @@
+import numpy as np
+
+# Columnar chart payloads. Chart data goes to the browser as one array per
+# column (the x axis once, then the y values of each series) instead of a
+# list of {'day': d, 'amount': x} objects, which repeats every key on every
+# point. Values are rounded to what the charts show.
+#
+# A column can also be delta-encoded: fixed-point integers (the value times
+# scale), each stored as the difference from the previous one. Days, weeks
+# and cumulative series become runs of small numbers; the client rebuilds
+# them with a running sum (decodeColumn() in reflect.html):
+#
+#   [1, 2, 3, 4]           -> {'delta': [1, 1, 1, 1], 'scale': 1}
+#   [10.5, 12.25, 12.25]   -> {'delta': [1050, 175, 0], 'scale': 100}
+
+ENCODINGS = ('plain', 'delta')
+
+
+def encode_column(values, delta=False, decimals=2):
+    """values (a list or numpy array) as a chart column: a plain list, or a delta-encoded dict with delta=True."""
+    values = np.asarray(values, dtype=float)
+    if not delta:
+        return values.round(decimals).tolist() if decimals else values.astype(np.int64).tolist()
+    scale = 10 ** decimals
+    fixed = np.rint(values * scale).astype(np.int64)
+    return {'delta': np.diff(fixed, prepend=0).tolist(), 'scale': scale}
+
+
+def decode_column(column):
+    """The values of a column made by encode_column(), as a list."""
+    if isinstance(column, list):
+        return column
+    return (np.cumsum(column['delta']) / column['scale']).tolist()
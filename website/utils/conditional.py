@@ -0,0 +1,67 @@
+import hashlib
+from datetime import date
+from functools import wraps
+from flask import current_app, request, session, make_response
+from flask_login import current_user
+from .request_cache import active_plan
+
+# Conditional GET for pages and JSON APIs. The ETag is derived from the
+# active plan's data_version (utils/data_version.py), so checking whether the
+# client's copy is current costs the user and plan lookups every request
+# needs anyway, and a match answers 304 before the view runs any queries.
+#
+# Pages also render things that are not plan data (the user's theme and
+# email, the current date for the default month, the deployed templates), so
+# those go into their ETag too. Last-Modified only tracks plan data, which is
+# why If-Modified-Since is honoured for JSON only.
+
+
+def plan_etag(plan, html=False):
+    parts = [plan.id, plan.data_version or 0, request.full_path, current_app.config.get('ETAG_SALT', '')]
+    if html:
+        parts += [current_user.id, current_user.email, current_user.theme, current_user.profile_complete,
+                  date.today().isoformat()]
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def _not_modified(plan, etag, html):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if not html and request.if_modified_since and plan.data_changed_at:
+        # HTTP dates have whole-second precision, so a second write within the same second
+        # goes unnoticed here; clients that send the ETag (browsers do) never rely on this
+        return plan.data_changed_at.replace(microsecond=0, tzinfo=None) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def conditional_get(html=False):
+    """
+    Decorator answering GETs with 304 Not Modified when the client already has
+    the current version, and tagging fresh 200 responses with ETag/Last-Modified.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            plan = active_plan() if request.method == 'GET' else None
+            # A response showing flash messages is a one-off, never reuse it
+            if plan is None or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            etag = plan_etag(plan, html)
+            if _not_modified(plan, etag, html):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if plan.data_changed_at:
+                response.last_modified = plan.data_changed_at
+            # Browsers keep the copy but must revalidate before every use
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,129 @@
+from collections import defaultdict
+from sqlalchemy import func
+from .. import db
+from ..models import BudgetCategory, MonthlyBudget, Transaction
+
+# Spend counters: MonthlyBudget.spent_amount holds a category's spending for
+# one month and BudgetCategory.spent_amount its lifetime spending, both as
+# positive numbers. They are adjusted by delta in the same unit of work as the
+# transaction write, so reading spend is a row lookup instead of a SUM.
+
+
+def budget_row_query(plan_id, category_id, year, month):
+    """Query for the MonthlyBudget row of one category and month (there is at most one)."""
+    return MonthlyBudget.query.filter_by(plan_id=plan_id, category_id=category_id, month=month, year=year)
+
+
+def budget_rows_query(plan_id, category_ids, first_year, last_year):
+    """Query for the MonthlyBudget rows of some categories from first_year to last_year."""
+    return MonthlyBudget.query.filter(
+        MonthlyBudget.plan_id == plan_id,
+        MonthlyBudget.category_id.in_(category_ids),
+        MonthlyBudget.year.between(first_year, last_year)
+    )
+
+
+def apply_spend_delta(plan_id, category_id, when, delta):
+    """Add delta to a category's monthly and lifetime spend counters. The caller commits."""
+    if not delta:
+        return
+
+    mb = budget_row_query(plan_id, category_id, when.year, when.month).first()
+    if mb:
+        # SQL-side increment so concurrent writers don't overwrite each other
+        mb.spent_amount = func.coalesce(MonthlyBudget.spent_amount, 0) + delta
+    else:
+        db.session.add(MonthlyBudget(
+            plan_id=plan_id, category_id=category_id, month=when.month, year=when.year,
+            assigned_amount=0, spent_amount=delta
+        ))
+
+    category = db.session.get(BudgetCategory, category_id)
+    if category:
+        category.spent_amount = func.coalesce(BudgetCategory.spent_amount, 0) + delta
+
+
+def apply_spend_deltas(plan_id, deltas):
+    """
+    Batch form of apply_spend_delta() for many transactions at once.
+    deltas maps (category_id, year, month) to the amount to add. The caller commits.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    category_ids = {category_id for category_id, _, _ in deltas}
+    years = [year for _, year, _ in deltas]
+    existing = {
+        (mb.category_id, mb.year, mb.month): mb
+        for mb in budget_rows_query(plan_id, category_ids, min(years), max(years)).all()
+    }
+
+    lifetime = defaultdict(float)
+    for (category_id, year, month), delta in deltas.items():
+        lifetime[category_id] += delta
+        mb = existing.get((category_id, year, month))
+        if mb:
+            mb.spent_amount = func.coalesce(MonthlyBudget.spent_amount, 0) + delta
+        else:
+            db.session.add(MonthlyBudget(
+                plan_id=plan_id, category_id=category_id, month=month, year=year,
+                assigned_amount=0, spent_amount=delta
+            ))
+
+    for category in BudgetCategory.query.filter(BudgetCategory.id.in_(category_ids)).all():
+        category.spent_amount = func.coalesce(BudgetCategory.spent_amount, 0) + lifetime[category.id]
+
+
+def count_transaction(transaction, sign=1):
+    """Add (sign=1) or remove (sign=-1) a transaction's amount from the spend counters."""
+    apply_spend_delta(transaction.plan_id, transaction.category_id, transaction.transaction_date,
+                      sign * abs(transaction.amount))
+
+
+def reconcile_spend(plan_id=None, repair=False, tolerance=0.005):
+    """
+    Compare the spend counters with the transactions they summarise.
+    Returns a list of (kind, category_id, year, month, stored, actual) drift rows
+    (year/month are None for the lifetime counter). With repair=True the
+    counters are corrected; the caller commits.
+    """
+    month_expr = (func.extract('year', Transaction.transaction_date), func.extract('month', Transaction.transaction_date))
+    query = db.session.query(
+        Transaction.plan_id, Transaction.category_id, *month_expr, func.sum(func.abs(Transaction.amount))
+    ).group_by(Transaction.plan_id, Transaction.category_id, *month_expr)
+    if plan_id:
+        query = query.filter(Transaction.plan_id == plan_id)
+
+    actual_monthly = {}
+    actual_lifetime = defaultdict(float)
+    for row_plan_id, category_id, year, month, total in query.all():
+        actual_monthly[(category_id, int(year), int(month))] = (row_plan_id, total or 0)
+        actual_lifetime[category_id] += total or 0
+
+    drift = []
+
+    budgets = MonthlyBudget.query.filter_by(plan_id=plan_id).all() if plan_id else MonthlyBudget.query.all()
+    for mb in budgets:
+        _, actual = actual_monthly.pop((mb.category_id, mb.year, mb.month), (mb.plan_id, 0))
+        if abs((mb.spent_amount or 0) - actual) > tolerance:
+            drift.append(('monthly', mb.category_id, mb.year, mb.month, mb.spent_amount, actual))
+            if repair:
+                mb.spent_amount = actual
+    # Months with spending but no MonthlyBudget row at all
+    for (category_id, year, month), (row_plan_id, actual) in actual_monthly.items():
+        if abs(actual) > tolerance:
+            drift.append(('monthly', category_id, year, month, None, actual))
+            if repair:
+                db.session.add(MonthlyBudget(plan_id=row_plan_id, category_id=category_id, month=month, year=year,
+                                             assigned_amount=0, spent_amount=actual))
+
+    categories = BudgetCategory.query.filter_by(plan_id=plan_id).all() if plan_id else BudgetCategory.query.all()
+    for category in categories:
+        actual = actual_lifetime.get(category.id, 0)
+        if abs((category.spent_amount or 0) - actual) > tolerance:
+            drift.append(('lifetime', category.id, None, None, category.spent_amount, actual))
+            if repair:
+                category.spent_amount = actual
+
+    return drift
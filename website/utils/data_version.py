@@ -0,0 +1,96 @@
+from datetime import datetime, timezone
+from itertools import chain
+from sqlalchemy import event, update
+from sqlalchemy.orm.util import identity_key
+from .. import db
+from ..models import Plan, BudgetCategory, MonthlyBudget, MonthlyRollover, AdditionalIncome, Payee, Transaction
+
+# Plan.data_version counts the writes to a plan's data, and
+# Plan.data_changed_at records when the last one happened. Anything cached
+# from a plan (rendered page fragments, HTTP ETags) is keyed by the version,
+# so a bump is all it takes to invalidate.
+#
+# A flush bumps the version of each plan it touches: new, changed or deleted
+# rows of the plan-owned models below, and changes to the Plan row itself
+# (settings). A transaction commits as a whole, so each plan is bumped at
+# most once per transaction however often it autoflushes. Bulk statements
+# such as Query.delete() skip the flush, so callers using them bump
+# explicitly with bump_data_version().
+
+PLAN_OWNED_MODELS = (BudgetCategory, MonthlyBudget, MonthlyRollover, AdditionalIncome, Payee, Transaction)
+
+
+def _owning_plan_id(obj):
+    if isinstance(obj, Plan):
+        return obj.id
+    if obj.plan_id is not None:
+        return obj.plan_id
+    plan = getattr(obj, 'plan', None)
+    return plan.id if plan is not None else None
+
+
+def _changed_plan_ids(session):
+    plan_ids = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(obj, (Plan,) + PLAN_OWNED_MODELS):
+            continue
+        # session.dirty also holds objects whose attributes were set to the same value
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        plan_id = _owning_plan_id(obj)
+        if plan_id is not None:
+            plan_ids.add(plan_id)
+    return plan_ids
+
+
+def bump_data_version(*plan_ids, session=None):
+    """Increment data_version for the given plans, once per transaction. Runs in the caller's transaction."""
+    session = session or db.session
+    bumped = session.info.setdefault('bumped_plan_ids', set())
+    plan_ids = {plan_id for plan_id in plan_ids if plan_id is not None} - bumped
+    if not plan_ids:
+        return
+
+    table = Plan.__table__
+    session.connection().execute(
+        update(table).where(table.c.id.in_(plan_ids)).values(
+            data_version=table.c.data_version + 1,
+            data_changed_at=datetime.now(timezone.utc)
+        )
+    )
+    # Loaded Plan objects re-read the new values on next access
+    for plan_id in plan_ids:
+        plan = session.identity_map.get(identity_key(Plan, plan_id))
+        if plan is not None:
+            session.expire(plan, ['data_version', 'data_changed_at'])
+    bumped.update(plan_ids)
+
+
+def _collect_changed_plans(session, flush_context, instances):
+    session.info.setdefault('changed_plan_ids', set()).update(_changed_plan_ids(session))
+
+
+def _bump_changed_plans(session, flush_context):
+    plan_ids = session.info.pop('changed_plan_ids', None)
+    if plan_ids:
+        bump_data_version(*plan_ids, session=session)
+
+
+def _end_of_transaction(session, *args):
+    session.info.pop('changed_plan_ids', None)
+    session.info.pop('bumped_plan_ids', None)
+
+
+_SESSION_LISTENERS = (
+    ('before_flush', _collect_changed_plans),
+    ('after_flush_postexec', _bump_changed_plans),
+    ('after_commit', _end_of_transaction),
+    ('after_soft_rollback', _end_of_transaction),
+)
+
+
+def init_data_version():
+    """Bump plan data versions from the session's flushes (session events are global, so register once)."""
+    for name, listener in _SESSION_LISTENERS:
+        if not event.contains(db.session, name, listener):
+            event.listen(db.session, name, listener)
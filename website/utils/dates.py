@@ -0,0 +1,26 @@
+from datetime import datetime
+from sqlalchemy import and_
+
+# Month filters are written as half-open date ranges
+#
+#     start_of_month <= column < start_of_next_month
+#
+# rather than func.extract('month', column) == month. A range on the bare
+# column can be served by the (plan_id/category_id, transaction_date) indexes;
+# wrapping the column in a function forces a scan of every candidate row.
+
+
+def month_window(year, month):
+    """(start_of_month, start_of_next_month) datetimes for year/month."""
+    start = datetime(int(year), int(month), 1)
+    if start.month == 12:
+        end = datetime(start.year + 1, 1, 1)
+    else:
+        end = datetime(start.year, start.month + 1, 1)
+    return start, end
+
+
+def in_month(column, year, month):
+    """SQL predicate: column falls inside year/month (half-open range)."""
+    start, end = month_window(year, month)
+    return and_(column >= start, column < end)
@@ -0,0 +1,118 @@
+import threading
+from collections import OrderedDict
+from flask import current_app
+from jinja2 import pass_context
+from markupsafe import Markup
+
+# Rendered HTML fragments (summary cards, category tables, chart data) cached
+# per plan and month. A fragment's key includes the plan's data_version
+# (utils/data_version.py), so any write to the plan makes its old fragments
+# unreachable; they are never invalidated explicitly, just evicted once the
+# cache is over its byte budget, least recently used first.
+#
+# Views decide up front whether they need their figures at all:
+#
+#     key = fragment_key(plan, year, month, 'home')
+#     fragments = cached_fragments(key, HOME_FRAGMENTS)   # None unless all are cached
+#     if fragments is None:
+#         ... run the queries ...
+#
+# and templates wrap each fragment in a call block:
+#
+#     {% call cached_fragment('summary') %} ... {% endcall %}
+#
+# The block renders from the `fragments` handed to the template when present,
+# otherwise it renders normally and stores the result under `fragment_key`.
+
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+
+
+class LRUFragmentCache:
+    """Byte-bounded LRU mapping of keys to rendered HTML strings (thread-safe)."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, html):
+        html = str(html)
+        cost = len(html.encode('utf-8'))
+        if cost > self.max_bytes:
+            return  # would evict everything else and still not fit
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (html, cost)
+            self.size += cost
+            while self.size > self.max_bytes:
+                _, (_, evicted_cost) = self._entries.popitem(last=False)
+                self.size -= evicted_cost
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        return {'entries': len(self._entries), 'bytes': self.size, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+def fragment_cache():
+    return current_app.extensions['fragment_cache']
+
+
+def fragment_key(plan, year, month, page):
+    """Cache key for one page's fragments of a plan/month at the plan's current data version."""
+    return (plan.id, int(year), int(month), plan.data_version or 0, page)
+
+
+def cached_fragments(key, names):
+    """{name: html} for every named fragment under key, or None if any of them is missing."""
+    cache = fragment_cache()
+    fragments = {}
+    for name in names:
+        html = cache.get((key, name))
+        if html is None:
+            return None
+        fragments[name] = html
+    return fragments
+
+
+@pass_context
+def cached_fragment(context, name, caller):
+    """Jinja call block: reuse a cached fragment or render the block body and cache it."""
+    fragments = context.get('fragments')
+    if fragments and name in fragments:
+        return Markup(fragments[name])
+
+    html = caller()
+    key = context.get('fragment_key')
+    if key is not None:
+        fragment_cache().set((key, name), html)
+    return Markup(html)
+
+
+def init_fragment_cache(app):
+    app.extensions['fragment_cache'] = LRUFragmentCache(app.config.get('FRAGMENT_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+    app.jinja_env.globals['cached_fragment'] = cached_fragment
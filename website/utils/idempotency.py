@@ -0,0 +1,126 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from flask import g, jsonify, make_response, request
+from flask_login import current_user
+from .. import db
+from ..models import IdempotencyKey
+
+# Idempotency keys for the endpoints that create transactions. A client that
+# may retry a request (mobile apps on flaky connections) sends a unique
+# Idempotency-Key header with it. The first request that succeeds stores the
+# key, in the same commit as the transaction it created, with the response it
+# got; a retry with the same key is answered with that stored response,
+# without writing anything, and carries an Idempotent-Replayed header.
+#
+#   - Keys are per user and live for IDEMPOTENCY_TTL; expired keys are purged
+#     by the next keyed write and can then be used again.
+#   - A key reused with a different request body (or on another endpoint) is
+#     rejected with 422 rather than replayed.
+#   - Failed requests store nothing, so a retry after an error runs again.
+#   - Two copies of a request racing each other both miss the lookup; the one
+#     that commits second fails on the unique (user_id, key) index and is
+#     answered with the winner's stored response.
+#
+# Requests without the header go through the usual duplicate heuristic
+# (views.check_duplicate_transaction) instead.
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+IDEMPOTENCY_TTL = timedelta(hours=24)
+MAX_KEY_LENGTH = 255
+
+
+def stored_key_query(user_id, key):
+    """Query for a user's unexpired IdempotencyKey row for key."""
+    return IdempotencyKey.query.filter(
+        IdempotencyKey.user_id == user_id,
+        IdempotencyKey.key == key,
+        IdempotencyKey.expires_at > datetime.now(timezone.utc)
+    )
+
+
+def _stored_key(key):
+    return stored_key_query(current_user.id, key).first()
+
+
+def _replay(stored, request_hash):
+    if stored.endpoint != request.endpoint or stored.request_hash != request_hash:
+        return jsonify({
+            'success': False,
+            'error': f'This {IDEMPOTENCY_HEADER} was already used for a different request'
+        }), 422
+    response = jsonify(stored.response_body)
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def _failed(response):
+    body = response.get_json(silent=True) or {}
+    return response.status_code >= 400 or body.get('success') is False
+
+
+def purge_expired_keys():
+    """Delete the keys past their expiry (an index range scan). Returns how many went."""
+    return IdempotencyKey.query.filter(
+        IdempotencyKey.expires_at <= datetime.now(timezone.utc)
+    ).delete(synchronize_session=False)
+
+
+def idempotent(view):
+    """
+    Decorator for a login_required JSON view that creates a transaction: honour the
+    Idempotency-Key header. The view stores the key by passing pending_idempotency_key()
+    to record_transaction().
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER, '').strip()
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({
+                'success': False,
+                'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters'
+            }), 400
+
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+        stored = _stored_key(key)
+        if stored:
+            return _replay(stored, request_hash)
+
+        # Goes out with the view's commit, freeing this key if it had expired
+        purge_expired_keys()
+        g.idempotency_key = (key, request_hash)
+        response = make_response(view(*args, **kwargs))
+        if _failed(response):
+            # Lost a race with a copy of this request that committed first
+            stored = _stored_key(key)
+            if stored:
+                return _replay(stored, request_hash)
+        return response
+    return wrapper
+
+
+def idempotency_requested():
+    """True when the current request carries an Idempotency-Key (see idempotent)."""
+    return bool(g.get('idempotency_key'))
+
+
+def pending_idempotency_key(response_body):
+    """
+    The IdempotencyKey to store with the transaction this request creates, or None
+    without a key. response_body holds the success response's fields; record_transaction()
+    adds its result to them.
+    """
+    if not g.get('idempotency_key'):
+        return None
+    key, request_hash = g.idempotency_key
+    return IdempotencyKey(
+        key=key,
+        endpoint=request.endpoint,
+        request_hash=request_hash,
+        response_body=response_body,
+        user_id=current_user.id,
+        expires_at=datetime.now(timezone.utc) + IDEMPOTENCY_TTL
+    )
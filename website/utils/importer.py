@@ -0,0 +1,303 @@
+import csv
+import io
+import re
+from collections import defaultdict
+from datetime import datetime
+from itertools import chain, islice
+from sqlalchemy import func
+from .. import db
+from ..models import Transaction, Payee, BudgetCategory, transaction_fingerprint
+from .counters import apply_spend_deltas
+from .data_version import bump_data_version
+from .ledger import recompute_rollovers_from
+from .rollups import add_to_rollups
+from .search import search_index_enabled, index_new_transactions
+
+# Bank statement import (CSV, OFX, QIF). The file is parsed as a stream, one
+# record at a time, and written in batches: each batch creates its missing
+# payees in one flush, inserts its transactions with a single executemany,
+# applies the spend counter and monthly rollup deltas grouped by category and
+# month, rebuilds the rollover ledger from the batch's earliest month, and
+# commits. Every committed batch leaves the ledger consistent, so an import
+# that fails partway keeps the batches before it, with correct rollovers.
+#
+# Statements list money in and out; the app only tracks spending, so credits
+# (positive amounts) are skipped unless the file lists expenses as positive.
+# Budget limits are not enforced, an import records history as it happened.
+
+DEFAULT_BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 20
+
+CSV_DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d', '%d.%m.%Y')
+QIF_DATE_FORMATS = ('%m/%d/%Y', '%m/%d/%y', '%d/%m/%Y', '%Y-%m-%d')
+
+# Header names banks use for each field, lowercase
+CSV_COLUMNS = {
+    'date': ('date', 'transaction date', 'posted date', 'posting date', 'booking date', 'value date'),
+    'amount': ('amount', 'transaction amount', 'value'),
+    'debit': ('debit', 'withdrawal', 'withdrawals', 'money out', 'paid out'),
+    'credit': ('credit', 'deposit', 'deposits', 'money in', 'paid in'),
+    'description': ('description', 'memo', 'details', 'narrative', 'transaction description', 'reference'),
+    'payee': ('payee', 'merchant', 'name', 'counterparty'),
+    'category': ('category',),
+}
+
+
+class StatementError(ValueError):
+    """The file as a whole can't be imported (unknown format, missing columns, bad options)."""
+
+
+# ── Parsers: yield (line_number, record) with the raw field strings ──
+
+def parse_csv(lines):
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if not header:
+        raise StatementError('The file is empty')
+
+    names = [name.strip().lower() for name in header]
+    positions = {}
+    for field, aliases in CSV_COLUMNS.items():
+        for alias in aliases:
+            if alias in names:
+                positions[field] = names.index(alias)
+                break
+    if 'date' not in positions or not ({'amount', 'debit'} & positions.keys()):
+        raise StatementError('CSV needs a date column and an amount (or debit) column')
+
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        record = {field: row[i].strip() if i < len(row) else '' for field, i in positions.items()}
+        if 'amount' not in record:
+            # Separate debit/credit columns: money out is the expense
+            debit, credit = record.pop('debit', ''), record.pop('credit', '')
+            record['amount'] = f'-{debit}' if debit else credit
+        yield reader.line_num, record
+
+
+_OFX_TOKEN = re.compile(r'<(/?)(\w+)>([^<\r\n]*)')
+
+
+def parse_ofx(lines):
+    # OFX 1.x is SGML without closing tags for values, 2.x is XML (often all on
+    # one line); reading the tags in order handles both
+    record, start = None, None
+    for line_number, line in enumerate(lines, 1):
+        for closing, tag, value in _OFX_TOKEN.findall(line):
+            tag = tag.upper()
+            if tag != 'STMTTRN':
+                if record is not None and not closing and tag in ('DTPOSTED', 'TRNAMT', 'NAME', 'MEMO', 'PAYEE'):
+                    record[tag] = value.strip()
+            elif not closing:
+                record, start = {}, line_number
+            elif record is not None:
+                posted = record.get('DTPOSTED', '')
+                yield start, {
+                    'date': f'{posted[:4]}-{posted[4:6]}-{posted[6:8]}' if len(posted) >= 8 else posted,
+                    'amount': record.get('TRNAMT', ''),
+                    'payee': record.get('NAME') or record.get('PAYEE', ''),
+                    'description': record.get('MEMO', ''),
+                }
+                record = None
+
+
+def parse_qif(lines):
+    record, start = {}, None
+    for line_number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if not line or line.startswith('!'):
+            continue
+        if line.startswith('^'):
+            if record:
+                yield start, record
+            record, start = {}, None
+            continue
+        start = start or line_number
+        code, value = line[0], line[1:].strip()
+        if code == 'D':
+            record['date'] = value.replace("'", '/').replace(' ', '')
+        elif code in ('T', 'U'):
+            record.setdefault('amount', value)
+        elif code == 'P':
+            record['payee'] = value
+        elif code == 'M':
+            record['description'] = value
+        elif code == 'L' and not value.startswith('['):  # [Account] lines are transfers
+            record['category'] = value
+    if record:
+        yield start, record
+
+
+PARSERS = {'csv': parse_csv, 'ofx': parse_ofx, 'qif': parse_qif}
+
+
+def detect_format(filename, first_line=''):
+    """'csv', 'ofx' or 'qif' from the file name, falling back to the first line of the file."""
+    extension = (filename or '').rsplit('.', 1)[-1].lower()
+    if extension in PARSERS:
+        return extension
+    if extension == 'qfx':
+        return 'ofx'
+    head = first_line.lstrip('\ufeff').strip().upper()
+    if head.startswith(('OFXHEADER', '<?XML', '<OFX')):
+        return 'ofx'
+    if head.startswith('!TYPE'):
+        return 'qif'
+    return 'csv'
+
+
+def open_statement(stream, filename=None, file_format=None):
+    """
+    (file_format, lines) for a binary file object, detecting the format when not given.
+    Lines are decoded as UTF-8 (a BOM is dropped) as they are read.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+    first_line = text.readline()
+    file_format = file_format or detect_format(filename, first_line)
+    return file_format, chain([first_line], text)
+
+
+# ── Field conversion ─────────────────────────
+
+def _parse_date(value, formats):
+    if '%Y-%m-%d' in formats:
+        # fromisoformat is many times faster than strptime for the commonest format
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    for date_format in formats:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    raise ValueError(f'unrecognised date {value!r}')
+
+
+def _parse_amount(value):
+    text = value.replace(',', '').replace(' ', '')
+    negative = text.startswith('(') and text.endswith(')')  # accounting style (12.50)
+    text = re.sub(r'[^0-9.\-]', '', text)
+    if not text or text in ('-', '.'):
+        raise ValueError(f'unrecognised amount {value!r}')
+    amount = float(text)
+    return -abs(amount) if negative else amount
+
+
+# ── Import ───────────────────────────────────
+
+def _payee_categories(plan_id):
+    # The category each payee's most recent transaction went to
+    latest = db.session.query(func.max(Transaction.id)).filter(
+        Transaction.plan_id == plan_id, Transaction.payee_id.isnot(None)
+    ).group_by(Transaction.payee_id)
+    rows = db.session.query(Transaction.payee_id, Transaction.category_id).filter(Transaction.id.in_(latest))
+    return dict(rows.all())
+
+
+def import_statement(plan, lines, file_format, default_category_id, batch_size=DEFAULT_BATCH_SIZE,
+                     date_formats=None, positive_is_expense=False, progress=None):
+    """
+    Import the transactions of a statement into plan, committing every batch_size rows.
+
+    lines is an iterable of text lines (an open text file works). Rows are put in the
+    category named in the file, else the category of their payee's latest transaction,
+    else default_category_id. progress, if given, is called with the running totals
+    after each batch. Returns the totals: rows read, imported, skipped credits,
+    rejected rows (with the first few errors), payees created, batches and the
+    imported date range.
+    """
+    if file_format not in PARSERS:
+        raise StatementError(f'Unknown statement format {file_format!r}')
+    categories = BudgetCategory.query.filter_by(plan_id=plan.id).all()
+    category_ids_by_name = {c.name.lower(): c.id for c in categories}
+    if default_category_id not in {c.id for c in categories}:
+        raise StatementError('The default category must belong to the plan')
+    if date_formats is None:
+        date_formats = QIF_DATE_FORMATS if file_format == 'qif' else CSV_DATE_FORMATS
+    plan_id = plan.id
+
+    payee_ids = {p.name.lower(): p.id for p in Payee.query.filter_by(plan_id=plan_id).all()}
+    category_by_payee = _payee_categories(plan_id)
+    totals = {'rows': 0, 'imported': 0, 'skipped_credits': 0, 'rejected': 0, 'errors': [],
+              'payees_created': 0, 'batches': 0, 'first_date': None, 'last_date': None}
+
+    records = PARSERS[file_format](lines)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        totals['rows'] += len(batch)
+
+        parsed = []
+        for line_number, record in batch:
+            try:
+                when = _parse_date(record.get('date', ''), date_formats)
+                amount = _parse_amount(record.get('amount', ''))
+            except ValueError as e:
+                totals['rejected'] += 1
+                if len(totals['errors']) < MAX_REPORTED_ERRORS:
+                    totals['errors'].append(f'line {line_number}: {e}')
+                continue
+            if positive_is_expense:
+                amount = -amount
+            if amount >= 0:
+                totals['skipped_credits'] += 1
+                continue
+            parsed.append((when, amount, record))
+
+        # Payees first, so the transactions can reference them
+        new_payees = {}
+        for _, _, record in parsed:
+            name = (record.get('payee') or '')[:100]
+            if name and name.lower() not in payee_ids and name.lower() not in new_payees:
+                new_payees[name.lower()] = Payee(name=name, plan_id=plan_id)
+        if new_payees:
+            db.session.add_all(new_payees.values())
+            db.session.flush()
+            payee_ids.update((key, payee.id) for key, payee in new_payees.items())
+            totals['payees_created'] += len(new_payees)
+
+        rows = []
+        deltas = defaultdict(float)
+        batch_first = None
+        for when, amount, record in parsed:
+            payee_name = (record.get('payee') or '')[:100]
+            payee_id = payee_ids.get(payee_name.lower()) if payee_name else None
+            category_id = (category_ids_by_name.get((record.get('category') or '').lower())
+                           or category_by_payee.get(payee_id)
+                           or default_category_id)
+            description = (record.get('description') or payee_name or 'Imported transaction')[:200]
+            rows.append({
+                'description': description,
+                'amount': amount,
+                'transaction_date': when,
+                'category_id': category_id,
+                'payee_id': payee_id,
+                'plan_id': plan_id,
+                'source_type': 'import',
+                # Given here rather than by the column default, which executemany would run per row
+                'fingerprint': transaction_fingerprint(description, amount),
+            })
+            deltas[(category_id, when.year, when.month)] += abs(amount)
+            batch_first = min(batch_first or when, when)
+            totals['first_date'] = min(totals['first_date'] or when, when)
+            totals['last_date'] = max(totals['last_date'] or when, when)
+
+        if rows:
+            # Core executemany: no ORM objects or RETURNING needed for rows nothing reads back
+            db.session.execute(Transaction.__table__.insert(), rows)
+            if search_index_enabled():
+                index_new_transactions(db.session.connection())
+            apply_spend_deltas(plan_id, deltas)
+            add_to_rollups(plan_id, ((row['category_id'], row['transaction_date'], row['amount']) for row in rows))
+            recompute_rollovers_from(plan, batch_first.year, batch_first.month)
+            bump_data_version(plan_id)  # the bulk insert skips the flush that would bump it
+        db.session.commit()
+        totals['imported'] += len(rows)
+        totals['batches'] += 1
+        if progress:
+            progress(dict(totals))
+
+    return totals
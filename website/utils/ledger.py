@@ -0,0 +1,143 @@
+from datetime import datetime
+from sqlalchemy import func
+from .. import db
+from ..models import MonthlyBudget, AdditionalIncome, MonthlyRollover, User
+from .snapshot import filter_visible_categories
+from .request_cache import plan_categories
+
+# The rollover ledger keeps one MonthlyRollover row per plan and month holding
+# the month's closing balance (its "leftover"):
+#
+#     leftover = monthly_income + additional_income + rollover_in - spent
+#
+# Assigned money cancels out of the dashboard formula, so only spending and
+# income move the ledger. rollover_in is the previous month's leftover, or zero
+# in the plan owner's first month. Rows are kept contiguous from that first
+# month up to the current month (or the last month with activity, if later).
+
+
+def _month_index(year, month):
+    return year * 12 + month - 1
+
+
+def _from_index(index):
+    year, month = divmod(index, 12)
+    return year, month + 1
+
+
+def ledger_start(plan):
+    """(year, month) the plan's ledger starts at: the month its owner joined."""
+    # session.get() is served from the identity map when the owner is the logged-in user
+    join_date = db.session.get(User, plan.user_id).date_created or datetime.now()
+    return join_date.year, join_date.month
+
+
+def month_spend_query(plan_id, category_ids, start_index):
+    """Query for (year, month, spent) of some categories per month, from month index start_index onwards."""
+    # Monthly spend comes from the MonthlyBudget counters (see utils/counters.py)
+    budget_month = MonthlyBudget.year * 12 + MonthlyBudget.month - 1
+    return db.session.query(
+        MonthlyBudget.year, MonthlyBudget.month, func.sum(MonthlyBudget.spent_amount)
+    ).filter(
+        MonthlyBudget.plan_id == plan_id,
+        MonthlyBudget.category_id.in_(category_ids),
+        budget_month >= start_index
+    ).group_by(MonthlyBudget.year, MonthlyBudget.month)
+
+
+def rollover_row_query(plan_id, year, month):
+    """Query for the plan's ledger row of one month."""
+    return MonthlyRollover.query.filter_by(plan_id=plan_id, year=year, month=month)
+
+
+def last_rollover_query(plan_id, first_index, before_index):
+    """Query for the plan's ledger rows from month index first_index up to before_index (exclusive), latest first."""
+    month_index = MonthlyRollover.year * 12 + MonthlyRollover.month - 1
+    return MonthlyRollover.query.filter(
+        MonthlyRollover.plan_id == plan_id,
+        month_index >= first_index,
+        month_index < before_index
+    ).order_by(MonthlyRollover.year.desc(), MonthlyRollover.month.desc())
+
+
+def _monthly_activity(plan, start_index):
+    """Spent (visible categories only) and additional income per month index, from start_index onwards."""
+    visible_ids = [c.id for c in filter_visible_categories(plan, plan_categories(plan.id))]
+
+    spent = {}
+    if visible_ids:
+        rows = month_spend_query(plan.id, visible_ids, start_index).all()
+        spent = {_month_index(y, m): total or 0 for y, m, total in rows}
+
+    month_index = AdditionalIncome.year * 12 + AdditionalIncome.month - 1
+    rows = db.session.query(
+        AdditionalIncome.year, AdditionalIncome.month, func.sum(AdditionalIncome.amount)
+    ).filter(
+        AdditionalIncome.plan_id == plan.id,
+        month_index >= start_index
+    ).group_by(AdditionalIncome.year, AdditionalIncome.month).all()
+    income = {_month_index(y, m): total or 0 for y, m, total in rows}
+
+    return spent, income
+
+
+def recompute_rollovers_from(plan, year, month):
+    """
+    Rewrite the plan's ledger from year/month onwards after something in that
+    month changed. Earlier months are left untouched. The caller commits.
+    """
+    first_index = _month_index(*ledger_start(plan))
+    start_index = max(_month_index(year, month), first_index)
+
+    opening_balance = 0.0
+    if start_index > first_index:
+        prev_year, prev_month = _from_index(start_index - 1)
+        previous = rollover_row_query(plan.id, prev_year, prev_month).first()
+        if previous:
+            opening_balance = previous.amount
+        else:
+            # Earlier months were never recorded, so rebuild the whole ledger
+            start_index = first_index
+
+    spent, income = _monthly_activity(plan, start_index)
+    now = datetime.now()
+    end_index = max([start_index, _month_index(now.year, now.month)] + list(spent) + list(income))
+
+    month_index = MonthlyRollover.year * 12 + MonthlyRollover.month - 1
+    existing = {
+        _month_index(row.year, row.month): row
+        for row in MonthlyRollover.query.filter(MonthlyRollover.plan_id == plan.id, month_index >= start_index).all()
+    }
+
+    balance = opening_balance
+    for index in range(start_index, end_index + 1):
+        balance += (plan.monthly_income or 0) + income.get(index, 0) - spent.get(index, 0)
+        row = existing.pop(index, None)
+        if row:
+            row.amount = balance
+        else:
+            row_year, row_month = _from_index(index)
+            db.session.add(MonthlyRollover(plan_id=plan.id, year=row_year, month=row_month, amount=balance))
+
+    # Rows past the last active month are implied by rollover_into(), drop stale ones
+    for row in existing.values():
+        db.session.delete(row)
+
+
+def rollover_into(plan, year, month):
+    """Balance carried into year/month, read from the ledger without writing anything."""
+    first_index = _month_index(*ledger_start(plan))
+    index = _month_index(year, month)
+    if index <= first_index:
+        return 0.0
+
+    prev_year, prev_month = _from_index(index - 1)
+    previous = rollover_row_query(plan.id, prev_year, prev_month).first()
+    if previous:
+        return previous.amount
+
+    # Past the end of the ledger nothing was spent or added, so only the monthly income accrues
+    last = last_rollover_query(plan.id, first_index, index - 1).first()
+    if last:
+        return last.amount + (plan.monthly_income or 0) * (index - 1 - _month_index(last.year, last.month))
+    return (plan.monthly_income or 0) * (index - first_index)
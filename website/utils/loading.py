@@ -0,0 +1,37 @@
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import raiseload
+from .. import db
+
+# Relationship loading. Every relationship in models.py is lazy: touching
+# tx.category on an object loaded without it runs one SELECT, so a loop over
+# a page of transactions runs one per row (the N+1 pattern). Queries whose
+# rows are read through a relationship say so with a loader option instead:
+#
+#   joinedload   many-to-one read on every row (Transaction.category/payee):
+#                one LEFT JOIN in the same statement
+#   selectinload collections: one extra SELECT ... WHERE id IN (...) for the
+#                whole result, instead of one per parent
+#
+# With RAISE_ON_LAZY_LOAD set (RAISE_ON_LAZY_LOAD=1 in the environment, for
+# CI and local checks) every ORM query gets raiseload('*'), so any relationship
+# a query didn't load explicitly raises InvalidRequestError when touched
+# instead of quietly running a query. Loader options given by the query take
+# precedence over the wildcard.
+#
+# `flask check-lazy-loads` renders the transaction, reflect and receipt AI
+# pages with it set, on a throwaway database, and fails if any of them raises.
+
+
+def _raise_on_lazy_load(orm_execute_state):
+    if not (has_app_context() and current_app.config.get('RAISE_ON_LAZY_LOAD')):
+        return
+    # Column loads refresh expired attributes of objects already loaded with their own options
+    if orm_execute_state.is_select and not orm_execute_state.is_column_load:
+        orm_execute_state.statement = orm_execute_state.statement.options(raiseload('*'))
+
+
+def init_strict_loading():
+    """Honour RAISE_ON_LAZY_LOAD (session events are global, so register once)."""
+    if not event.contains(db.session, 'do_orm_execute', _raise_on_lazy_load):
+        event.listen(db.session, 'do_orm_execute', _raise_on_lazy_load)
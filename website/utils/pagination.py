@@ -0,0 +1,71 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import or_, and_
+from .. import db
+from ..models import BudgetCategory, Payee, Transaction
+
+# Keyset ("seek") pagination for transaction lists. Pages are ordered by
+# (transaction_date, id) newest first, and the cursor handed to the client is
+# the sort key of the last row it received. The next page is the rows strictly
+# after that key, which the (plan_id, transaction_date, id) index serves
+# directly however deep into the history the client is, instead of OFFSET
+# reading and discarding every earlier row.
+#
+# Cursors are opaque to clients: URL-safe base64 of the JSON [date, id] pair.
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(transaction_date, transaction_id):
+    raw = json.dumps([transaction_date.isoformat(), transaction_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(transaction_date, id) from a cursor made by encode_cursor(); raises InvalidCursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        date_str, transaction_id = json.loads(raw)
+        return datetime.fromisoformat(date_str), int(transaction_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor('Invalid cursor') from e
+
+
+def after_cursor(date_column, id_column, cursor):
+    """SQL predicate: rows that come after cursor in (date, id) descending order."""
+    transaction_date, transaction_id = cursor
+    # The redundant date_column <= bound is what lets the index seek to the cursor
+    # instead of scanning from the newest row and filtering with the OR
+    return and_(date_column <= transaction_date,
+                or_(date_column < transaction_date,
+                    and_(date_column == transaction_date, id_column < transaction_id)))
+
+
+def transaction_page_query(plan_id, filters=(), cursor=None, limit=50):
+    """
+    Query for one page of a plan's transactions with their category and payee names,
+    newest first: limit rows after cursor (a decoded cursor, or None for the first page)
+    that match the filters.
+    """
+    if cursor is not None:
+        filters = [*filters, after_cursor(Transaction.transaction_date, Transaction.id, cursor)]
+    return db.session.query(
+        Transaction.id,
+        Transaction.description,
+        Transaction.amount,
+        Transaction.transaction_date,
+        Transaction.created_date,
+        BudgetCategory.name.label('category_name'),
+        Payee.name.label('payee_name')
+    ).join(
+        BudgetCategory, Transaction.category_id == BudgetCategory.id
+    ).outerjoin(
+        Payee, Transaction.payee_id == Payee.id
+    ).filter(
+        Transaction.plan_id == plan_id, *filters
+    ).order_by(
+        Transaction.transaction_date.desc(), Transaction.id.desc()
+    ).limit(limit)
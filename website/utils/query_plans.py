@@ -0,0 +1,73 @@
+import re
+from datetime import date, datetime, timedelta
+from .. import db
+from ..models import transaction_fingerprint
+from .analytics import category_totals_query, daily_columns_query, monthly_totals_query, trend_rows_query
+from .counters import budget_row_query, budget_rows_query
+from .idempotency import stored_key_query
+from .ledger import month_spend_query, rollover_row_query, last_rollover_query
+from .pagination import transaction_page_query
+from .rollups import monthly_rollup_update, daily_rollup_update
+from .snapshot import month_budgets_query
+
+# A "SCAN transaction" line in SQLite's plan means every row of the table is read
+FULL_SCAN = re.compile(r'\bSCAN (?:TABLE )?"?(transaction|monthly_budget|idempotency_key|monthly_category_rollup|daily_category_rollup)"?\b', re.IGNORECASE)
+
+
+def hot_queries(plan_id=1, category_id=1, year=2025, month=1):
+    """
+    The main queries behind the pages and write paths, keyed by a short description.
+    Each is made by the same builder function the code that runs it calls, so what is
+    checked is what runs.
+    """
+    # Imported here so that loading the utils package never pulls in views.py
+    from ..views import (month_activity_query, month_transactions_query, duplicate_candidates_query,
+                         recent_ai_transactions_query)
+
+    first_day = date(year, month, 1)
+    month_start = datetime(year, month, 1)
+    month_index = year * 12 + month - 1
+
+    return {
+        'snapshot: month budgets': month_budgets_query(plan_id, year, month),
+        'counters: budget row lookup': budget_row_query(plan_id, category_id, year, month),
+        'counters: budget rows for a batch': budget_rows_query(plan_id, [category_id], year, year),
+        'ledger: spend per month': month_spend_query(plan_id, [category_id], month_index),
+        'ledger: rollover lookup': rollover_row_query(plan_id, year, month),
+        'ledger: last row before a month': last_rollover_query(plan_id, month_index - 12, month_index),
+        'transactions: month activity': month_activity_query(plan_id, year, month),
+        'transactions: month list': month_transactions_query(plan_id, year, month),
+        'reflect: category totals': category_totals_query(plan_id, year, month),
+        'reflect: daily totals': daily_columns_query(plan_id, year, month),
+        'reflect: monthly totals': monthly_totals_query(plan_id, (year, month), (year, month)),
+        'rollups: row update': monthly_rollup_update(category_id, year, month, 12.5, 1, 12.5, 12.5),
+        'rollups: daily row update': daily_rollup_update(category_id, first_day, 12.5, 1),
+        'trend: days in range': trend_rows_query(plan_id, first_day, first_day + timedelta(days=27), 'day', 'main'),
+        'trend: months in range': trend_rows_query(plan_id, date(year - 1, month, 1), first_day, 'month', 'category'),
+        'api/transactions: page after cursor': transaction_page_query(plan_id, cursor=(month_start, 1), limit=51),
+        'add-transaction: duplicate check': duplicate_candidates_query(
+            plan_id, [transaction_fingerprint('Lunch', 12.5)], month_start - timedelta(hours=1)),
+        'add-transaction: idempotency key lookup': stored_key_query(1, 'retry-key'),
+        'receipt_ai: recent AI transactions': recent_ai_transactions_query(plan_id),
+    }
+
+
+def explain(query):
+    """Return SQLite's EXPLAIN QUERY PLAN detail lines for an ORM query or a Core statement."""
+    statement = getattr(query, 'statement', query)
+    compiled = statement.compile(dialect=db.engine.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.construct_params()
+    positional = tuple(params[name] for name in compiled.positiontup)
+    rows = db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", positional).all()
+    return [row[-1] for row in rows]
+
+
+def find_full_scans(queries=None):
+    """Map each hot query that fully scans transaction or monthly_budget to its plan lines."""
+    queries = queries or hot_queries()
+    offenders = {}
+    for name, query in queries.items():
+        plan = explain(query)
+        if any(FULL_SCAN.search(line) for line in plan):
+            offenders[name] = plan
+    return offenders
@@ -0,0 +1,117 @@
+from flask import g, has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event
+from .. import db
+from ..models import BudgetCategory, Payee
+
+# Request-scoped cache for the objects nearly every view and helper needs:
+# the active plan, its categories and its payees. Each is loaded once per
+# request and then shared, instead of every helper re-querying (or lazily
+# re-loading) them. Outside a request (CLI commands, scripts) nothing is
+# cached and the loaders run every time.
+#
+# The cache lives on flask.g, so it never outlives the request. It is also
+# dropped after a commit or rollback (the ORM has expired the cached objects
+# by then, and one query reloading a list is cheaper than refreshing every
+# object in it) and when categories or payees are added or deleted.
+
+
+def _cached(key, loader):
+    if not has_request_context():
+        return loader()
+
+    stats = g.setdefault('_request_cache_stats', {'hits': 0, 'misses': 0})
+    cache = g.setdefault('_request_cache', {})
+    if key in cache:
+        stats['hits'] += 1
+        return cache[key]
+
+    stats['misses'] += 1
+    value = loader()
+    # The loader's query may autoflush and invalidate the cache, so store into whatever g holds now
+    g.setdefault('_request_cache', {})[key] = value
+    return value
+
+
+def active_plan():
+    """The logged-in user's active plan (or None)."""
+    return _cached('active_plan', lambda: current_user.active_plan if current_user.is_authenticated else None)
+
+
+def plan_categories(plan_id):
+    """Every BudgetCategory of a plan."""
+    return _cached(('categories', plan_id), lambda: BudgetCategory.query.filter_by(plan_id=plan_id).all())
+
+
+def plan_category(plan_id, category_id):
+    """One of the plan's categories by id, or None if the plan has no such category."""
+    try:
+        category_id = int(category_id)
+    except (TypeError, ValueError):
+        return None
+    return next((c for c in plan_categories(plan_id) if c.id == category_id), None)
+
+
+def plan_payees(plan_id):
+    """Every Payee of a plan."""
+    return _cached(('payees', plan_id), lambda: Payee.query.filter_by(plan_id=plan_id).all())
+
+
+def plan_payee(plan_id, payee_id):
+    """One of the plan's payees by id, or None if the plan has no such payee."""
+    try:
+        payee_id = int(payee_id)
+    except (TypeError, ValueError):
+        return None
+    return next((p for p in plan_payees(plan_id) if p.id == payee_id), None)
+
+
+def invalidate():
+    """Forget everything cached for this request (the hit counts are kept)."""
+    if has_request_context():
+        g.pop('_request_cache', None)
+
+
+def cache_stats():
+    """{'hits': n, 'misses': n} for the current request."""
+    if has_request_context() and '_request_cache_stats' in g:
+        return dict(g._request_cache_stats)
+    return {'hits': 0, 'misses': 0}
+
+
+def _invalidate_after_transaction(session, *args):
+    invalidate()
+
+
+def _invalidate_on_structure_change(session, flush_context, instances):
+    if any(isinstance(obj, (BudgetCategory, Payee)) for obj in list(session.new) + list(session.deleted)):
+        invalidate()
+
+
+_SESSION_LISTENERS = (
+    ('after_commit', _invalidate_after_transaction),
+    ('after_rollback', _invalidate_after_transaction),
+    ('before_flush', _invalidate_on_structure_change),
+)
+
+
+def init_request_cache(app):
+    """Wire the cache into the session lifecycle and report hit counts per response."""
+    # Session events are global, so only register them once however many apps are created
+    for name, listener in _SESSION_LISTENERS:
+        if not event.contains(db.session, name, listener):
+            event.listen(db.session, name, listener)
+
+    @app.after_request
+    def report_cache_hits(response):
+        stats = cache_stats()
+        if stats['hits'] or stats['misses']:
+            response.headers['X-Request-Cache'] = f"hits={stats['hits']}; misses={stats['misses']}"
+            app.logger.debug("request cache for %s: %s", request.path, stats)
+        return response
+
+    @app.teardown_request
+    def drop_request_cache(exc):
+        # g belongs to the app context, which scripts and tests may keep open across requests
+        g.pop('_request_cache', None)
+        g.pop('_request_cache_stats', None)
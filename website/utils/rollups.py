@@ -0,0 +1,198 @@
+from sqlalchemy import and_, case, cast, func, insert, or_, select, update
+from .. import db
+from ..models import DailyCategoryRollup, MonthlyCategoryRollup, Transaction
+from .dates import in_month, month_window
+
+# Rollups: one MonthlyCategoryRollup row per category and month with the
+# month's spending total, transaction count and smallest and largest amount,
+# and one DailyCategoryRollup row per category and day with its total and
+# count, all positive. Analytics over months and years read these rows
+# (utils/analytics.py) instead of aggregating the transactions each time.
+#
+# Every transaction write updates them in its own unit of work:
+#
+#   add_to_rollups    new transactions are folded in by delta (sum and count
+#                     add up, min/max widen), one UPDATE per category and
+#                     month plus one per category and day
+#   refresh_rollups   deletes and moves can shrink min/max, so the affected
+#                     category-months, and their days, are recomputed from
+#                     their transactions
+#
+# rebuild_rollups() recomputes them from scratch (`flask rebuild-rollups`).
+# Rows only exist for months and days with spending.
+
+
+def _month_parts():
+    return (cast(func.extract('year', Transaction.transaction_date), db.Integer),
+            cast(func.extract('month', Transaction.transaction_date), db.Integer))
+
+
+def _day():
+    return func.date(Transaction.transaction_date, type_=db.Date)
+
+
+def _in_month_days(column, year, month):
+    # Date column: compare with dates, a datetime bound would skip the first day on SQLite
+    start, end = month_window(year, month)
+    return and_(column >= start.date(), column < end.date())
+
+
+def _aggregates():
+    spend = func.abs(Transaction.amount)
+    return func.sum(spend), func.count(Transaction.id), func.min(spend), func.max(spend)
+
+
+def monthly_rollup_update(category_id, year, month, total, count, low, high):
+    """UPDATE folding total, count and the low/high amounts into one category-month's rollup row."""
+    # SQL-side, so concurrent writers don't overwrite each other
+    rollup = MonthlyCategoryRollup
+    return update(rollup).where(
+        rollup.category_id == category_id, rollup.year == year, rollup.month == month
+    ).values(
+        total_amount=rollup.total_amount + total,
+        transaction_count=rollup.transaction_count + count,
+        min_amount=case((rollup.min_amount <= low, rollup.min_amount), else_=low),
+        max_amount=case((rollup.max_amount >= high, rollup.max_amount), else_=high)
+    ).execution_options(synchronize_session=False)
+
+
+def daily_rollup_update(category_id, day, total, count):
+    """UPDATE adding total and count to one category-day's rollup row."""
+    return update(DailyCategoryRollup).where(
+        DailyCategoryRollup.category_id == category_id, DailyCategoryRollup.date == day
+    ).values(
+        total_amount=DailyCategoryRollup.total_amount + total,
+        transaction_count=DailyCategoryRollup.transaction_count + count
+    ).execution_options(synchronize_session=False)
+
+
+def add_to_rollups(plan_id, transactions):
+    """
+    Fold new transactions, given as (category_id, transaction_date, amount), into the
+    rollups. The caller commits.
+    """
+    stats = {}
+    daily = {}
+    for category_id, when, amount in transactions:
+        amount = abs(amount)
+        key = (category_id, when.year, when.month)
+        total, count, low, high = stats.get(key, (0.0, 0, amount, amount))
+        stats[key] = (total + amount, count + 1, min(low, amount), max(high, amount))
+        total, count = daily.get((category_id, when.date()), (0.0, 0))
+        daily[(category_id, when.date())] = (total + amount, count + 1)
+
+    for (category_id, year, month), (total, count, low, high) in stats.items():
+        updated = db.session.execute(monthly_rollup_update(category_id, year, month, total, count, low, high)).rowcount
+        if not updated:
+            db.session.add(MonthlyCategoryRollup(
+                plan_id=plan_id, category_id=category_id, year=year, month=month,
+                total_amount=total, transaction_count=count, min_amount=low, max_amount=high
+            ))
+
+    for (category_id, day), (total, count) in daily.items():
+        updated = db.session.execute(daily_rollup_update(category_id, day, total, count)).rowcount
+        if not updated:
+            db.session.add(DailyCategoryRollup(plan_id=plan_id, category_id=category_id, date=day,
+                                               total_amount=total, transaction_count=count))
+
+
+def refresh_rollups(plan_id, keys):
+    """
+    Recompute the rollups of the (category_id, year, month) keys from the transactions,
+    after transactions were deleted or moved out of them. The caller commits.
+    """
+    keys = set(keys)
+    if not keys:
+        return
+    db.session.flush()  # the aggregate has to see this unit of work's changes
+
+    # One index range per month, over just the categories that changed in it
+    category_ids_by_month = {}
+    for category_id, year, month in keys:
+        category_ids_by_month.setdefault((year, month), set()).add(category_id)
+    in_changed_months = or_(*(
+        and_(in_month(Transaction.transaction_date, year, month), Transaction.category_id.in_(category_ids))
+        for (year, month), category_ids in category_ids_by_month.items()
+    ))
+    year_expr, month_expr = _month_parts()
+    actual = {
+        (category_id, year, month): stats
+        for category_id, year, month, *stats in db.session.query(
+            Transaction.category_id, year_expr, month_expr, *_aggregates()
+        ).filter(
+            Transaction.plan_id == plan_id, in_changed_months
+        ).group_by(Transaction.category_id, year_expr, month_expr).all()
+    }
+
+    category_ids = {category_id for category_id, _, _ in keys}
+    years = [year for _, year, _ in keys]
+    existing = {
+        (row.category_id, row.year, row.month): row
+        for row in MonthlyCategoryRollup.query.filter(
+            MonthlyCategoryRollup.plan_id == plan_id,
+            MonthlyCategoryRollup.category_id.in_(category_ids),
+            MonthlyCategoryRollup.year.between(min(years), max(years))
+        ).all()
+    }
+    for key in keys:
+        row, stats = existing.get(key), actual.get(key)
+        if stats is None:
+            if row:
+                db.session.delete(row)
+            continue
+        if row is None:
+            category_id, year, month = key
+            row = MonthlyCategoryRollup(plan_id=plan_id, category_id=category_id, year=year, month=month)
+            db.session.add(row)
+        row.total_amount, row.transaction_count, row.min_amount, row.max_amount = stats
+
+    # The days of those category-months: drop them and regroup the transactions
+    DailyCategoryRollup.query.filter(DailyCategoryRollup.plan_id == plan_id, or_(*(
+        and_(_in_month_days(DailyCategoryRollup.date, year, month), DailyCategoryRollup.category_id.in_(category_ids))
+        for (year, month), category_ids in category_ids_by_month.items()
+    ))).delete(synchronize_session=False)
+    db.session.execute(_insert_daily(
+        select(Transaction.plan_id, Transaction.category_id, _day(), *_aggregates()[:2])
+        .where(Transaction.plan_id == plan_id, in_changed_months)
+        .group_by(Transaction.plan_id, Transaction.category_id, _day())
+    ))
+
+
+def _insert_daily(aggregate):
+    rollup = DailyCategoryRollup
+    return insert(rollup).from_select([
+        rollup.plan_id, rollup.category_id, rollup.date, rollup.total_amount, rollup.transaction_count
+    ], aggregate)
+
+
+def rebuild_rollups(plan_id=None):
+    """
+    Recompute the rollups of one plan (or all of them) from the transactions, with one
+    INSERT ... SELECT per table. Returns the number of (monthly, daily) rows written;
+    the caller commits.
+    """
+    for table in (MonthlyCategoryRollup, DailyCategoryRollup):
+        stale = table.query
+        if plan_id:
+            stale = stale.filter(table.plan_id == plan_id)
+        stale.delete(synchronize_session=False)
+
+    daily = select(
+        Transaction.plan_id, Transaction.category_id, _day(), *_aggregates()[:2]
+    ).group_by(Transaction.plan_id, Transaction.category_id, _day())
+    if plan_id:
+        daily = daily.where(Transaction.plan_id == plan_id)
+    daily_rows = db.session.execute(_insert_daily(daily)).rowcount
+
+    year_expr, month_expr = _month_parts()
+    aggregate = select(
+        Transaction.plan_id, Transaction.category_id, year_expr, month_expr, *_aggregates()
+    ).group_by(Transaction.plan_id, Transaction.category_id, year_expr, month_expr)
+    if plan_id:
+        aggregate = aggregate.where(Transaction.plan_id == plan_id)
+    rollup = MonthlyCategoryRollup
+    monthly_rows = db.session.execute(insert(rollup).from_select([
+        rollup.plan_id, rollup.category_id, rollup.year, rollup.month,
+        rollup.total_amount, rollup.transaction_count, rollup.min_amount, rollup.max_amount
+    ], aggregate)).rowcount
+    return monthly_rows, daily_rows
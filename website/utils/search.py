@@ -0,0 +1,199 @@
+import re
+from flask import current_app
+from sqlalchemy import text, or_, func
+from sqlalchemy.exc import OperationalError
+from .. import db
+from ..models import Transaction, BudgetCategory, Payee
+
+# Full-text search over transaction descriptions, notes and payee names.
+#
+# On SQLite the text lives in an FTS5 table, transaction_fts, whose rowid is
+# the transaction id. Triggers keep it in step with every insert, update and
+# delete on transaction (ORM writes, bulk statements and imports alike) and
+# with payee renames, so the app never writes to it directly. A search is one
+# MATCH against the FTS index, ranked by bm25 with description hits weighted
+# above payee and note hits.
+#
+# The statement importer is the exception: an FTS5 insert from a trigger
+# flushes the index every row, which would make bulk imports several times
+# slower. Imported rows (source_type 'import') are skipped by the insert
+# trigger and indexed per batch with one INSERT ... SELECT instead, see
+# index_new_transactions().
+#
+# Databases without FTS5 fall back to LIKE matching, which is correct but
+# scans the plan's transactions.
+
+FTS_TABLE = 'transaction_fts'
+
+# bm25 weights, in column order: description, user_notes, payee
+RANK_WEIGHTS = (10.0, 2.0, 5.0)
+
+# Only the newest RANK_WINDOW matches are ranked. A word that appears in a
+# tenth of a big history would otherwise cost a bm25 score per match on every
+# search; FTS5 walks matches newest first for free, so capping the window
+# bounds the cost at the price of never showing very old hits for very common
+# words.
+RANK_WINDOW = 5000
+
+SEARCH_INDEX_DDL = (
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        description, user_notes, payee, plan_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON "transaction"
+        WHEN new.source_type IS NOT 'import' BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, description, user_notes, payee, plan_id)
+        VALUES (new.id, new.description, new.user_notes,
+                (SELECT name FROM payee WHERE id = new.payee_id), new.plan_id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON "transaction" BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+        AFTER UPDATE OF description, user_notes, payee_id, plan_id ON "transaction" BEGIN
+        UPDATE {FTS_TABLE} SET description = new.description, user_notes = new.user_notes,
+            payee = (SELECT name FROM payee WHERE id = new.payee_id), plan_id = new.plan_id
+        WHERE rowid = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_payee_au AFTER UPDATE OF name ON payee BEGIN
+        UPDATE {FTS_TABLE} SET payee = new.name
+        WHERE rowid IN (SELECT id FROM "transaction" WHERE payee_id = new.id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_payee_ad AFTER DELETE ON payee BEGIN
+        UPDATE {FTS_TABLE} SET payee = NULL
+        WHERE rowid IN (SELECT id FROM "transaction" WHERE payee_id = old.id);
+    END""",
+)
+
+SEARCH_INDEX_TRIGGERS = ('ai', 'ad', 'au', 'payee_au', 'payee_ad')
+
+
+def _fts_exists(connection):
+    return connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': FTS_TABLE}
+    ).first() is not None
+
+
+def rebuild_search_index(connection):
+    """Refill the FTS table from the transaction and payee tables."""
+    connection.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    connection.execute(text(
+        f"""INSERT INTO {FTS_TABLE}(rowid, description, user_notes, payee, plan_id)
+            SELECT t.id, t.description, t.user_notes, p.name, t.plan_id
+            FROM "transaction" t LEFT JOIN payee p ON p.id = t.payee_id"""
+    ))
+    connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"))
+
+
+def index_new_transactions(connection):
+    """
+    Index every transaction newer than the newest indexed one, in one statement.
+    Run it in the transaction that inserted them: new rows get the highest ids
+    and nothing else can write in between, so they are exactly the rows above the
+    index's highest rowid.
+    """
+    connection.execute(text(
+        f"""INSERT INTO {FTS_TABLE}(rowid, description, user_notes, payee, plan_id)
+            SELECT t.id, t.description, t.user_notes, p.name, t.plan_id
+            FROM "transaction" t LEFT JOIN payee p ON p.id = t.payee_id
+            WHERE t.id > coalesce((SELECT rowid FROM {FTS_TABLE} ORDER BY rowid DESC LIMIT 1), 0)"""
+    ))
+
+
+def search_index_enabled():
+    return bool(current_app.extensions.get('transaction_search_fts'))
+
+
+def create_search_index(connection):
+    """
+    Create the FTS table and its triggers if missing, filling the table when it is new.
+    Returns False when the database can't host it (not SQLite, or SQLite without FTS5).
+    """
+    if connection.dialect.name != 'sqlite':
+        return False
+    existed = _fts_exists(connection)
+    try:
+        for statement in SEARCH_INDEX_DDL:
+            connection.execute(text(statement))
+    except OperationalError:
+        return False  # no such module: fts5
+    if not existed:
+        rebuild_search_index(connection)
+    return True
+
+
+def drop_search_index(connection):
+    for suffix in SEARCH_INDEX_TRIGGERS:
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}"))
+    connection.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+
+
+def is_search_table(name):
+    """True for the FTS table and the shadow tables FTS5 creates next to it."""
+    return name == FTS_TABLE or name.startswith(FTS_TABLE + '_')
+
+
+def init_search(app):
+    """Make sure the search index exists (create_all() doesn't know about virtual tables)."""
+    with app.app_context():
+        with db.engine.begin() as connection:
+            app.extensions['transaction_search_fts'] = create_search_index(connection)
+
+
+def fts_query(terms):
+    """
+    An FTS5 MATCH expression for free text typed by a user: every word must
+    match, the last one as a prefix (so results follow the typing). Words are
+    quoted, so FTS5 operators and punctuation in the input are taken literally.
+    """
+    words = re.findall(r'\w+', terms)
+    if not words:
+        return None
+    quoted = [f'"{word}"' for word in words]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def search_transactions(plan_id, terms, limit=20, offset=0):
+    """
+    Transactions of the plan matching terms, best match first.
+    Returns (rows, has_more); rows are (Transaction, category name, payee name).
+    """
+    columns = (Transaction, BudgetCategory.name, Payee.name)
+    base = db.session.query(*columns).join(
+        BudgetCategory, Transaction.category_id == BudgetCategory.id
+    ).outerjoin(
+        Payee, Transaction.payee_id == Payee.id
+    ).filter(Transaction.plan_id == plan_id)
+
+    if search_index_enabled():
+        match = fts_query(terms)
+        if match is None:
+            return [], False
+        weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+        # Rank and cut the page inside the FTS query, so only the page's rows are joined
+        hits = text(
+            f"SELECT id, score FROM ("
+            f"  SELECT rowid AS id, bm25({FTS_TABLE}, {weights}) AS score FROM {FTS_TABLE}"
+            f"  WHERE {FTS_TABLE} MATCH :match AND plan_id = :plan_id ORDER BY rowid DESC LIMIT :window"
+            f") ORDER BY score, id DESC LIMIT :limit OFFSET :offset"
+        ).bindparams(match=match, plan_id=plan_id, window=RANK_WINDOW, limit=limit + 1, offset=offset).columns(
+            id=db.Integer, score=db.Float
+        ).subquery('hits')
+        # bm25 scores are negative, lower is a better match
+        rows = base.join(hits, hits.c.id == Transaction.id).order_by(hits.c.score, Transaction.id.desc()).all()
+        return rows[:limit], len(rows) > limit
+    else:
+        words = re.findall(r'\w+', terms)
+        if not words:
+            return [], False
+        for word in words:
+            pattern = f"%{word.lower()}%"
+            base = base.filter(or_(
+                func.lower(Transaction.description).like(pattern),
+                func.lower(Transaction.user_notes).like(pattern),
+                func.lower(Payee.name).like(pattern)
+            ))
+        rows = base.order_by(Transaction.transaction_date.desc(), Transaction.id.desc()) \
+            .limit(limit + 1).offset(offset).all()
+        return rows[:limit], len(rows) > limit
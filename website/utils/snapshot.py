@@ -0,0 +1,160 @@
+from flask import current_app
+from sqlalchemy import func
+from .. import db
+from ..models import MonthlyBudget, AdditionalIncome
+
+
+class MonthSnapshot:
+    """Assigned, spent and additional income for one plan/month.
+
+    Everything is loaded up front with a fixed number of grouped queries,
+    so the cost does not grow with the number of categories in the plan.
+    """
+
+    def __init__(self, plan_id, year, month, budgets, spent, additional_income):
+        self.plan_id = plan_id
+        self.year = year
+        self.month = month
+        self.budgets = budgets                      # category_id -> MonthlyBudget
+        self.spent_by_category = spent              # category_id -> positive spent total
+        self.additional_income = additional_income
+
+    def budget(self, category_id):
+        """Return the MonthlyBudget row for a category, or None if it has none."""
+        return self.budgets.get(category_id)
+
+    def assigned(self, category_id, default=0.0):
+        mb = self.budgets.get(category_id)
+        return mb.assigned_amount if mb else default
+
+    def spent(self, category_id):
+        return self.spent_by_category.get(category_id, 0.0)
+
+    def total_assigned(self, category_ids):
+        return sum(self.assigned(cid) for cid in category_ids)
+
+
+# Compiled visibility index per plan: plan_id -> (pref_version, {main_category: frozenset(names)}).
+# Rebuilt only when Plan.pref_version changes, which every edit of the
+# budget_pref subcategories bumps (see Plan.bump_pref_version). Kept on the
+# app, since plan ids are only unique within one database.
+
+
+def visibility_index(plan):
+    """
+    {main_category: frozenset of visible subcategory names} for a plan, keyed by
+    the database's main_category names, or None if the plan has no preferences.
+    """
+    if not plan.budget_pref or 'subcategories' not in plan.budget_pref:
+        return None  # Fallback if no preferences set
+
+    cache = current_app.extensions.setdefault('visibility_index', {})
+    version = plan.pref_version or 0
+    cached = cache.get(plan.id)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    # Handle naming inconsistency: "savings" in plan preferences vs "investments" in the database
+    index = {
+        ('investments' if key == 'savings' else key): frozenset(names or ())
+        for key, names in plan.budget_pref['subcategories'].items()
+    }
+    cache[plan.id] = (version, index)
+    return index
+
+
+def filter_visible_categories(plan, categories):
+    """Keep only the categories listed in the plan's budget preferences."""
+    index = visibility_index(plan)
+    if index is None:
+        return list(categories)
+    empty = frozenset()
+    return [cat for cat in categories if cat.name in index.get(cat.main_category, empty)]
+
+
+class CategoryMonth:
+    """Read-only view of a BudgetCategory's figures for one month.
+
+    The dashboard renders these instead of writing month values onto the
+    BudgetCategory rows, so viewing a month never dirties the session.
+    """
+
+    def __init__(self, category, assigned_amount, spent_amount):
+        self.id = category.id
+        self.name = category.name
+        self.icon = category.icon
+        self.main_category = category.main_category
+        self.assigned_amount = assigned_amount
+        self.spent_amount = spent_amount
+
+    @property
+    def available_amount(self):
+        return self.assigned_amount - self.spent_amount
+
+    @property
+    def progress_percentage(self):
+        if self.assigned_amount == 0:
+            return 0
+        return min((self.spent_amount / self.assigned_amount) * 100, 100)
+
+
+def summarize_month(plan, categories, snapshot, rollover_amount):
+    """Work out the dashboard figures for a month from a snapshot.
+
+    Categories without a MonthlyBudget row count as zero assigned; no rows
+    are created here.
+    """
+    organized_categories = {'needs': [], 'wants': [], 'investments': []}
+    total_assigned = 0
+    total_spent = 0
+
+    for category in categories:
+        row = CategoryMonth(category, snapshot.assigned(category.id), snapshot.spent(category.id))
+        total_assigned += row.assigned_amount
+        total_spent += row.spent_amount
+        if row.main_category in organized_categories:
+            organized_categories[row.main_category].append(row)
+
+    category_totals = {}
+    for main_cat, cats in organized_categories.items():
+        category_totals[main_cat] = {
+            'assigned': sum(c.assigned_amount for c in cats),
+            'spent': sum(c.spent_amount for c in cats),
+            'available': sum(c.available_amount for c in cats)
+        }
+
+    # Available = assigned in month - activity
+    available = total_assigned - total_spent
+    # Money Remaining to Assign = monthly_income + additional_income + rollover - assigned_total
+    money_remaining_to_assign = ((plan.monthly_income or 0) + snapshot.additional_income + rollover_amount) - total_assigned
+    # Leftover for the month = money_remaining_to_assign + available
+    leftover_for_month = money_remaining_to_assign + available
+
+    return {
+        'categories': organized_categories,
+        'category_totals': category_totals,
+        'total_assigned': total_assigned,
+        'total_spent': total_spent,
+        'available': available,
+        'money_remaining_to_assign': money_remaining_to_assign,
+        'leftover_for_month': leftover_for_month,
+    }
+
+
+def month_budgets_query(plan_id, year, month):
+    """Query for the plan's MonthlyBudget rows of one month."""
+    return MonthlyBudget.query.filter_by(plan_id=plan_id, month=month, year=year)
+
+
+def load_month_snapshot(plan_id, year, month):
+    """Load a MonthSnapshot for a plan/month in two queries, whatever the category count."""
+    budgets = {mb.category_id: mb for mb in month_budgets_query(plan_id, year, month).all()}
+
+    # Spend is kept on the MonthlyBudget rows by delta (see utils/counters.py)
+    spent = {category_id: mb.spent_amount or 0 for category_id, mb in budgets.items()}
+
+    additional_income = db.session.query(func.sum(AdditionalIncome.amount)).filter_by(
+        plan_id=plan_id, month=month, year=year
+    ).scalar() or 0.0
+
+    return MonthSnapshot(plan_id, year, month, budgets, spent, additional_income)
@@ -0,0 +1,110 @@
+from sqlalchemy import func
+from .. import db
+from ..models import BudgetCategory, MonthlyBudget, Transaction
+from .counters import budget_row_query
+from .ledger import recompute_rollovers_from
+from .rollups import add_to_rollups
+
+# The write path for adding one transaction, shared by the add-transaction and
+# receipt AI endpoints. Everything happens in one unit of work:
+#
+#   1. read the month's MonthlyBudget row (budget and spend counter) once
+#   2. check the amount against what is left of the budget
+#   3. add the transaction, move the monthly and lifetime counters and the
+#      monthly rollup by delta
+#   4. flush once, rebuild the rollover ledger from that month, commit once
+#
+# A request's idempotency key (utils/idempotency.py) is written in the same
+# commit, so a transaction is never stored without its key or the other way round.
+#
+# The figures returned to the client are worked out from the values read in
+# step 1 and the flush, so nothing is re-read after the commit. The counters
+# themselves are incremented SQL-side, so concurrent writers can't lose each
+# other's updates.
+
+
+class BudgetExceeded(Exception):
+    """The transaction doesn't fit in what is left of its category's budget for the month."""
+
+    def __init__(self, message, details):
+        super().__init__(message)
+        self.details = details
+
+
+def over_budget(category, amount, assigned_amount, current_spent):
+    """None when amount fits the month's budget, else (message, details) for the client."""
+    if current_spent + amount <= assigned_amount:
+        return None
+    available_amount = assigned_amount - current_spent
+    excess_amount = current_spent + amount - assigned_amount
+    message = (f'Transaction exceeds budget limit for "{category.name}" category. '
+               f'Available: ฿{available_amount:.2f}, Requested: ฿{amount:.2f}, Excess: ฿{excess_amount:.2f}')
+    return message, {
+        'error_type': 'budget_exceeded',
+        'available_amount': available_amount,
+        'requested_amount': amount,
+        'excess_amount': excess_amount,
+        'category_name': category.name,
+        'current_spent': current_spent,
+        'category_limit': assigned_amount
+    }
+
+
+def record_transaction(plan, category, amount, description, when, payee=None,
+                       source_type='manual', check_budget=True, idempotency=None):
+    """
+    Add an expense of amount (positive) to category and commit, or raise BudgetExceeded.
+    payee may be a Payee not yet flushed; it is written in the same flush.
+    Returns the new transaction_id with the category's lifetime category_spent and
+    category_available after the write. Rolls back and re-raises if the write fails.
+    idempotency, an unsaved IdempotencyKey, is stored with the transaction and the
+    result added to its response_body.
+    """
+    with db.session.no_autoflush:
+        mb = budget_row_query(plan.id, category.id, when.year, when.month).first()
+    assigned_amount = mb.assigned_amount if mb else 0
+    month_spent = (mb.spent_amount or 0) if mb else 0
+
+    if check_budget:
+        rejection = over_budget(category, amount, assigned_amount, month_spent)
+        if rejection:
+            raise BudgetExceeded(*rejection)
+
+    lifetime_spent = (category.spent_amount or 0) + amount
+    result = {
+        'category_spent': lifetime_spent,
+        'category_available': (category.assigned_amount or 0) - lifetime_spent
+    }
+
+    try:
+        transaction = Transaction(
+            description=description,
+            amount=-abs(amount),  # Make negative for expenses
+            category_id=category.id,
+            payee=payee,
+            plan_id=plan.id,
+            transaction_date=when,
+            source_type=source_type
+        )
+        db.session.add(transaction)
+        if mb:
+            mb.spent_amount = func.coalesce(MonthlyBudget.spent_amount, 0) + amount
+        else:
+            db.session.add(MonthlyBudget(plan_id=plan.id, category_id=category.id, month=when.month,
+                                         year=when.year, assigned_amount=0, spent_amount=amount))
+        category.spent_amount = func.coalesce(BudgetCategory.spent_amount, 0) + amount
+        add_to_rollups(plan.id, [(category.id, when, amount)])
+        db.session.flush()
+        result['transaction_id'] = transaction.id  # read now, the commit expires the object
+        if idempotency is not None:
+            idempotency.transaction_id = transaction.id
+            idempotency.response_body = {**idempotency.response_body, **result}
+            db.session.add(idempotency)
+
+        # The ledger reads the counters just flushed; its own rows go out with the commit
+        recompute_rollovers_from(plan, when.year, when.month)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return result
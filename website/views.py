@@ -1,14 +1,34 @@
 from dateutil.relativedelta import relativedelta
-from flask import Blueprint, render_template, request, flash, jsonify, redirect, url_for
+from flask import Blueprint, render_template, request, flash, jsonify, redirect, url_for, current_app, stream_with_context
 from flask_login import login_required, current_user
-from .models import Note, Plan, BudgetCategory, MonthlyBudget, Transaction, Payee, MonthlyRollover, AdditionalIncome
+from .models import Note, Plan, BudgetCategory, MonthlyBudget, Transaction, Payee, MonthlyRollover, AdditionalIncome, MonthlyCategoryRollup, DailyCategoryRollup, transaction_fingerprint
 from . import db
 from .auth import validate_password
+from .utils.snapshot import load_month_snapshot, summarize_month, filter_visible_categories
+from .utils.counters import count_transaction, apply_spend_deltas, budget_row_query, budget_rows_query
+from .utils.rollups import add_to_rollups, refresh_rollups
+from .utils.ledger import recompute_rollovers_from, rollover_into, ledger_start
+from .utils.dates import in_month
+from .utils.fragment_cache import fragment_key, cached_fragments
+from .utils.data_version import bump_data_version
+from .utils.conditional import conditional_get
+from .utils.pagination import encode_cursor, decode_cursor, transaction_page_query
+from .utils.export import export_batches, csv_chunks, ndjson_chunks, gzip_chunks
+from .utils.importer import import_statement, open_statement, StatementError
+from .utils.search import search_transactions
+from .utils.columnar import encode_column, ENCODINGS
+from .utils.analytics import (category_totals, daily_columns, daily_series, monthly_totals, largest_transaction,
+                              trend_series, GRANULARITIES, TREND_GROUPS)
+from .utils.writes import record_transaction, over_budget, BudgetExceeded
+from .utils.idempotency import idempotent, idempotency_requested, pending_idempotency_key
+from .utils.request_cache import active_plan, plan_categories, plan_category, plan_payees, plan_payee, invalidate as invalidate_request_cache
 from werkzeug.security import generate_password_hash
 import json
 from datetime import datetime, date, timedelta
 import calendar
+import math
 from sqlalchemy import func, and_
+from sqlalchemy.orm import joinedload
 from sqlalchemy.orm.attributes import flag_modified
 from collections import defaultdict
 import traceback
@@ -25,10 +45,17 @@ pillow_heif.register_heif_opener()
 
 views = Blueprint('views', __name__)
 
+# Cached template fragments per page (see utils/fragment_cache.py)
+HOME_FRAGMENTS = ('remaining', 'budget-table', 'summary')
+TRANSACTIONS_FRAGMENTS = ('totals', 'table')
+REFLECT_FRAGMENTS = ('breakdown', 'trends', 'chart-data')
+
 # Helper function for budget validation
 def validate_budget_limit(category, transaction_amount, transaction_date=None):
     """
-    Validate if a transaction amount would exceed the category's budget limit.
+    Validate if a transaction amount would exceed the category's budget limit,
+    recounting the month's spending from its transactions (record_transaction()
+    reads the MonthlyBudget counter instead).
     Returns (is_valid, error_message, validation_data)
     """
     try:
@@ -40,12 +67,7 @@ def validate_budget_limit(category, transaction_amount, transaction_date=None):
         target_year = transaction_date.year
         
         # Get the monthly budget for this category and month
-        monthly_budget = MonthlyBudget.query.filter_by(
-            plan_id=category.plan_id,
-            category_id=category.id,
-            month=target_month,
-            year=target_year
-        ).first()
+        monthly_budget = budget_row_query(category.plan_id, category.id, target_year, target_month).first()
         
         # If no monthly budget exists, use 0 as assigned amount (no budget set for this month)
         assigned_amount = monthly_budget.assigned_amount if monthly_budget else 0
@@ -53,29 +75,16 @@ def validate_budget_limit(category, transaction_amount, transaction_date=None):
         # Calculate current spent amount for this specific month
         current_spent = db.session.query(func.sum(func.abs(Transaction.amount))).filter(
             Transaction.category_id == category.id,
-            func.extract('month', Transaction.transaction_date) == target_month,
-            func.extract('year', Transaction.transaction_date) == target_year
+            in_month(Transaction.transaction_date, target_year, target_month)
         ).scalar() or 0
         
         # Check if this transaction would exceed the category limit
         new_total_spent = current_spent + transaction_amount
         available_amount = assigned_amount - current_spent
         
-        if new_total_spent > assigned_amount:
-            excess_amount = new_total_spent - assigned_amount
-            error_message = f'Transaction exceeds budget limit for "{category.name}" category. Available: ฿{available_amount:.2f}, Requested: ฿{transaction_amount:.2f}, Excess: ฿{excess_amount:.2f}'
-            
-            validation_data = {
-                'error_type': 'budget_exceeded',
-                'available_amount': available_amount,
-                'requested_amount': transaction_amount,
-                'excess_amount': excess_amount,
-                'category_name': category.name,
-                'current_spent': current_spent,
-                'category_limit': assigned_amount
-            }
-            
-            return False, error_message, validation_data
+        rejection = over_budget(category, transaction_amount, assigned_amount, current_spent)
+        if rejection:
+            return False, *rejection
         
         # Validation passed
         validation_data = {
@@ -123,7 +132,7 @@ def validate_transaction_data(amount, description, category_id, plan_id):
     if not category_id:
         return False, "Category is required"
     
-    category = BudgetCategory.query.filter_by(id=category_id, plan_id=plan_id).first()
+    category = plan_category(plan_id, category_id)
     if not category:
         return False, "Invalid category selected"
     
@@ -137,11 +146,10 @@ def validate_monthly_spending_limit(plan, transaction_amount):
     try:
         # Get current month's spending
         current_date = datetime.now()
-        month_start = current_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         
         monthly_spent = db.session.query(func.sum(func.abs(Transaction.amount))).filter(
             Transaction.plan_id == plan.id,
-            Transaction.transaction_date >= month_start
+            in_month(Transaction.transaction_date, current_date.year, current_date.month)
         ).scalar() or 0
         
         # Calculate total monthly budget
@@ -161,48 +169,73 @@ def validate_monthly_spending_limit(plan, transaction_amount):
     except Exception as e:
         return True, None  # Don't block transaction for validation errors
 
-def check_duplicate_transaction(plan_id, amount, description, payee_id=None, hours_threshold=1):
+# Duplicate checks, per plan (budget_pref['duplicate_check']): a new transaction is a
+# likely duplicate when one with the same fingerprint (normalised description and
+# amount, see models.transaction_fingerprint) was made in the last window_hours, by
+# the same payee if match_payee and the new one has a payee. window_hours 0 turns
+# the check off.
+DEFAULT_DUPLICATE_RULES = {'window_hours': 1, 'match_payee': True}
+
+
+def duplicate_rules(plan):
+    """The plan's duplicate-check settings, with defaults for anything unset."""
+    stored = (plan.budget_pref or {}).get('duplicate_check') or {}
+    return {**DEFAULT_DUPLICATE_RULES, **stored}
+
+
+def duplicate_warning(rules):
+    return (f"Warning: Similar transaction detected within the last {rules['window_hours']} hour(s). "
+            "Please verify this is not a duplicate.")
+
+
+def duplicate_candidates_query(plan_id, fingerprints, since):
+    """Query for (fingerprint, payee_id) of the plan's transactions with one of the fingerprints made since since."""
+    # One probe of the (plan_id, fingerprint, transaction_date) index per fingerprint
+    return db.session.query(Transaction.fingerprint, Transaction.payee_id).filter(
+        Transaction.plan_id == plan_id,
+        Transaction.fingerprint.in_(fingerprints),
+        Transaction.transaction_date >= since
+    )
+
+
+def check_duplicate_transaction(plan, amount, description, payee_id=None):
     """
-    Check for potential duplicate transactions within the last few hours.
+    Check for potential duplicate transactions within the plan's duplicate window.
     Returns (is_duplicate, warning_message)
     """
     try:
-        # Check for similar transactions in the last hour
-        time_threshold = datetime.now() - timedelta(hours=hours_threshold)
-        
-        query = Transaction.query.filter(
-            Transaction.plan_id == plan_id,
-            func.abs(Transaction.amount) == amount,
-            Transaction.transaction_date >= time_threshold
-        )
-        
-        # Add payee filter if provided
-        if payee_id:
+        rules = duplicate_rules(plan)
+        if not rules['window_hours']:
+            return False, None
+        time_threshold = datetime.now() - timedelta(hours=rules['window_hours'])
+
+        query = duplicate_candidates_query(plan.id, [transaction_fingerprint(description, amount)], time_threshold)
+        if payee_id and rules['match_payee']:
             query = query.filter(Transaction.payee_id == payee_id)
-        
-        # Check description similarity (exact match or very similar)
-        similar_transactions = query.filter(
-            func.lower(Transaction.description).like(f"%{description.lower()}%")
-        ).all()
-        
-        if similar_transactions:
-            return True, f"Warning: Similar transaction detected within the last {hours_threshold} hour(s). Please verify this is not a duplicate."
-        
+
+        if query.first():
+            return True, duplicate_warning(rules)
+
         return False, None
-        
+
     except Exception as e:
         return False, None  # Don't block transaction for validation errors
 
+def is_users_first_month(user, year, month):
+    """True if year/month is the month the user joined (their rollover starts at zero)."""
+    join_date = user.date_created or datetime.now()
+    return year == join_date.year and month == join_date.month
+
 @views.route('/<int:year>/<int:month>')
 @views.route('/')
 @login_required
+@conditional_get(html=True)
 def home(year=None, month=None):
     # Redirect to onboarding if the user hasn't created their first plan yet
-    if not current_user.profile_complete or not current_user.active_plan:
+    plan = active_plan()
+    if not current_user.profile_complete or not plan:
         return redirect(url_for('onboard.show_form'))
 
-    plan = current_user.active_plan
-
     # Determine the date to display
     if year is None or month is None:
         today = datetime.now()
@@ -219,137 +252,42 @@ def home(year=None, month=None):
     display_month_str = display_date.strftime('%B')
 
     # Determine if the current view is the user's first month
-    user_join_date = current_user.date_created
-    if user_join_date is None:
-        # If the user has no join date, set it to now to prevent crash and fix the data.
-        user_join_date = datetime.now()
-        current_user.date_created = user_join_date
-        db.session.commit()
-
-    is_first_month = (display_date.year == user_join_date.year and display_date.month == user_join_date.month)
-    
-    # --- Rollover Calculation ---
-    previous_month_date = display_date - relativedelta(months=1)
-    prev_month_int = previous_month_date.month
-    prev_month_year = previous_month_date.year
-
-    # Initialize rollover amount
-    rollover_amount = 0.0
-    
-    # Check if the display month is after the user's join month before calculating rollover
-    if not is_first_month:
-        # Try to find an existing rollover record
-        rollover_from_last_month = MonthlyRollover.query.filter_by(
-            plan_id=plan.id, month=prev_month_int, year=prev_month_year
-        ).first()
-
-        if rollover_from_last_month:
-            rollover_amount = rollover_from_last_month.amount
-        else:
-            # If no rollover record exists, start with 0 for this month
-            # The rollover will be created when this month's leftover is calculated
-            rollover_amount = 0.0
-
-    # --- Budget Processing for Display Month ---
-    # Get all BudgetCategory records, but filter to only show ones that exist in plan preferences
-    all_categories = BudgetCategory.query.filter_by(plan_id=plan.id).all()
-    
-    # Filter categories to only include those that exist in plan preferences
-    categories = []
-    if plan.budget_pref and 'subcategories' in plan.budget_pref:
-        for cat in all_categories:
-            # Handle naming inconsistency: "investments" in database vs "savings" in plan preferences
-            pref_category_key = 'savings' if cat.main_category == 'investments' else cat.main_category
-            
-            # Check if this category exists in plan preferences
-            if (pref_category_key in plan.budget_pref['subcategories'] and 
-                cat.name in plan.budget_pref['subcategories'][pref_category_key]):
-                categories.append(cat)
-    else:
-        categories = all_categories  # Fallback if no preferences set
-    
-    monthly_budgets_map = {}
-    for cat in categories:
-        mb = MonthlyBudget.query.filter_by(plan_id=plan.id, category_id=cat.id, month=month, year=year).first()
-        if not mb:
-            # For new months, start with assigned_amount = 0 (fresh start)
-            mb = MonthlyBudget(plan_id=plan.id, category_id=cat.id, month=month, year=year, assigned_amount=0, spent_amount=0)
-            db.session.add(mb)
-        monthly_budgets_map[cat.id] = mb
-    db.session.commit()
-
-    organized_categories = {'needs': [], 'wants': [], 'investments': []}
-    total_assigned = 0
-    total_spent = 0
-    
-    for category in categories:
-        mb = monthly_budgets_map.get(category.id)
-        if mb:
-            category.assigned_amount = mb.assigned_amount
-            spent = db.session.query(func.sum(Transaction.amount)).filter(
-                Transaction.category_id == category.id,
-                func.extract('month', Transaction.transaction_date) == month,
-                func.extract('year', Transaction.transaction_date) == year
-            ).scalar() or 0
-            mb.spent_amount = abs(spent)
-            category.spent_amount = abs(spent)
-        
-        total_assigned += category.assigned_amount
-        total_spent += category.spent_amount
-        
-        if category.main_category in organized_categories:
-            organized_categories[category.main_category].append(category)
-    db.session.commit()
-    
-    category_totals = {}
-    for main_cat, cats in organized_categories.items():
-        category_totals[main_cat] = {
-            'assigned': sum(c.assigned_amount for c in cats),
-            'spent': sum(c.spent_amount for c in cats),
-            'available': sum(c.available_amount for c in cats)
-        }
-    
-    # Follow user's calculation rules:
-    # Assigned in Month = amount assigned to all subcategories
-    assigned_in_month = total_assigned
-    
-    # Activity = total activity in all categories and subcategories
-    activity = total_spent
-    
-    # Available = assigned_in_month - activity
-    available = assigned_in_month - activity
-    
-    # Get additional income for this month
-    additional_income_total = db.session.query(func.sum(AdditionalIncome.amount)).filter_by(
-        plan_id=plan.id, month=month, year=year
-    ).scalar() or 0.0
-    
-    # Money Remaining to Assign = monthly_income + additional_income + rollover - assigned_total
-    # Additional income increases the total available money pool
-    money_remaining_to_assign = (plan.monthly_income + additional_income_total + rollover_amount) - total_assigned
-    
-    # Leftover for the month = money_remaining_to_assign + available
-    leftover_for_month = money_remaining_to_assign + available
-    
-    # Save current month's leftover as rollover for future months
-    existing_rollover = MonthlyRollover.query.filter_by(
-        plan_id=plan.id, month=month, year=year
-    ).first()
-    
-    if existing_rollover:
-        # Update existing rollover record
-        existing_rollover.amount = leftover_for_month
-    else:
-        # Create new rollover record
-        new_rollover = MonthlyRollover(
-            plan_id=plan.id, month=month, year=year, amount=leftover_for_month
+    is_first_month = is_users_first_month(current_user, year, month)
+    
+    # Rendered budget table and summary cards for this month at the plan's current data version;
+    # the figures below are only worked out when one of them isn't cached yet
+    home_fragment_key = fragment_key(plan, year, month, 'home')
+    fragments = cached_fragments(home_fragment_key, HOME_FRAGMENTS)
+    figures = {}
+
+    if fragments is None:
+        # --- Budget Processing for Display Month ---
+        # Viewing a month is read-only: missing MonthlyBudget rows count as zero and nothing is written
+        categories = filter_visible_categories(plan, plan_categories(plan.id))
+        
+        # Assigned, spent, additional income and rollover for every category in a few grouped queries
+        snapshot = load_month_snapshot(plan.id, year, month)
+
+        # Balance carried over from last month, looked up in the rollover ledger (zero in the first month)
+        rollover_amount = rollover_into(plan, year, month)
+
+        summary = summarize_month(plan, categories, snapshot, rollover_amount)
+        organized_categories = summary['categories']
+
+        all_categories = sorted([cat for cats in organized_categories.values() for cat in cats if cat.spent_amount > 0], key=lambda x: x.spent_amount, reverse=True)
+
+        figures = dict(
+            categories=organized_categories,
+            category_totals=summary['category_totals'],
+            # Summary data (following user's calculation rules)
+            total_assigned=summary['total_assigned'],  # Assigned in Month
+            total_spent=summary['total_spent'],  # Activity
+            available_amount=summary['available'],  # Available = assigned_in_month - activity
+            money_remaining_to_assign=summary['money_remaining_to_assign'],  # Money Remaining to Assign
+            leftover_for_month=summary['leftover_for_month'],  # Leftover for the month
+            rollover_amount=rollover_amount,
+            top_spending_categories=all_categories[:5]
         )
-        db.session.add(new_rollover)
-    
-    db.session.commit()
-
-    all_categories = sorted([cat for cat in categories if cat.spent_amount > 0], key=lambda x: x.spent_amount, reverse=True)
-    top_spending_categories = all_categories[:5]
 
     # --- Date navigation and disabling logic ---
     
@@ -357,7 +295,7 @@ def home(year=None, month=None):
     next_month_date = display_date + relativedelta(months=1)
 
     # Check if user can navigate to previous month (based on when they joined)
-    user_start_date = current_user.date_created
+    user_start_date = current_user.date_created or datetime.now()
     user_start_month = user_start_date.month
     user_start_year = user_start_date.year
 
@@ -368,8 +306,8 @@ def home(year=None, month=None):
 
     return render_template("home.html", 
                          plan=plan,
-                         categories=organized_categories,
-                         category_totals=category_totals,
+                         fragment_key=home_fragment_key,
+                         fragments=fragments,
                          current_month=display_month_str,
                          current_month_num=month,
                          current_year=year,
@@ -381,14 +319,7 @@ def home(year=None, month=None):
                          is_first_month=is_first_month,
                          can_go_prev=can_go_prev,
                          can_go_next=can_go_next,
-                         # Summary data (following user's calculation rules)
-                         total_assigned=assigned_in_month,  # Assigned in Month
-                         total_spent=activity,  # Activity
-                         available_amount=available,  # Available = assigned_in_month - activity
-                         money_remaining_to_assign=money_remaining_to_assign,  # Money Remaining to Assign
-                         leftover_for_month=leftover_for_month,  # Leftover for the month
-                         rollover_amount=rollover_amount,
-                         top_spending_categories=top_spending_categories)
+                         **figures)
 
 
 @views.route('/api/update-assigned', methods=['POST'])
@@ -403,13 +334,14 @@ def update_assigned():
     if category_id is None or amount is None:
         return jsonify({'success': False, 'message': 'Invalid data'}), 400
 
-    category = BudgetCategory.query.get(category_id)
+    plan = active_plan()
+    category = plan_category(plan.id, category_id) if plan else None
     if not category:
         return jsonify({'success': False, 'message': 'Category not found'}), 404
 
     # Determine month/year
     now = datetime.now()
-    mb = MonthlyBudget.query.filter_by(plan_id=category.plan_id, category_id=category_id, month=now.month, year=now.year).first()
+    mb = budget_row_query(category.plan_id, category_id, now.year, now.month).first()
     if not mb:
         mb = MonthlyBudget(plan_id=category.plan_id, category_id=category_id, month=now.month, year=now.year)
         db.session.add(mb)
@@ -457,24 +389,17 @@ def update_category_amount():
         if new_amount < 0:
             return jsonify({'success': False, 'error': 'Assigned amount cannot be negative.'}), 400
 
-        plan = current_user.active_plan
+        plan = active_plan()
         if not plan:
             return jsonify({'success': False, 'error': 'No active plan found'}), 400
 
         # Debug: Print what we're looking for
         print(f"Looking for category_id: {category_id}, plan_id: {plan.id}")
         
-        # Get the category to update
-        category_to_update = BudgetCategory.query.filter_by(
-            id=category_id,
-            plan_id=plan.id
-        ).first()
+        # Get the category to update (categories are loaded once and shared for the whole request)
+        categories = plan_categories(plan.id)
+        category_to_update = plan_category(plan.id, category_id)
         
-        # Debug: Print all categories for this plan
-        all_categories = BudgetCategory.query.filter_by(plan_id=plan.id).all()
-        print(f"All categories for plan {plan.id}:")
-        for cat in all_categories:
-            print(f"  ID: {cat.id}, Name: {cat.name}, Main: {cat.main_category}")
 
         if not category_to_update:
             return jsonify({'success': False, 'error': f'Category not found. Looking for ID {category_id} in plan {plan.id}'}), 404
@@ -506,20 +431,14 @@ def update_category_amount():
         # Calculate the maximum allowed amount based on the ratio
         max_allowed = plan.monthly_income * category_ratio if plan.monthly_income else 0
         
+        # Load every MonthlyBudget for the target month at once
+        snapshot = load_month_snapshot(plan.id, int(target_year), int(target_month))
+
         # Get current total assigned to this main category from MonthlyBudget records
         current_total = 0
-        for c in plan.categories:
+        for c in categories:
             if c.main_category.lower() == main_cat_name and c.id != category_id:
-                mb = MonthlyBudget.query.filter_by(
-                    plan_id=plan.id, 
-                    category_id=c.id, 
-                    month=target_month, 
-                    year=target_year
-                ).first()
-                if mb:
-                    current_total += mb.assigned_amount
-                else:
-                    current_total += c.assigned_amount  # fallback to base amount
+                current_total += snapshot.assigned(c.id, default=c.assigned_amount)  # fallback to base amount
         
         # Check if new amount would exceed the category's budget
         if (current_total + new_amount) > max_allowed:
@@ -531,12 +450,7 @@ def update_category_amount():
             return jsonify({'success': False, 'error': error_msg}), 400
         # Update the category amount
         # Find or create MonthlyBudget record for this category and target month
-        monthly_budget = MonthlyBudget.query.filter_by(
-            plan_id=plan.id, 
-            category_id=category_id, 
-            month=target_month, 
-            year=target_year
-        ).first()
+        monthly_budget = snapshot.budget(category_id)
         
         if not monthly_budget:
             monthly_budget = MonthlyBudget(
@@ -556,44 +470,23 @@ def update_category_amount():
         old_amount = category_to_update.assigned_amount
         category_to_update.assigned_amount = new_amount
         
-        try:
-            db.session.commit()
-            print("Database commit successful")  # Debug
-        except Exception as e:
-            print(f"Database commit failed: {e}")  # Debug
-            raise
-
         # Calculate updated totals
         try:
             parent_total_assigned = 0
             parent_total_spent = 0
             
-            for c in plan.categories:
+            for c in categories:
                 if c.main_category.lower() == main_cat_name:
-                    mb = MonthlyBudget.query.filter_by(
-                        plan_id=plan.id, 
-                        category_id=c.id, 
-                        month=current_month, 
-                        year=current_year
-                    ).first()
-                    if mb:
-                        parent_total_assigned += mb.assigned_amount
-                        parent_total_spent += mb.spent_amount
-                    else:
-                        parent_total_assigned += c.assigned_amount
-                        parent_total_spent += c.spent_amount
+                    mb = monthly_budget if c.id == category_id else snapshot.budget(c.id)
+                    parent_total_assigned += mb.assigned_amount if mb else c.assigned_amount
+                    parent_total_spent += snapshot.spent(c.id)
             
             parent_total_available = parent_total_assigned - parent_total_spent
             
             # Calculate grand total from all MonthlyBudget records
             grand_total_assigned = 0
-            for c in plan.categories:
-                mb = MonthlyBudget.query.filter_by(
-                    plan_id=plan.id, 
-                    category_id=c.id, 
-                    month=current_month, 
-                    year=current_year
-                ).first()
+            for c in categories:
+                mb = monthly_budget if c.id == category_id else snapshot.budget(c.id)
                 if mb:
                     grand_total_assigned += mb.assigned_amount
                 else:
@@ -604,7 +497,15 @@ def update_category_amount():
             print(f"Error calculating totals: {e}")  # Debug
             raise
 
-        category_available = new_amount - category_to_update.spent_amount
+        category_available = new_amount - snapshot.spent(category_id)
+
+        # Commit after the totals are read so the loaded rows are not expired and re-fetched
+        try:
+            db.session.commit()
+            print("Database commit successful")  # Debug
+        except Exception as e:
+            print(f"Database commit failed: {e}")  # Debug
+            raise
 
         # Calculate money remaining (monthly income - total assigned)
         money_remaining = (plan.monthly_income or 0) - grand_total_assigned
@@ -633,6 +534,7 @@ def update_category_amount():
 
 @views.route('/api/add-transaction', methods=['POST'])
 @login_required
+@idempotent
 def add_transaction():
     """API endpoint to add a new transaction with budget validation"""
     try:
@@ -663,26 +565,25 @@ def add_transaction():
             transaction_date = datetime.now()
             print(f"DEBUG: Using current date: {transaction_date}")  # Debug
         
+        plan = active_plan()
+        
         # Comprehensive transaction validation
-        is_valid, error_msg = validate_transaction_data(amount, description, category_id, current_user.active_plan.id)
+        is_valid, error_msg = validate_transaction_data(amount, description, category_id, plan.id)
         if not is_valid:
             return jsonify({'success': False, 'error': error_msg}), 400
         
-        # Check for duplicate transactions
-        is_duplicate, duplicate_warning = check_duplicate_transaction(
-            current_user.active_plan.id, amount, description, payee_id
+        # Check for duplicate transactions (a retry with an Idempotency-Key is replayed instead)
+        is_duplicate, warning = (False, None) if idempotency_requested() else check_duplicate_transaction(
+            plan, amount, description, payee_id
         )
         if is_duplicate:
             return jsonify({
                 'success': False, 
-                'error': duplicate_warning,
+                'error': warning,
                 'error_type': 'duplicate_warning'
             }), 400
         
-        category = BudgetCategory.query.filter_by(
-            id=category_id,
-            plan_id=current_user.active_plan.id
-        ).first()
+        category = plan_category(plan.id, category_id)
         
         if not category:
             return jsonify({'success': False, 'error': 'Category not found'}), 404
@@ -690,57 +591,29 @@ def add_transaction():
         # Ensure the date is stored as a naive datetime to avoid timezone issues
         naive_transaction_date = transaction_date.replace(tzinfo=None) if transaction_date.tzinfo else transaction_date
         
-        # Validate budget limit using helper function
-        is_valid, error_message, validation_data = validate_budget_limit(category, amount, naive_transaction_date)
-        
-        if not is_valid:
+        payee = None
+        if payee_id:
+            payee = plan_payee(plan.id, payee_id)
+            if not payee:
+                return jsonify({'success': False, 'error': 'Payee not found'}), 404
+
+        message = f'Transaction added successfully! ฿{amount:.2f} spent on "{category.name}"'
+        response = {'success': True, 'message': message}
+
+        # Budget check, insert and counter updates in one unit of work (see utils/writes.py)
+        try:
+            result = record_transaction(plan, category, amount, description, naive_transaction_date,
+                                        payee=payee, idempotency=pending_idempotency_key(response))
+        except BudgetExceeded as e:
             return jsonify({
                 'success': False, 
-                'error': error_message,
-                **validation_data
+                'error': str(e),
+                **e.details
             }), 400
         
-        # Create new transaction (amount should be negative for expenses)
-        print(f"DEBUG: About to store transaction with date: {naive_transaction_date}")  # Debug
-        print(f"DEBUG: Date type: {type(naive_transaction_date)}")  # Debug
-        
-        transaction = Transaction(
-            description=description,
-            amount=-abs(amount),  # Make negative for expenses
-            category_id=category_id,
-            payee_id=payee_id,
-            plan_id=current_user.active_plan.id,
-            transaction_date=naive_transaction_date
-        )
-        
-        print(f"DEBUG: Transaction object created, date before save: {transaction.transaction_date}")  # Debug
-        
-        db.session.add(transaction)
-        print(f"DEBUG: Transaction added to session, date: {transaction.transaction_date}")  # Debug
-        
-        db.session.commit()
-        print(f"DEBUG: Transaction committed, final date: {transaction.transaction_date}")  # Debug
-        
-        # Refresh from database to see what was actually stored
-        db.session.refresh(transaction)
-        print(f"DEBUG: After refresh from DB - ID: {transaction.id}, Date: {transaction.transaction_date}")  # Debug
-        
-        # Update category spent amount
-        spent = db.session.query(func.sum(func.abs(Transaction.amount))).filter_by(
-            category_id=category.id
-        ).scalar() or 0
-        category.spent_amount = spent
-        db.session.commit()
-        
-        flash(f'Transaction added successfully! ฿{amount:.2f} spent on "{category.name}"', 'success')
+        flash(message, 'success')
 
-        return jsonify({
-            'success': True,
-            'transaction_id': transaction.id,
-            'category_spent': category.spent_amount,
-            'category_available': category.assigned_amount - category.spent_amount,
-            'message': f'Transaction added successfully! ฿{amount:.2f} spent on "{category.name}"'
-        })
+        return jsonify({**response, **result})
         
     except ValueError:
         return jsonify({'success': False, 'error': 'Invalid amount format'}), 400
@@ -748,6 +621,165 @@ def add_transaction():
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def parse_transaction_date(value):
+    """A transaction date from the client (YYYY-MM-DD or DD/MM/YYYY), or now when empty. Raises ValueError."""
+    if not value:
+        return datetime.now()
+    return datetime.strptime(value, '%d/%m/%Y' if '/' in value else '%Y-%m-%d')
+
+
+def batch_entry_fields(plan, entry):
+    """
+    (category, amount, description, payee_id, when) for one entry of a batch, after the
+    checks add_transaction() makes. Raises ValueError with a message for the client.
+    """
+    if not isinstance(entry, dict):
+        raise ValueError('Each transaction must be an object')
+    try:
+        amount = float(entry.get('amount', 0))
+        when = parse_transaction_date(entry.get('transaction_date'))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid amount or date (dates are YYYY-MM-DD or DD/MM/YYYY)') from None
+    if not math.isfinite(amount):
+        raise ValueError('Transaction amount must be a number')
+    description = entry.get('description', 'Transaction')
+    if not isinstance(description, str):
+        raise ValueError('Transaction description must be text')
+    is_valid, error_msg = validate_transaction_data(amount, description, entry.get('category_id'), plan.id)
+    if not is_valid:
+        raise ValueError(error_msg)
+    payee_id = None
+    if entry.get('payee_id'):
+        payee = plan_payee(plan.id, entry['payee_id'])
+        if not payee:
+            raise ValueError('Payee not found')
+        payee_id = payee.id
+    return plan_category(plan.id, entry['category_id']), amount, description, payee_id, when.replace(tzinfo=None)
+
+
+@views.route('/api/transactions/batch', methods=['POST'])
+@login_required
+def add_transactions_batch():
+    """
+    Add many transactions in one request, e.g. entries a client recorded offline.
+
+    Body: {"transactions": [{category_id, amount, description, payee_id, transaction_date}, ...],
+           "atomic": false}
+    Every entry gets the checks add_transaction() makes, but the month budgets, spend
+    counters and recent transactions are loaded once and each entry is checked against
+    running totals that include the entries before it. Accepted entries are written in
+    one commit; with "atomic": true nothing is written unless every entry is accepted.
+    Returns one result per entry, in order.
+    """
+    data = request.get_json(silent=True) or {}
+    entries = data.get('transactions')
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'success': False, 'error': 'transactions must be a non-empty list'}), 400
+    max_entries = current_app.config.get('TRANSACTIONS_BATCH_MAX', 500)
+    if len(entries) > max_entries:
+        return jsonify({'success': False, 'error': f'At most {max_entries} transactions per batch'}), 400
+
+    plan = active_plan()
+    results = [None] * len(entries)
+
+    # Field checks, which need nothing but the (request-cached) categories and payees
+    valid = []
+    for index, entry in enumerate(entries):
+        try:
+            valid.append((index, *batch_entry_fields(plan, entry)))
+        except ValueError as e:
+            results[index] = {'index': index, 'success': False, 'error': str(e)}
+        except Exception as e:
+            # A malformed entry fails on its own instead of failing the batch
+            print(f"Error checking batch entry {index}: {e}")
+            results[index] = {'index': index, 'success': False, 'error': 'Invalid transaction'}
+
+    # Everything the budget and duplicate checks read, in two queries
+    months = {(category.id, when.year, when.month) for _, category, _, _, _, when in valid}
+    budgets = {}
+    if months:
+        years = [year for _, year, _ in months]
+        category_ids = {category_id for category_id, _, _ in months}
+        for mb in budget_rows_query(plan.id, category_ids, min(years), max(years)).all():
+            budgets[(mb.category_id, mb.year, mb.month)] = mb
+    # Same rules as check_duplicate_transaction(), one index probe for every fingerprint in the batch
+    rules = duplicate_rules(plan)
+    fingerprints = {index: transaction_fingerprint(description, amount)
+                    for index, _, amount, description, _, _ in valid}
+    duplicate_window = datetime.now() - timedelta(hours=rules['window_hours'])
+    recent = set()
+    if rules['window_hours'] and fingerprints:
+        recent = set(duplicate_candidates_query(plan.id, set(fingerprints.values()), duplicate_window).all())
+    recent_fingerprints = {fingerprint for fingerprint, _ in recent}
+
+    running_spent = {}
+    accepted = []
+    for index, category, amount, description, payee_id, when in valid:
+        fingerprint = fingerprints[index]
+        if payee_id and rules['match_payee']:
+            is_duplicate = (fingerprint, payee_id) in recent
+        else:
+            is_duplicate = fingerprint in recent_fingerprints
+        if is_duplicate:
+            results[index] = {'index': index, 'success': False, 'error_type': 'duplicate_warning',
+                              'error': duplicate_warning(rules)}
+            continue
+
+        key = (category.id, when.year, when.month)
+        mb = budgets.get(key)
+        assigned_amount = mb.assigned_amount if mb else 0
+        current_spent = running_spent.get(key, (mb.spent_amount or 0) if mb else 0)
+        rejection = over_budget(category, amount, assigned_amount, current_spent)
+        if rejection:
+            message, details = rejection
+            results[index] = {'index': index, 'success': False, 'error': message, **details}
+            continue
+
+        running_spent[key] = current_spent + amount
+        if rules['window_hours'] and when >= duplicate_window:
+            recent.add((fingerprint, payee_id))
+            recent_fingerprints.add(fingerprint)
+        accepted.append((index, Transaction(
+            description=description,
+            amount=-abs(amount),  # Make negative for expenses
+            category_id=category.id,
+            payee_id=payee_id,
+            plan_id=plan.id,
+            transaction_date=when
+        )))
+
+    if data.get('atomic') and len(accepted) < len(entries):
+        for index, _ in accepted:
+            results[index] = {'index': index, 'success': False, 'error': 'Not saved, another transaction in the batch failed'}
+        accepted = []
+
+    if accepted:
+        try:
+            db.session.add_all([transaction for _, transaction in accepted])
+            deltas = defaultdict(float)
+            for _, transaction in accepted:
+                when = transaction.transaction_date
+                deltas[(transaction.category_id, when.year, when.month)] += abs(transaction.amount)
+            apply_spend_deltas(plan.id, deltas)
+            add_to_rollups(plan.id, ((transaction.category_id, transaction.transaction_date, transaction.amount)
+                                     for _, transaction in accepted))
+            earliest = min(transaction.transaction_date for _, transaction in accepted)
+            recompute_rollovers_from(plan, earliest.year, earliest.month)
+            db.session.flush()
+            for index, transaction in accepted:
+                results[index] = {'index': index, 'success': True, 'transaction_id': transaction.id}
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    return jsonify({
+        'success': True,
+        'created': len(accepted),
+        'failed': len(entries) - len(accepted),
+        'results': results
+    })
+
 @views.route('/api/create-category', methods=['POST'])
 @login_required
 def create_category():
@@ -765,7 +797,7 @@ def create_category():
             name=name,
             main_category=main_category,
             icon=icon,
-            plan_id=current_user.active_plan.id
+            plan_id=active_plan().id
         )
         
         db.session.add(category)
@@ -783,74 +815,229 @@ def create_category():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+def _parse_day(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f'{name} must be a date in YYYY-MM-DD format') from None
+
+
+def parse_transaction_filters(args):
+    """
+    SQL predicates for the transaction filters in a request's query string:
+    start/end (inclusive YYYY-MM-DD dates), category_id, payee_id and
+    min_amount/max_amount (the spent amount, as shown to users).
+    Raises ValueError with a message for the client on bad input.
+    """
+    filters = []
+    if args.get('start'):
+        filters.append(Transaction.transaction_date >= _parse_day(args['start'], 'start'))
+    if args.get('end'):
+        filters.append(Transaction.transaction_date < _parse_day(args['end'], 'end') + timedelta(days=1))
+
+    category_ids = args.getlist('category_id', type=int)
+    if category_ids:
+        filters.append(Transaction.category_id.in_(category_ids))
+    payee_ids = args.getlist('payee_id', type=int)
+    if payee_ids:
+        filters.append(Transaction.payee_id.in_(payee_ids))
+
+    # Expenses are stored negative, so a spent-amount range is a mirrored range on the column
+    for name in ('min_amount', 'max_amount'):
+        if args.get(name):
+            try:
+                value = abs(float(args[name]))
+            except ValueError:
+                raise ValueError(f'{name} must be a number') from None
+            if name == 'min_amount':
+                filters.append(Transaction.amount <= -value)
+            else:
+                filters.append(Transaction.amount >= -value)
+    return filters
+
+
 @views.route('/api/transactions', methods=['GET'])
 @login_required
+@conditional_get()
 def get_transactions():
-    """API endpoint to get all transactions for the current user"""
+    """
+    API endpoint to page through the active plan's transactions, newest first.
+
+    Query parameters: limit (page size), cursor (the next_cursor of the previous
+    page) and the filters of parse_transaction_filters().
+    """
     try:
-        transactions = db.session.query(
-            Transaction.id,
-            Transaction.description,
-            Transaction.amount,
-            Transaction.created_date,
-            BudgetCategory.name.label('category_name'),
-            Payee.name.label('payee_name')
-        ).join(
-            BudgetCategory, Transaction.category_id == BudgetCategory.id
-        ).outerjoin(
-            Payee, Transaction.payee_id == Payee.id
-        ).filter(
-            Transaction.plan_id == current_user.active_plan.id
-        ).order_by(Transaction.created_date.desc()).all()
-        
+        default_limit = current_app.config.get('TRANSACTIONS_PAGE_SIZE', 50)
+        max_limit = current_app.config.get('TRANSACTIONS_PAGE_MAX', 500)
+        limit = request.args.get('limit', default_limit, type=int)
+        if limit < 1:
+            return jsonify({'success': False, 'error': 'limit must be a positive integer'}), 400
+        limit = min(limit, max_limit)
+
+        try:
+            filters = parse_transaction_filters(request.args)
+            cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+
+        # One row past the page tells whether there is a next page
+        rows = transaction_page_query(active_plan().id, filters, cursor, limit + 1).all()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
         transaction_list = []
-        for t in transactions:
+        for t in rows:
             transaction_list.append({
                 'id': t.id,
                 'description': t.description,
                 'amount': t.amount,
-                'created_at': t.created_date.isoformat(),
+                'transaction_date': t.transaction_date.isoformat(),
+                'created_at': t.created_date.isoformat() if t.created_date else None,
                 'category_name': t.category_name,
                 'payee_name': t.payee_name
             })
-        
+
         return jsonify({
             'success': True,
-            'transactions': transaction_list
+            'transactions': transaction_list,
+            'has_more': has_more,
+            'next_cursor': encode_cursor(rows[-1].transaction_date, rows[-1].id) if has_more else None
         })
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@views.route('/api/transactions/search', methods=['GET'])
+@login_required
+@conditional_get()
+def search_transactions_api():
+    """
+    Search the active plan's transactions by description, notes and payee, best match first.
+    Query parameters: q, limit (page size) and page (1-based).
+    """
+    plan = active_plan()
+    if not plan:
+        return jsonify({'success': False, 'error': 'No active plan'}), 400
+
+    terms = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    page = max(request.args.get('page', 1, type=int), 1)
+    if not terms:
+        return jsonify({'success': False, 'error': 'q is required'}), 400
+
+    rows, has_more = search_transactions(plan.id, terms, limit=limit, offset=(page - 1) * limit)
+    return jsonify({
+        'success': True,
+        'page': page,
+        'has_more': has_more,
+        'transactions': [{
+            'id': t.id,
+            'description': t.description,
+            'notes': t.user_notes,
+            'amount': t.amount,
+            'transaction_date': t.transaction_date.isoformat(),
+            'category_name': category_name,
+            'payee_name': payee_name
+        } for t, category_name, payee_name in rows]
+    })
+
+
+@views.route('/api/transactions/export', methods=['GET'])
+@login_required
+def export_transactions():
+    """
+    Stream the active plan's transactions as CSV (default) or NDJSON (?format=ndjson),
+    oldest first. Takes the filters of parse_transaction_filters(); the response is
+    gzipped on the fly for clients that accept it.
+    """
+    plan = active_plan()
+    if not plan:
+        return jsonify({'success': False, 'error': 'No active plan'}), 400
+
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'error': 'format must be csv or ndjson'}), 400
+    try:
+        filters = parse_transaction_filters(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    batches = export_batches(plan.id, filters)
+    if export_format == 'csv':
+        chunks, mimetype = csv_chunks(batches), 'text/csv'
+    else:
+        chunks, mimetype = ndjson_chunks(batches), 'application/x-ndjson'
+
+    headers = {
+        'Content-Disposition': f'attachment; filename="transactions-{date.today().isoformat()}.{export_format}"',
+        'Vary': 'Accept-Encoding',
+    }
+    if 'gzip' in request.accept_encodings:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+
+    # stream_with_context keeps the request (and its database session) open while the rows are read
+    return current_app.response_class(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+
+@views.route('/api/transactions/import', methods=['POST'])
+@login_required
+def import_transactions():
+    """
+    Import a bank statement (multipart field 'file': CSV, OFX or QIF) into the active plan.
+    Form fields: default_category_id (required), format and expenses_positive (optional).
+    """
+    plan = active_plan()
+    if not plan:
+        return jsonify({'success': False, 'error': 'No active plan'}), 400
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'success': False, 'error': 'No file uploaded'}), 400
+    default_category_id = request.form.get('default_category_id', type=int)
+    if not default_category_id:
+        return jsonify({'success': False, 'error': 'default_category_id is required'}), 400
+
+    try:
+        file_format, lines = open_statement(upload.stream, upload.filename, request.form.get('format') or None)
+        totals = import_statement(plan, lines, file_format, default_category_id,
+                                  positive_is_expense=request.form.get('expenses_positive') in ('1', 'true', 'on'))
+    except StatementError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    for key in ('first_date', 'last_date'):
+        totals[key] = totals[key].isoformat() if totals[key] else None
+    return jsonify({'success': True, 'format': file_format, **totals})
+
+
 @views.route('/api/transactions/<int:transaction_id>', methods=['DELETE'])
 @login_required
 def delete_transaction(transaction_id):
     """API endpoint to delete a transaction"""
     try:
+        plan = active_plan()
         transaction = Transaction.query.filter_by(
             id=transaction_id,
-            plan_id=current_user.active_plan.id
+            plan_id=plan.id
         ).first()
         
         if not transaction:
             return jsonify({'success': False, 'error': 'Transaction not found'}), 404
         
-        category_id = transaction.category_id
+        transaction_date = transaction.transaction_date
         
-        # Delete the transaction
+        # Delete the transaction and take it off the spend counters and rollup in the same commit
+        count_transaction(transaction, sign=-1)
         db.session.delete(transaction)
+        refresh_rollups(plan.id, [(transaction.category_id, transaction_date.year, transaction_date.month)])
+        recompute_rollovers_from(plan, transaction_date.year, transaction_date.month)
         db.session.commit()
         
-        # Update category spent amount
-        category = BudgetCategory.query.get(category_id)
-        if category:
-            spent = db.session.query(func.sum(Transaction.amount)).filter_by(
-                category_id=category.id
-            ).scalar() or 0
-            category.spent_amount = abs(spent)
-            db.session.commit()
-        
         return jsonify({
             'success': True,
             'message': 'Transaction deleted successfully'
@@ -861,24 +1048,152 @@ def delete_transaction(transaction_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+def _bulk_selection(data, plan):
+    """
+    (rows, not_found) for the "ids" list of a bulk request: rows are (id, category_id,
+    transaction_date, amount) of the plan's transactions among them. Raises ValueError
+    for a missing, empty, oversized or non-integer list.
+    """
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not ids:
+        raise ValueError('ids must be a non-empty list')
+    max_ids = current_app.config.get('TRANSACTIONS_BULK_MAX', 5000)
+    if len(ids) > max_ids:
+        raise ValueError(f'At most {max_ids} transactions per request')
+    try:
+        ids = {int(transaction_id) for transaction_id in ids}
+    except (TypeError, ValueError):
+        raise ValueError('ids must be transaction ids')
+
+    rows = db.session.query(
+        Transaction.id, Transaction.category_id, Transaction.transaction_date, Transaction.amount
+    ).filter(Transaction.plan_id == plan.id, Transaction.id.in_(ids)).all()
+    return rows, sorted(ids - {row.id for row in rows})
+
+
+def _apply_bulk_change(plan, deltas, earliest):
+    """Spend counter deltas, monthly rollups, data version and rollover ledger for a bulk statement; the caller commits."""
+    apply_spend_deltas(plan.id, deltas)
+    refresh_rollups(plan.id, deltas.keys())
+    bump_data_version(plan.id)  # bulk statements skip the flush hooks
+    recompute_rollovers_from(plan, earliest.year, earliest.month)
+
+
+@views.route('/api/transactions/bulk-delete', methods=['POST'])
+@login_required
+def bulk_delete_transactions():
+    """
+    Delete many transactions in one statement. Body: {"ids": [...]}.
+    The spend counters of every affected category and month are adjusted by delta and
+    the ledger is rebuilt once, in the same commit. Ids that aren't the plan's are
+    reported back in not_found.
+    """
+    plan = active_plan()
+    try:
+        rows, not_found = _bulk_selection(request.get_json(silent=True) or {}, plan)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    if rows:
+        try:
+            deltas = defaultdict(float)
+            for _, category_id, when, amount in rows:
+                deltas[(category_id, when.year, when.month)] -= abs(amount)
+            Transaction.query.filter(Transaction.id.in_([row.id for row in rows])) \
+                .delete(synchronize_session=False)
+            _apply_bulk_change(plan, deltas, min(row.transaction_date for row in rows))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    return jsonify({'success': True, 'deleted': len(rows), 'not_found': not_found})
+
+
+@views.route('/api/transactions/bulk-edit', methods=['POST'])
+@login_required
+def bulk_edit_transactions():
+    """
+    Move many transactions to another category, payee or date in one statement.
+
+    Body: {"ids": [...], "category_id": ..., "payee_id": ... (null clears it),
+           "transaction_date": "YYYY-MM-DD"}; at least one of the three.
+    Spend counters move by delta from the old category/month to the new one. Budget
+    limits are not enforced: this reclassifies spending that already happened.
+    """
+    plan = active_plan()
+    data = request.get_json(silent=True) or {}
+    try:
+        rows, not_found = _bulk_selection(data, plan)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    values = {}
+    if 'category_id' in data:
+        category = plan_category(plan.id, data['category_id'])
+        if not category:
+            return jsonify({'success': False, 'error': 'Category not found'}), 404
+        values['category_id'] = category.id
+    if 'payee_id' in data:
+        if data['payee_id'] is None:
+            values['payee_id'] = None
+        else:
+            payee = plan_payee(plan.id, data['payee_id'])
+            if not payee:
+                return jsonify({'success': False, 'error': 'Payee not found'}), 404
+            values['payee_id'] = payee.id
+    if 'transaction_date' in data:
+        try:
+            if not data['transaction_date']:
+                raise ValueError('no date')
+            values['transaction_date'] = parse_transaction_date(data['transaction_date'])
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'Invalid date (dates are YYYY-MM-DD or DD/MM/YYYY)'}), 400
+    if not values:
+        return jsonify({'success': False, 'error': 'Nothing to change: give category_id, payee_id or transaction_date'}), 400
+
+    if rows:
+        try:
+            Transaction.query.filter(Transaction.id.in_([row.id for row in rows])) \
+                .update(values, synchronize_session=False)
+            if 'category_id' in values or 'transaction_date' in values:
+                deltas = defaultdict(float)
+                for _, category_id, when, amount in rows:
+                    new_category_id = values.get('category_id', category_id)
+                    new_when = values.get('transaction_date', when)
+                    deltas[(category_id, when.year, when.month)] -= abs(amount)
+                    deltas[(new_category_id, new_when.year, new_when.month)] += abs(amount)
+                earliest = min([row.transaction_date for row in rows] + [values.get('transaction_date', datetime.max)])
+                _apply_bulk_change(plan, deltas, earliest)
+            else:
+                bump_data_version(plan.id)  # a payee change leaves the counters alone
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'error': str(e)}), 500
+
+    return jsonify({'success': True, 'updated': len(rows), 'not_found': not_found})
+
+
 @views.route('/open-plan')
 @login_required
 def open_plan():
     """Display a list of all the user's plans."""
-    return render_template('open_plan.html', plans=current_user.plans)
+    return render_template('open_plan.html', plans=Plan.query.filter_by(user_id=current_user.id).all())
 
 
 # --------------------------- Payees API ---------------------------
 @views.route('/api/payees', methods=['GET', 'POST'])
 @login_required
+@conditional_get()
 def manage_payees():
     """GET: list payees; POST: create new payee"""
-    plan = current_user.active_plan
+    plan = active_plan()
     if not plan:
         return jsonify({'success': False, 'error': 'No active plan'}), 400
 
     if request.method == 'GET':
-        payees = [{'id': p.id, 'name': p.name} for p in plan.payees]
+        payees = [{'id': p.id, 'name': p.name} for p in plan_payees(plan.id)]
         return jsonify({'success': True, 'payees': payees})
 
     # POST
@@ -887,7 +1202,7 @@ def manage_payees():
     if not name:
         return jsonify({'success': False, 'error': 'Name required'}), 400
 
-    if any(p.name.lower() == name.lower() for p in plan.payees):
+    if any(p.name.lower() == name.lower() for p in plan_payees(plan.id)):
         return jsonify({'success': False, 'error': 'Payee already exists'}), 400
 
     payee = Payee(name=name, plan_id=plan.id)
@@ -898,8 +1213,8 @@ def manage_payees():
 @views.route('/api/payees/<int:payee_id>', methods=['DELETE'])
 @login_required
 def delete_payee(payee_id):
-    plan = current_user.active_plan
-    payee = Payee.query.filter_by(id=payee_id, plan_id=plan.id).first()
+    plan = active_plan()
+    payee = plan_payee(plan.id, payee_id)
     if not payee:
         return jsonify({'success': False, 'error': 'Payee not found'}), 404
     db.session.delete(payee)
@@ -910,13 +1225,14 @@ def delete_payee(payee_id):
 # -------------------------- Categories API ---------------------------
 @views.route('/api/categories', methods=['GET'])
 @login_required
+@conditional_get()
 def get_categories():
     """Get all categories for the current user's active plan"""
-    plan = current_user.active_plan
+    plan = active_plan()
     if not plan:
         return jsonify({'success': False, 'error': 'No active plan'}), 400
 
-    categories = BudgetCategory.query.filter_by(plan_id=plan.id).all()
+    categories = plan_categories(plan.id)
     category_list = [{
         'id': cat.id,
         'name': cat.name,
@@ -935,12 +1251,13 @@ def set_transaction_payee(tx_id):
     data = request.get_json()
     payee_id = data.get('payee_id')  # may be null to clear
 
-    tx = Transaction.query.filter_by(id=tx_id, plan_id=current_user.active_plan.id).first()
+    plan = active_plan()
+    tx = Transaction.query.filter_by(id=tx_id, plan_id=plan.id).first()
     if not tx:
         return jsonify({'success': False, 'error': 'Transaction not found'}), 404
 
     if payee_id:
-        payee = Payee.query.filter_by(id=payee_id, plan_id=current_user.active_plan.id).first()
+        payee = plan_payee(plan.id, payee_id)
         if not payee:
             return jsonify({'success': False, 'error': 'Payee not found'}), 404
         tx.payee_id = payee_id
@@ -952,13 +1269,33 @@ def set_transaction_payee(tx_id):
 
 
 # --------------------------- Transactions Page ---------------------------
+def month_activity_query(plan_id, year, month):
+    """Query for the sum of the plan's transaction amounts in one month (negative for spending)."""
+    return db.session.query(func.sum(Transaction.amount)).filter(
+        Transaction.plan_id == plan_id,
+        in_month(Transaction.transaction_date, year, month)
+    )
+
+
+def month_transactions_query(plan_id, year, month):
+    """Query for the plan's transactions in one month, newest first, with their category and payee."""
+    # The table shows each row's category and payee
+    return db.session.query(Transaction).options(
+        joinedload(Transaction.category), joinedload(Transaction.payee)
+    ).filter(
+        Transaction.plan_id == plan_id,
+        in_month(Transaction.transaction_date, year, month)
+    ).order_by(Transaction.transaction_date.desc())
+
+
 @views.route('/transactions/<int:year>/<int:month>')
 @views.route('/transactions')
 @login_required
+@conditional_get(html=True)
 def transactions(year=None, month=None):
     """Display the transactions summary page (placeholder until table implemented)."""
     # Ensure the user has an active plan
-    plan = current_user.active_plan
+    plan = active_plan()
     if not plan:
         flash("No active plan found.", 'error')
         return redirect(url_for('views.home'))
@@ -981,21 +1318,22 @@ def transactions(year=None, month=None):
 
     display_month_str = display_date.strftime('%B')
     
-    # Calculate month boundaries
-    start_of_month = datetime(year, month, 1)
-    end_of_month = start_of_month + timedelta(days=32)
-    end_of_month = datetime(end_of_month.year, end_of_month.month, 1)
+    # The balances and the transaction table are only queried when their rendered fragments aren't cached
+    transactions_fragment_key = fragment_key(plan, year, month, 'transactions')
+    fragments = cached_fragments(transactions_fragment_key, TRANSACTIONS_FRAGMENTS)
+    figures = {}
 
-    # Sum all transaction amounts for this plan in the current month (expenses are stored as negative)
-    activity_sum = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.plan_id == plan.id,
-        Transaction.transaction_date >= start_of_month,
-        Transaction.transaction_date < end_of_month
-    ).scalar() or 0.0
+    if fragments is None:
+        # Sum all transaction amounts for this plan in the current month (expenses are stored as negative)
+        activity_sum = month_activity_query(plan.id, year, month).scalar() or 0.0
 
-    activity_total = abs(activity_sum)  # Convert to positive value for display
+        activity_total = abs(activity_sum)  # Convert to positive value for display
 
-    available = monthly_allowance - activity_total
+        figures = dict(
+            activity_total=activity_total,
+            available=monthly_allowance - activity_total,
+            transactions=month_transactions_query(plan.id, year, month).all()
+        )
     
     # Navigation variables
     from dateutil.relativedelta import relativedelta
@@ -1010,15 +1348,10 @@ def transactions(year=None, month=None):
 
     return render_template(
         'transactions.html',
+        fragment_key=transactions_fragment_key,
+        fragments=fragments,
         monthly_allowance=monthly_allowance,
-        activity_total=activity_total,
-        available=available,
-        transactions=db.session.query(Transaction).filter(
-            Transaction.plan_id==plan.id,
-            Transaction.transaction_date>=start_of_month,
-            Transaction.transaction_date<end_of_month
-        ).order_by(Transaction.transaction_date.desc()).all(),
-        payees=[{'id': p.id, 'name': p.name} for p in plan.payees],
+        payees=[{'id': p.id, 'name': p.name} for p in plan_payees(plan.id)],
         # Month navigation data
         current_month=display_month_str,
         current_month_num=month,
@@ -1028,61 +1361,22 @@ def transactions(year=None, month=None):
         next_month=next_month_date.month,
         next_year=next_month_date.year,
         can_go_prev=can_go_prev,
-        can_go_next=can_go_next
+        can_go_next=can_go_next,
+        **figures
     )
 
 
 # --------------------------- Reflect Page ---------------------------
-@views.route('/reflect/<int:year>/<int:month>')
-@views.route('/reflect')
-@login_required
-def reflect(year=None, month=None):
-    plan = current_user.active_plan
-    if not plan:
-        flash("No active plan found.", 'error')
-        return redirect(url_for('views.home'))
+def reflect_figures(plan, year, month):
+    """Spending breakdown, trends and chart data for the reflect page (monthly rollups and one GROUP BY, see utils/analytics.py)."""
+    # Spending per category this month; none means the month has no data
+    category_rows = category_totals(plan.id, year, month)
     
-    # Determine the date to display
-    if year is None or month is None:
-        today = datetime.now()
-        year, month = today.year, today.month
-    
-    try:
-        display_date = datetime(year, month, 1)
-    except ValueError:
-        # Handle invalid month/year in URL
-        today = datetime.now()
-        year, month = today.year, today.month
-        display_date = datetime(year, month, 1)
-
-    display_month_str = display_date.strftime('%B')
-    
-    # Calculate month boundaries for filtering transactions
-    start_of_month = datetime(year, month, 1)
-    end_of_month = start_of_month + timedelta(days=32)
-    end_of_month = datetime(end_of_month.year, end_of_month.month, 1)
-    
-    # Get transactions for the selected month
-    transactions = db.session.query(Transaction).filter(
-        Transaction.plan_id == plan.id,
-        Transaction.transaction_date >= start_of_month,
-        Transaction.transaction_date < end_of_month
-    ).order_by(Transaction.transaction_date.desc()).all()
-    
-    # Get unique months with data
-    months_with_data = set()
-    for tx in transactions:
-        month_key = tx.transaction_date.strftime('%Y-%m')
-        months_with_data.add(month_key)
-    
-    sorted_months = sorted(list(months_with_data), reverse=True)
     month_options = []
-    for month_key in sorted_months:
-        year, month = month_key.split('-')
-        month_name = datetime(int(year), int(month), 1).strftime('%b %Y')
-        month_options.append({'value': month_key, 'display': month_name})
-    
-    current_month = sorted_months[0] if sorted_months else None
+    current_month = None
+    if category_rows:
+        current_month = f'{int(year):04d}-{int(month):02d}'
+        month_options.append({'value': current_month, 'display': datetime(int(year), int(month), 1).strftime('%b %Y')})
     
     # Calculate spending data and real statistics
     spending_data = []
@@ -1096,40 +1390,23 @@ def reflect(year=None, month=None):
     }
     
     if current_month:
-        year, month = current_month.split('-')
-        start_of_month = datetime(int(year), int(month), 1)
-        if int(month) == 12:
-            end_of_month = datetime(int(year) + 1, 1, 1)
-        else:
-            end_of_month = datetime(int(year), int(month) + 1, 1)
-        
-        month_transactions = db.session.query(Transaction).filter(
-            Transaction.plan_id == plan.id,
-            Transaction.transaction_date >= start_of_month,
-            Transaction.transaction_date < end_of_month
-        ).all()
-        
-        category_totals = {}
+        category_totals_by_name = {}
         main_category_totals = {'needs': 0, 'wants': 0, 'investments': 0}
         
-        for tx in month_transactions:
-            category_name = tx.category.name
-            main_cat = tx.category.main_category
-            amount = abs(tx.amount)
-            
-            if category_name not in category_totals:
-                category_totals[category_name] = {
+        for category_name, main_cat, amount in category_rows:
+            if category_name not in category_totals_by_name:
+                category_totals_by_name[category_name] = {
                     'amount': 0, 
                     'main_category': main_cat
                 }
-            category_totals[category_name]['amount'] += amount
+            category_totals_by_name[category_name]['amount'] += amount
             main_category_totals[main_cat] += amount
             total_spending += amount
         
         spending_data = [{
             'category': cat, 
             'amount': data['amount']
-        } for cat, data in category_totals.items()]
+        } for cat, data in category_totals_by_name.items()]
         
         # Colors for subcategories
         colors = [
@@ -1140,7 +1417,7 @@ def reflect(year=None, month=None):
         
         # Group spending by main category
         color_index = 0
-        for cat, data in category_totals.items():
+        for cat, data in category_totals_by_name.items():
             main_cat = data['main_category']
             percentage = (data['amount'] / total_spending * 100) if total_spending > 0 else 0
             
@@ -1153,7 +1430,7 @@ def reflect(year=None, month=None):
             color_index += 1
         
         # Calculate real summary statistics
-        months_used = len(sorted_months)
+        months_used = len(month_options)
         summary_stats['avg_monthly'] = total_spending / months_used if months_used > 0 else 0
         summary_stats['avg_daily'] = summary_stats['avg_monthly'] / 30
         
@@ -1163,11 +1440,7 @@ def reflect(year=None, month=None):
             summary_stats['most_frequent_category'] = most_frequent.title()
         
         # Largest transaction
-        all_transactions = db.session.query(Transaction).filter(
-            Transaction.plan_id == plan.id
-        ).all()
-        if all_transactions:
-            summary_stats['largest_transaction'] = max(abs(tx.amount) for tx in all_transactions)
+        summary_stats['largest_transaction'] = largest_transaction(plan.id)
         
         # Add trend direction
         summary_stats['trend_direction'] = '↗ Increasing' if total_spending > 1500 else '↘ Decreasing'
@@ -1175,95 +1448,81 @@ def reflect(year=None, month=None):
     
     # Calculate monthly breakdown for trends
     monthly_breakdown = []
-    daily_spending_data = []
-    daily_spending_by_category = {'needs': [], 'wants': [], 'investments': []}
-    
-    if sorted_months:
-        month_totals = {}
-        for month_key in sorted_months:
-            year, month = month_key.split('-')
-            start_of_month = datetime(int(year), int(month), 1)
-            if int(month) == 12:
-                end_of_month = datetime(int(year) + 1, 1, 1)
-            else:
-                end_of_month = datetime(int(year), int(month) + 1, 1)
-            
-            month_transactions = db.session.query(Transaction).filter(
-                Transaction.plan_id == plan.id,
-                Transaction.transaction_date >= start_of_month,
-                Transaction.transaction_date < end_of_month
-            ).all()
-            
-            month_total = sum(abs(tx.amount) for tx in month_transactions)
-            month_name = datetime(int(year), int(month), 1).strftime('%b %Y')
-            month_totals[month_key] = {'amount': month_total, 'name': month_name}
+    days_in_month = 0
+    series = {'total': [], 'by_main_category': {'needs': [], 'wants': [], 'investments': []}}
+    
+    if current_month:
+        # Read from the monthly rollups for the months listed
+        month_totals = monthly_totals(plan.id, (year, month), (year, month))
         
         # Calculate percentages
-        total_all_months = sum(data['amount'] for data in month_totals.values())
-        for month_key, data in month_totals.items():
-            percentage = (data['amount'] / total_all_months * 100) if total_all_months > 0 else 0
+        total_all_months = sum(month_totals.values())
+        for (total_year, total_month), amount in sorted(month_totals.items(), reverse=True):
+            percentage = (amount / total_all_months * 100) if total_all_months > 0 else 0
             monthly_breakdown.append({
-                'month_name': data['name'],
-                'amount': data['amount'],
+                'month_name': datetime(total_year, total_month, 1).strftime('%b %Y'),
+                'amount': amount,
                 'percentage': round(percentage, 1)
             })
     
     # Calculate real daily spending data for current month
     if current_month:
-        year, month = current_month.split('-')
-        start_of_month = datetime(int(year), int(month), 1)
-        if int(month) == 12:
-            end_of_month = datetime(int(year) + 1, 1, 1)
-        else:
-            end_of_month = datetime(int(year), int(month) + 1, 1)
-        
-        # Get all transactions for the current month
-        current_month_transactions = db.session.query(Transaction).filter(
-            Transaction.plan_id == plan.id,
-            Transaction.transaction_date >= start_of_month,
-            Transaction.transaction_date < end_of_month
-        ).all()
-        
-        # Group transactions by day
-        daily_totals = {}
-        for tx in current_month_transactions:
-            day_key = tx.transaction_date.day
-            if day_key not in daily_totals:
-                daily_totals[day_key] = 0
-            daily_totals[day_key] += abs(tx.amount)
-        
-        # Create daily spending data array
+        # All the daily series in one numpy pass over the month's per-day, per-main-category sums
         import calendar
         days_in_month = calendar.monthrange(int(year), int(month))[1]
-        for day in range(1, days_in_month + 1):
-            daily_spending_data.append({
-                'day': day,
-                'amount': daily_totals.get(day, 0)
-            })
-        
-        # Create category-filtered daily spending data
-        daily_spending_by_category = {'needs': [], 'wants': [], 'investments': []}
-        
-        for category in ['needs', 'wants', 'investments']:
-            category_daily_totals = {}
-            
-            # Filter transactions by category
-            category_transactions = [tx for tx in current_month_transactions 
-                                   if tx.category.main_category == category]
-            
-            # Group by day
-            for tx in category_transactions:
-                day_key = tx.transaction_date.day
-                if day_key not in category_daily_totals:
-                    category_daily_totals[day_key] = 0
-                category_daily_totals[day_key] += abs(tx.amount)
-            
-            # Create daily array for this category
-            for day in range(1, days_in_month + 1):
-                daily_spending_by_category[category].append({
-                    'day': day,
-                    'amount': category_daily_totals.get(day, 0)
-                })
+        series = daily_series(*daily_columns(plan.id, year, month), days_in_month)
+    
+    # Chart columns (see utils/columnar.py): the days once, delta-encoded, then one
+    # column per series the trends chart draws
+    daily_chart = {
+        'days': encode_column(range(1, days_in_month + 1), delta=True, decimals=0),
+        'total': encode_column(series['total']),
+        'by_main_category': {
+            category: encode_column(amounts) for category, amounts in series['by_main_category'].items()
+        }
+    }
+    
+    return dict(
+        month_options=month_options,
+        current_month=current_month,
+        spending_data=spending_data,
+        grouped_spending=grouped_spending,
+        total_spending=total_spending,
+        summary_stats=summary_stats,
+        monthly_breakdown=monthly_breakdown,
+        daily_chart=daily_chart
+    )
+
+
+@views.route('/reflect/<int:year>/<int:month>')
+@views.route('/reflect')
+@login_required
+@conditional_get(html=True)
+def reflect(year=None, month=None):
+    plan = active_plan()
+    if not plan:
+        flash("No active plan found.", 'error')
+        return redirect(url_for('views.home'))
+    
+    # Determine the date to display
+    if year is None or month is None:
+        today = datetime.now()
+        year, month = today.year, today.month
+    
+    try:
+        display_date = datetime(year, month, 1)
+    except ValueError:
+        # Handle invalid month/year in URL
+        today = datetime.now()
+        year, month = today.year, today.month
+        display_date = datetime(year, month, 1)
+
+    display_month_str = display_date.strftime('%B')
+    
+    # The breakdown, trends and chart data are only worked out when their rendered fragments aren't cached
+    reflect_fragment_key = fragment_key(plan, year, month, 'reflect')
+    fragments = cached_fragments(reflect_fragment_key, REFLECT_FRAGMENTS)
+    figures = reflect_figures(plan, year, month) if fragments is None else {}
     
     # Navigation variables
     from dateutil.relativedelta import relativedelta
@@ -1277,15 +1536,8 @@ def reflect(year=None, month=None):
     can_go_next = True  # Allow future months for analysis
     
     return render_template('reflect.html', 
-                         month_options=month_options,
-                         current_month=current_month,
-                         spending_data=spending_data,
-                         grouped_spending=grouped_spending,
-                         total_spending=total_spending,
-                         summary_stats=summary_stats,
-                         monthly_breakdown=monthly_breakdown,
-                         daily_spending_data=daily_spending_data,
-                         daily_spending_by_category=daily_spending_by_category,
+                         fragment_key=reflect_fragment_key,
+                         fragments=fragments,
                          # Month navigation data
                          current_month_display=display_month_str,
                          current_month_num=month,
@@ -1295,7 +1547,62 @@ def reflect(year=None, month=None):
                          next_month=next_month_date.month,
                          next_year=next_month_date.year,
                          can_go_prev=can_go_prev,
-                         can_go_next=can_go_next)
+                         can_go_next=can_go_next,
+                         **figures)
+
+
+
+@views.route('/api/analytics/trend', methods=['GET'])
+@login_required
+@conditional_get()
+def analytics_trend():
+    """
+    Spending over a date range as time series, read from the rollups.
+
+    Query parameters: from and to (inclusive YYYY-MM-DD dates), granularity
+    (day, week or month), group (main or category), max_points and encoding
+    (plain or delta, see utils/columnar.py). Ranges needing more than
+    max_points buckets come back downsampled; see analytics.trend_series()
+    for the response fields.
+    """
+    plan = active_plan()
+    if not plan:
+        return jsonify({'success': False, 'error': 'No active plan'}), 400
+
+    granularity = request.args.get('granularity', 'day')
+    group = request.args.get('group', 'main')
+    encoding = request.args.get('encoding', 'plain')
+    max_points = request.args.get('max_points', current_app.config.get('TREND_POINTS', 120), type=int)
+    try:
+        if not request.args.get('from') or not request.args.get('to'):
+            raise ValueError('from and to are required')
+        start = _parse_day(request.args['from'], 'from').date()
+        end = _parse_day(request.args['to'], 'to').date()
+        if end < start:
+            raise ValueError('to must not be before from')
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+        if group not in TREND_GROUPS:
+            raise ValueError(f"group must be one of {', '.join(TREND_GROUPS)}")
+        if max_points < 1:
+            raise ValueError('max_points must be a positive integer')
+        if encoding not in ENCODINGS:
+            raise ValueError(f"encoding must be one of {', '.join(ENCODINGS)}")
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    max_points = min(max_points, current_app.config.get('TREND_POINTS_MAX', 1000))
+
+    return jsonify({'success': True, **trend_series(plan.id, start, end, granularity, group, max_points,
+                                                    delta=encoding == 'delta')})
+
+def recent_ai_transactions_query(plan_id, limit=10):
+    """Query for the plan's latest Receipt AI transactions, with their category and payee."""
+    return Transaction.query.options(
+        joinedload(Transaction.category), joinedload(Transaction.payee)
+    ).filter(
+        Transaction.plan_id == plan_id,
+        Transaction.description.like('Receipt AI:%')
+    ).order_by(Transaction.created_date.desc()).limit(limit)
 
 
 @views.route('/receipt_ai')
@@ -1303,18 +1610,15 @@ def reflect(year=None, month=None):
 def receipt_ai():
     """Receipt AI page for uploading and processing receipt images"""
     # Get user's categories for the dropdown
-    plan = current_user.active_plan
+    plan = active_plan()
     categories = []
     ai_transactions = []
     
     if plan:
-        categories = BudgetCategory.query.filter_by(plan_id=plan.id).all()
+        categories = plan_categories(plan.id)
         
         # Get recent AI-created transactions (those with 'Receipt AI:' in description)
-        ai_transactions = Transaction.query.filter(
-            Transaction.plan_id == plan.id,
-            Transaction.description.like('Receipt AI:%')
-        ).order_by(Transaction.created_date.desc()).limit(10).all()
+        ai_transactions = recent_ai_transactions_query(plan.id).all()
     
     return render_template('receipt_ai.html', categories=categories, ai_transactions=ai_transactions)
 
@@ -1393,7 +1697,7 @@ def test_openai_api():
 def cleanup_orphaned_subcategories():
     """Clean up BudgetCategory records that exist in database but not in plan preferences"""
     try:
-        plan = current_user.active_plan
+        plan = active_plan()
         if not plan or not plan.budget_pref or 'subcategories' not in plan.budget_pref:
             return jsonify({'success': False, 'message': 'No plan or subcategories found'})
         
@@ -1404,7 +1708,7 @@ def cleanup_orphaned_subcategories():
                 valid_subcategories.add((main_category, subcat))
         
         # Find all BudgetCategory records for this plan
-        all_budget_categories = BudgetCategory.query.filter_by(plan_id=plan.id).all()
+        all_budget_categories = plan_categories(plan.id)
         
         orphaned_categories = []
         for category in all_budget_categories:
@@ -1415,11 +1719,14 @@ def cleanup_orphaned_subcategories():
         # Delete orphaned categories and their related data
         deleted_count = 0
         for category in orphaned_categories:
-            # Delete related MonthlyBudget records
+            # Delete related MonthlyBudget and rollup records
             MonthlyBudget.query.filter_by(category_id=category.id).delete()
+            MonthlyCategoryRollup.query.filter_by(category_id=category.id).delete()
+            DailyCategoryRollup.query.filter_by(category_id=category.id).delete()
             
             # Delete related Transaction records (or reassign them if preferred)
             Transaction.query.filter_by(category_id=category.id).delete()
+            bump_data_version(plan.id)  # bulk deletes skip the flush hooks
             
             # Delete the BudgetCategory itself
             db.session.delete(category)
@@ -1440,6 +1747,7 @@ def cleanup_orphaned_subcategories():
 
 @views.route('/api/receipt_ai/create_transaction', methods=['POST'])
 @login_required
+@idempotent
 def create_receipt_transaction():
     """Create a transaction from Receipt AI extracted data"""
     try:
@@ -1464,82 +1772,53 @@ def create_receipt_transaction():
             return jsonify({'success': False, 'message': 'Invalid date format'})
         
         # Get category
-        category = BudgetCategory.query.filter_by(
-            id=category_id, 
-            plan_id=current_user.active_plan.id
-        ).first()
+        plan = active_plan()
+        category = plan_category(plan.id, category_id)
         
         if not category:
             return jsonify({'success': False, 'message': 'Invalid category'})
         
-        # Validate budget limit using helper function
-        is_valid, error_message, validation_data = validate_budget_limit(category, amount, transaction_date)
-        
-        if not is_valid:
-            return jsonify({
-                'success': False, 
-                'message': f'Receipt transaction exceeds budget limit: {error_message}',
-                **validation_data
-            })
-        
         # Handle payee - use provided payee_id or create/find payee
         if payee_id:
             # Use the payee_id from AI analysis
-            payee = Payee.query.filter_by(
-                id=payee_id,
-                plan_id=current_user.active_plan.id
-            ).first()
+            payee = plan_payee(plan.id, payee_id)
             
             if not payee:
                 return jsonify({'success': False, 'message': 'Invalid payee ID'})
                 
         else:
             # Fallback: create or find payee by name (for manual entries)
-            payee = Payee.query.filter_by(
-                name=vendor_name,
-                plan_id=current_user.active_plan.id
-            ).first()
+            payee = next((p for p in plan_payees(plan.id) if p.name == vendor_name), None)
             
             if not payee:
                 payee = Payee(
                     name=vendor_name,
-                    plan_id=current_user.active_plan.id
+                    plan_id=plan.id
                 )
-                db.session.add(payee)
-                db.session.flush()  # Get the payee ID
-        
-        # Create transaction
-        new_transaction = Transaction(
-            amount=-abs(amount),  # Negative for expense
-            description=f'Receipt AI: {vendor_name}',
-            transaction_date=transaction_date,
-            category_id=category_id,
-            payee_id=payee.id,
-            plan_id=current_user.active_plan.id
-        )
         
-        db.session.add(new_transaction)
-        
-        # Update category spent amount accurately
-        spent = db.session.query(func.sum(func.abs(Transaction.amount))).filter_by(
-            category_id=category.id
-        ).scalar() or 0
-        category.spent_amount = spent
-        
-        db.session.commit()
+        response = {
+            'success': True, 
+            'message': f'Receipt transaction created: ฿{amount:.2f} at {vendor_name}',
+            'category_name': f'{category.main_category.title()} - {category.name}'
+        }
+
+        # Budget check, insert and counter updates in one unit of work, with the new payee if any
+        try:
+            result = record_transaction(plan, category, amount, f'Receipt AI: {vendor_name}', transaction_date,
+                                        payee=payee, source_type='receipt',
+                                        idempotency=pending_idempotency_key(response))
+        except BudgetExceeded as e:
+            return jsonify({
+                'success': False, 
+                'message': f'Receipt transaction exceeds budget limit: {e}',
+                **e.details
+            })
         
-        print(f"DEBUG: Receipt transaction created successfully - ID: {new_transaction.id}")
+        print(f"DEBUG: Receipt transaction created successfully - ID: {result['transaction_id']}")
         
         flash(f'Receipt transaction added successfully! ฿{amount:.2f} spent at {vendor_name} in "{category.name}" category', 'success')
         
-        return jsonify({
-            'success': True, 
-            'message': f'Receipt transaction created: ฿{amount:.2f} at {vendor_name}',
-            'transaction_id': new_transaction.id,
-            'category_name': f'{category.main_category.title()} - {category.name}',
-            'category_spent': category.spent_amount,
-            'category_available': category.assigned_amount - category.spent_amount
-        })
+        return jsonify({**response, **result})
         
     except Exception as e:
         db.session.rollback()
@@ -1892,7 +2171,7 @@ def get_existing_subcategories_for_ai(plan_id):
     try:
         from .models import BudgetCategory
         
-        categories = BudgetCategory.query.filter_by(plan_id=plan_id).all()
+        categories = plan_categories(plan_id)
         
         organized = {
             'Needs': [],
@@ -2028,7 +2307,7 @@ def fallback_receipt_analysis():
 @login_required
 def add_category():
     """Add a new category to the current plan with comprehensive validation."""
-    plan = current_user.active_plan
+    plan = active_plan()
     if not plan:
         flash("No active plan found.", 'error')
         return redirect(url_for('views.home'))
@@ -2099,6 +2378,7 @@ def add_category():
             if category_name not in plan.budget_pref['subcategories'][pref_category]:
                 plan.budget_pref['subcategories'][pref_category].append(category_name)
                 flag_modified(plan, 'budget_pref')
+                plan.bump_pref_version()
         
         db.session.commit()
         flash(f"Category '{category_name}' added successfully to {main_category.title()}! You can assign a budget amount in Plan Settings.", 'success')
@@ -2127,7 +2407,7 @@ def switch_plan(plan_id):
 @login_required
 def plan_settings():
     """Display and handle updates for the plan settings page."""
-    plan = current_user.active_plan
+    plan = active_plan()
     if not plan:
         flash("No active plan found.", 'error')
         return redirect(url_for('views.home'))
@@ -2136,6 +2416,7 @@ def plan_settings():
         # Ensure subcategories structure exists
         if 'subcategories' not in plan.budget_pref:
             plan.budget_pref['subcategories'] = {'needs': [], 'wants': [], 'savings': []}
+            plan.bump_pref_version()
 
         # Check which form was submitted
         if 'update_plan_name' in request.form:
@@ -2183,6 +2464,22 @@ def plan_settings():
                 print(f"Debug - Exception in ratio conversion: {e}")
                 flash("Invalid ratio value. Please enter whole numbers only.", 'error')
 
+        elif 'update_duplicate_check' in request.form:
+            try:
+                window_hours = int(request.form.get('duplicate_window_hours', '').strip())
+            except ValueError:
+                window_hours = -1
+            if not 0 <= window_hours <= 168:
+                flash("The duplicate window must be a whole number of hours from 0 to 168.", 'error')
+            else:
+                plan.budget_pref['duplicate_check'] = {
+                    'window_hours': window_hours,
+                    'match_payee': 'duplicate_match_payee' in request.form
+                }
+                flag_modified(plan, 'budget_pref')
+                db.session.commit()
+                flash("Duplicate detection updated successfully!", 'success')
+
 
 
         elif 'add_subcategory' in request.form:
@@ -2218,6 +2515,7 @@ def plan_settings():
                 # Add to plan preferences
                 plan.budget_pref['subcategories'][category].append(new_subcat)
                 flag_modified(plan, 'budget_pref')
+                plan.bump_pref_version()  # rebuilds the cached category-visibility index
                 
                 # Also create the actual BudgetCategory record in database
                 # Handle naming inconsistency: "savings" in plan preferences vs "investments" in database
@@ -2242,6 +2540,7 @@ def plan_settings():
                     # Remove from plan preferences
                     plan.budget_pref['subcategories'][category].remove(subcat_to_delete)
                     flag_modified(plan, 'budget_pref')
+                    plan.bump_pref_version()  # rebuilds the cached category-visibility index
                     
                     # Also delete the actual BudgetCategory record from database
                     budget_category = BudgetCategory.query.filter_by(
@@ -2251,21 +2550,27 @@ def plan_settings():
                     ).first()
                     
                     if budget_category:
-                        # Delete related MonthlyBudget records first
+                        # Delete related MonthlyBudget and rollup records first
                         MonthlyBudget.query.filter_by(category_id=budget_category.id).delete()
+                        MonthlyCategoryRollup.query.filter_by(category_id=budget_category.id).delete()
+                        DailyCategoryRollup.query.filter_by(category_id=budget_category.id).delete()
                         
                         # Delete related Transaction records (or you might want to reassign them)
                         Transaction.query.filter_by(category_id=budget_category.id).delete()
+                        bump_data_version(plan.id)  # bulk deletes skip the flush hooks
                         
                         # Delete the BudgetCategory itself
                         db.session.delete(budget_category)
+                        invalidate_request_cache()
                     
+                    # The removed subcategory's spending no longer counts, so rebuild the whole ledger
+                    recompute_rollovers_from(plan, *ledger_start(plan))
                     db.session.commit()
                     flash(f"Removed subcategory '{subcat_to_delete}' and all associated data.", 'success')
         
         return redirect(url_for('views.plan_settings'))
 
-    return render_template('plan_settings.html', plan=plan)
+    return render_template('plan_settings.html', plan=plan, duplicate_rules=duplicate_rules(plan))
 
 @views.route('/display-settings', methods=['GET', 'POST'])
 @login_required
@@ -2369,7 +2674,7 @@ def update_budget_form():
         flash('Assigned amount cannot be negative.', 'error')
         return redirect(url_for('views.home'))
 
-    plan = current_user.active_plan
+    plan = active_plan()
     if not plan:
         flash('No active plan found.', 'error')
         return redirect(url_for('views.home'))
@@ -2396,14 +2701,12 @@ def update_budget_form():
     current_total_others = 0
     current_category_amount = 0
     
-    for c in plan.categories:
+    # Load every MonthlyBudget for the target month at once
+    snapshot = load_month_snapshot(plan.id, target_year, target_month)
+
+    for c in plan_categories(plan.id):
         if c.main_category.lower() == main_cat_name:
-            mb = MonthlyBudget.query.filter_by(
-                plan_id=plan.id, 
-                category_id=c.id, 
-                month=target_month, 
-                year=target_year
-            ).first()
+            mb = snapshot.budget(c.id)
             if mb:
                 if c.id == category_id:
                     current_category_amount = mb.assigned_amount
@@ -2430,12 +2733,7 @@ def update_budget_form():
         return redirect(url_for('views.home'))
     
     # Update the budget
-    mb = MonthlyBudget.query.filter_by(
-        plan_id=plan.id, 
-        category_id=category_id, 
-        month=target_month, 
-        year=target_year
-    ).first()
+    mb = snapshot.budget(category_id)
     
     if mb:
         mb.assigned_amount = new_amount
@@ -2459,7 +2757,7 @@ def update_budget_form():
 @login_required
 def add_income():
     """Add unexpected income and distribute it according to budget ratios"""
-    plan = current_user.active_plan
+    plan = active_plan()
     if not plan:
         flash('No active plan found.', 'error')
         return redirect(url_for('views.home'))
@@ -2494,9 +2792,10 @@ def add_income():
     savings_amount = amount * savings_ratio
     
     # Get main categories for each type
-    needs_categories = [c for c in plan.categories if c.main_category.lower() == 'needs']
-    wants_categories = [c for c in plan.categories if c.main_category.lower() == 'wants']
-    investments_categories = [c for c in plan.categories if c.main_category.lower() == 'investments']
+    categories = plan_categories(plan.id)
+    needs_categories = [c for c in categories if c.main_category.lower() == 'needs']
+    wants_categories = [c for c in categories if c.main_category.lower() == 'wants']
+    investments_categories = [c for c in categories if c.main_category.lower() == 'investments']
     
     # Distribute to categories (evenly within each main category)
     def distribute_to_categories(categories, total_amount):
@@ -2507,12 +2806,7 @@ def add_income():
         
         for category in categories:
             # Get or create MonthlyBudget record
-            mb = MonthlyBudget.query.filter_by(
-                plan_id=plan.id,
-                category_id=category.id,
-                month=month,
-                year=year
-            ).first()
+            mb = budget_row_query(plan.id, category.id, year, month).first()
             
             if mb:
                 mb.assigned_amount += amount_per_category
@@ -2537,6 +2831,7 @@ def add_income():
         description=description
     )
     db.session.add(additional_income)
+    recompute_rollovers_from(plan, year, month)
     
     db.session.commit()
     